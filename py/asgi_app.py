@@ -0,0 +1,448 @@
+"""ASGI version of the scoring service (Starlette + uvicorn).
+
+    pip install starlette uvicorn
+    uvicorn asgi_app:create_asgi_app --factory --host 0.0.0.0 --port 7000
+
+It has the same JSON contract as the Flask routes in ml_model_api.py, but
+a request no longer holds a worker thread while it waits on slow I/O:
+
+* the PowerShell inventory and the compare_controls.py subprocess
+  (IEPIS_COMPARE_MODE=subprocess) are asyncio subprocesses
+* the refine and classify GPT calls go through gpt_async.AsyncGPTClient,
+  so they respect its concurrency and rate limits
+* audit log parsing, the policy comparison, encoding and prediction run on
+  a bounded thread pool of IEPIS_ASGI_CPU_WORKERS threads
+
+Each stage has a timeout (IEPIS_TIMEOUT_INVENTORY / _GPT / _COMPARE /
+_COMPUTE). An inventory or GPT stage that times out falls back exactly as
+an error would (Medium risk). When the client disconnects, its request is
+cancelled: subprocesses are killed and GPT calls are no longer awaited,
+although a shared in-flight call still completes and fills the cache.
+Work that is already running on the thread pool finishes, because threads
+cannot be interrupted.
+
+Routes: /healthz, /readyz, /metrics, /api/evaluate, /api/evaluate_batch,
+/api/fleet/rollup. The other endpoints are only served by the Flask app.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_IMPORT_STARTED = time.perf_counter()
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import metrics
+from compare_controls import (
+    INVENTORY_MAX_AGE,
+    RISK_FALLBACKS,
+    SOFTWARE_LIST,
+    SystemRisk,
+    compare_with_policy,
+    parse_audit_log,
+    risk_from_label
+)
+from fleet_rollup import TIERS, FleetRollup
+from gpt_async import AsyncGPTClient, classify_risk_async, refine_user_software_async
+from log_config import setup_logging
+from ml_model_api import (
+    HTTP_REQUESTS,
+    HTTP_SECONDS,
+    TOTAL_CONTROLS,
+    ModelNotReady,
+    ModelState,
+    calculate_final_score,
+    default_config,
+    evaluate_batch,
+    parse_compare_output,
+    predict_ml_risk,
+    snapshots_from_store,
+    update_rollup,
+    valid_chunk_size
+)
+from risk_assisment_modified import INVENTORY_ERROR, PS, PS_SCRIPT, inventory_is_fresh
+
+log = logging.getLogger("iepis.asgi")
+
+ASGI_CPU_WORKERS = int(os.getenv("IEPIS_ASGI_CPU_WORKERS", str(os.cpu_count() or 1)))
+TIMEOUT_INVENTORY = float(os.getenv("IEPIS_TIMEOUT_INVENTORY", "60"))
+TIMEOUT_GPT = float(os.getenv("IEPIS_TIMEOUT_GPT", "60"))
+TIMEOUT_COMPARE = float(os.getenv("IEPIS_TIMEOUT_COMPARE", "120"))
+TIMEOUT_COMPUTE = float(os.getenv("IEPIS_TIMEOUT_COMPUTE", "30"))
+
+STAGE_TIMEOUTS = metrics.counter("iepis_stage_timeouts_total", "Stages that hit their timeout", ("stage",))
+DISCONNECTS = metrics.counter("iepis_client_disconnects_total", "Requests cancelled because the client went away",
+                              ("route",))
+
+
+def asgi_config():
+    return {
+        **default_config(),
+        "ASGI_CPU_WORKERS": ASGI_CPU_WORKERS,
+        "TIMEOUT_INVENTORY": TIMEOUT_INVENTORY,
+        "TIMEOUT_GPT": TIMEOUT_GPT,
+        "TIMEOUT_COMPARE": TIMEOUT_COMPARE,
+        "TIMEOUT_COMPUTE": TIMEOUT_COMPUTE,
+    }
+
+
+class StageTimeout(Exception):
+    def __init__(self, stage, seconds):
+        super().__init__(f"{stage} stage exceeded {seconds:g}s")
+        self.stage = stage
+
+
+async def run_process(args, cwd=None):
+    """stdout of a subprocess; it is killed if the caller is cancelled or times out"""
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, cwd=cwd
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+        raise
+    if process.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(args[0])} failed: {stderr.decode(errors='replace').strip()}")
+    return stdout.decode("utf-8", errors="replace")
+
+
+def compliance_fallback():
+    return {
+        "system_risk": "Medium",
+        "mismatches": [],
+        "parsed_settings": {}
+    }
+
+
+# === Pipeline ===
+class AsyncService:
+    """Model state, GPT client and CPU pool shared by the async routes"""
+
+    def __init__(self, config, gpt_client=None):
+        self.config = config
+        self.state = ModelState(config)
+        self.rollup = FleetRollup()
+        self.cpu = ThreadPoolExecutor(config["ASGI_CPU_WORKERS"], thread_name_prefix="iepis-cpu")
+        self.gpt = gpt_client
+        self._inventory_lock = None
+
+    def start(self):
+        # Created here so their asyncio primitives belong to the server's loop
+        self.gpt = self.gpt or AsyncGPTClient()
+        self._inventory_lock = asyncio.Lock()
+        self.state.start()
+
+    def close(self):
+        self.cpu.shutdown(wait=False, cancel_futures=True)
+        if self.state.active is not None:
+            self.state.active.close()
+
+    async def timed(self, stage, awaitable, timeout):
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            STAGE_TIMEOUTS.labels(stage).inc()
+            raise StageTimeout(stage, timeout)
+
+    async def run_cpu(self, stage, fn, *args):
+        """Run fn on the bounded CPU pool with the compute timeout"""
+        future = asyncio.get_running_loop().run_in_executor(self.cpu, fn, *args)
+        return await self.timed(stage, future, self.config["TIMEOUT_COMPUTE"])
+
+    async def ready_model(self):
+        if self.state.status == "ready":
+            return self.state.wait(0)
+        # Still loading: wait without blocking the event loop or the CPU pool
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.state.wait, self.config["READY_TIMEOUT"])
+
+    async def save_inventory(self, path, max_age=INVENTORY_MAX_AGE):
+        """Async save_installed_software_to_file; one PowerShell run at a time"""
+        async with self._inventory_lock:
+            if inventory_is_fresh(path, max_age):
+                return
+            try:
+                out = await self.timed("inventory", run_process([PS, "-Command", PS_SCRIPT]),
+                                       self.config["TIMEOUT_INVENTORY"])
+                lines = [ln.strip() for ln in out.splitlines() if ln.strip()]
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write("\n".join(lines))
+                log.info("✅ Saved %d entries → %s", len(lines), path)
+            except Exception as e:
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(INVENTORY_ERROR)
+                log.error("❌ PowerShell error: %s", e)
+
+    async def system_risk(self):
+        """Async compare_controls.get_system_risk_level"""
+        try:
+            await self.save_inventory(SOFTWARE_LIST)
+            with open(SOFTWARE_LIST, "r", encoding="utf-8") as f:
+                raw = f.read()
+            timeout = self.config["TIMEOUT_GPT"]
+            refined = await self.timed("gpt_refine", refine_user_software_async(raw, self.gpt), timeout)
+            label = await self.timed("gpt_classify", classify_risk_async(refined, self.gpt), timeout)
+        except Exception as e:
+            RISK_FALLBACKS.labels("gpt_error").inc()
+            log.warning("Could not get system risk assessment: %s", e)
+            return SystemRisk("Medium", fallback=True, detail=str(e))
+        return risk_from_label(label)
+
+    async def system_risk_and_mismatches(self):
+        """Async ml_model_api.get_system_risk_and_mismatches"""
+        try:
+            if self.config["COMPARE_MODE"] == "subprocess":
+                output = await self.timed("compare", run_process(["python", "compare_controls.py"], os.getcwd()),
+                                          self.config["TIMEOUT_COMPARE"])
+                return parse_compare_output(output)
+            system_risk = await self.system_risk()
+            actual_settings = await self.run_cpu("audit_parse", parse_audit_log)
+            mismatches = await self.run_cpu("policy", compare_with_policy, actual_settings, system_risk.level)
+            return {
+                "system_risk": system_risk.level,
+                "mismatches": [m.to_dict() for m in mismatches],
+                "parsed_settings": actual_settings
+            }
+        except Exception as e:
+            RISK_FALLBACKS.labels("compliance_error").inc()
+            log.warning("⚠️ Could not evaluate system compliance: %s", e)
+            return compliance_fallback()
+
+    async def evaluate(self):
+        """The /api/evaluate pipeline; returns (body, status)"""
+        loaded = await self.ready_model()
+
+        # Step 1: Get system risk and mismatches
+        system_data = await self.system_risk_and_mismatches()
+        system_risk = system_data.get("system_risk", "Medium")
+        system_mismatches = system_data.get("mismatches", [])
+        log.info("📊 System Risk Level: %s", system_risk)
+        log.info("📊 System Mismatches: %d", len(system_mismatches))
+
+        # Step 2: Load control data for ML prediction
+        json_path = self.config["CONTROLS_FILE"]
+        if not os.path.exists(json_path):
+            return {
+                "error": "Controls file not found",
+                "detail": f"File not found: {json_path}"
+            }, 404
+
+        def predict():
+            with open(json_path, "r") as f:
+                return predict_ml_risk(loaded, json.load(f))
+
+        # Step 3 + 4: Build ML model input and predict ML risk
+        ml_risk = await self.run_cpu("predict", predict)
+        log.info("🤖 Predicted ML Risk: %s", ml_risk)
+
+        # Step 5: Calculate final score
+        final_score = calculate_final_score(system_risk, ml_risk, len(system_mismatches), TOTAL_CONTROLS)
+        log.info("📈 Final Score: %s", final_score)
+        return {
+            "system_risk": system_risk,
+            "ml_risk": ml_risk,
+            "mismatches": system_mismatches,
+            "final_score": final_score,
+            "total_controls": TOTAL_CONTROLS,
+            "compliant_controls": TOTAL_CONTROLS - len(system_mismatches)
+        }, 200
+
+
+# === Request handling ===
+async def until_disconnect(request, awaitable, route):
+    """Await awaitable, cancelling it if the client disconnects first.
+
+    Returns its result, or None after a disconnect. The request body must
+    already have been read.
+    """
+    task = asyncio.ensure_future(awaitable)
+
+    async def watch():
+        while (await request.receive())["type"] != "http.disconnect":
+            pass
+
+    watcher = asyncio.ensure_future(watch())
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if task.done():
+        return task.result()
+    task.cancel()
+    DISCONNECTS.labels(route).inc()
+    log.info("🔌 Client went away, cancelled %s", route)
+    with contextlib.suppress(asyncio.CancelledError):
+        await task  # let subprocesses be killed before returning
+    return None
+
+
+def endpoint(path, handler, methods=("GET",)):
+    """Route whose requests are counted like the Flask app's"""
+    async def timed(request):
+        started = time.perf_counter()
+        response = await handler(request)
+        HTTP_SECONDS.labels(path).observe(time.perf_counter() - started)
+        HTTP_REQUESTS.labels(path, str(response.status_code)).inc()
+        return response
+
+    return Route(path, timed, methods=list(methods))
+
+
+def not_ready_response(e):
+    return JSONResponse({
+        "error": "Model not ready",
+        "detail": str(e)
+    }, status_code=503)
+
+
+def timeout_response(e):
+    return JSONResponse({
+        "error": "Evaluation timed out",
+        "detail": str(e)
+    }, status_code=504)
+
+
+async def healthz(request):
+    return JSONResponse({"status": "ok"})
+
+
+async def readyz(request):
+    state = request.app.state.service.state
+    info = state.info()
+    info["import_to_ready_seconds"] = state.ready_at - _IMPORT_STARTED if state.ready_at else None
+    return JSONResponse(info, status_code=200 if state.status == "ready" else 503)
+
+
+async def metrics_endpoint(request):
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+async def evaluate(request):
+    service = request.app.state.service
+    try:
+        log.info("🔄 API HIT: /api/evaluate")
+        result = await until_disconnect(request, service.evaluate(), "/api/evaluate")
+        if result is None:
+            return Response(status_code=499)
+        body, status = result
+        return JSONResponse(body, status_code=status)
+
+    except ModelNotReady as e:
+        return not_ready_response(e)
+    except StageTimeout as e:
+        return timeout_response(e)
+    except Exception as e:
+        log.exception("Request failed")
+        return JSONResponse({
+            "error": "Evaluation failed",
+            "detail": str(e)
+        }, status_code=500)
+
+
+async def evaluate_batch_endpoint(request):
+    service = request.app.state.service
+    try:
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        body = body if isinstance(body, dict) else {}
+        snapshots = body.get("snapshots")
+        if snapshots is None and "devices" in body:
+            snapshots = await service.run_cpu("store", snapshots_from_store, body["devices"], body.get("system_risk"))
+        if not isinstance(snapshots, list):
+            return JSONResponse({
+                "error": "Invalid request",
+                "detail": "Body must contain a 'snapshots' list or a 'devices' list"
+            }, status_code=400)
+        if not valid_chunk_size(body.get("chunk_size")):
+            return JSONResponse({
+                "error": "Invalid request",
+                "detail": "chunk_size must be a positive integer"
+            }, status_code=400)
+
+        log.info("🔄 API HIT: /api/evaluate_batch (%d snapshots)", len(snapshots))
+
+        async def score():
+            loaded = await service.ready_model()
+            return await service.run_cpu("batch", evaluate_batch, loaded, snapshots, body.get("chunk_size"))
+
+        results = await until_disconnect(request, score(), "/api/evaluate_batch")
+        if results is None:
+            return Response(status_code=499)
+        update_rollup(service.rollup, snapshots, results)
+        return JSONResponse({
+            "results": results,
+            "total": len(results),
+            "failed": sum(1 for r in results if "error" in r)
+        })
+
+    except ModelNotReady as e:
+        return not_ready_response(e)
+    except StageTimeout as e:
+        return timeout_response(e)
+    except Exception as e:
+        log.exception("Request failed")
+        return JSONResponse({
+            "error": "Batch evaluation failed",
+            "detail": str(e)
+        }, status_code=500)
+
+
+async def fleet_rollup_endpoint(request):
+    rollup = request.app.state.service.rollup
+    # Like Flask's request.args.get("last", 24, type=int): a bad value means the default
+    try:
+        last = int(request.query_params.get("last", 24))
+    except ValueError:
+        last = 24
+    if last < 1:
+        return JSONResponse({
+            "error": "Invalid request",
+            "detail": "last must be a positive number of trend buckets"
+        }, status_code=400)
+    tier = request.query_params.get("tier")
+    if tier is None:
+        return JSONResponse(rollup.summary(last))
+    if tier not in TIERS:
+        return JSONResponse({
+            "error": "Invalid request",
+            "detail": f"tier must be one of {', '.join(TIERS)}"
+        }, status_code=400)
+    return JSONResponse(rollup.tier_summary(tier))
+
+
+def create_asgi_app(config=None, gpt_client=None):
+    """Build the Starlette app; config overrides asgi_config() keys"""
+    setup_logging()
+    service = AsyncService({**asgi_config(), **(config or {})}, gpt_client)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        service.start()
+        yield
+        service.close()
+
+    app = Starlette(routes=[
+        endpoint("/healthz", healthz),
+        endpoint("/readyz", readyz),
+        endpoint("/metrics", metrics_endpoint),
+        endpoint("/api/evaluate", evaluate, methods=("POST",)),
+        endpoint("/api/evaluate_batch", evaluate_batch_endpoint, methods=("POST",)),
+        endpoint("/api/fleet/rollup", fleet_rollup_endpoint),
+    ], lifespan=lifespan)
+    app.state.service = service
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(create_asgi_app(), host="0.0.0.0", port=7000)
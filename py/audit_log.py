@@ -0,0 +1,177 @@
+"""Segmented security audit log.
+
+The log is the fixed-width text format written by ``Research1.py``::
+
+    2025-06-30 02:09:11 DESKTOP-1      GuestUser           Disabled       Disabled       Yes
+
+``AuditLogWriter`` buffers one collection run and appends it with a single
+write. Before the write it rotates the active segment once it is larger
+than ``max_bytes`` or older than ``max_age`` seconds; rotated segments are
+gzip-compressed next to it as ``security_audit_log.<YYYYmmdd-HHMMSS>.txt.gz``.
+
+``read_latest_block`` seeks backwards from the end of the active segment
+in fixed-size blocks and stops as soon as the newest timestamp block is
+complete, so parse time does not depend on how many runs the log holds.
+"""
+import datetime
+import glob
+import gzip
+import os
+import shutil
+
+LOG_DIR = os.getenv("IEPIS_LOG_DIR", r"C:\SecurityDataset")
+LOG_NAME = "security_audit_log.txt"
+DEFAULT_LOG_PATH = os.path.join(LOG_DIR, LOG_NAME)
+CONTROLS_PATH = os.path.join(LOG_DIR, "latest_controls.json")
+
+MAX_SEGMENT_BYTES = int(os.getenv("IEPIS_AUDIT_MAX_BYTES", str(10 * 1024 * 1024)))
+MAX_SEGMENT_AGE = float(os.getenv("IEPIS_AUDIT_MAX_AGE", str(7 * 24 * 3600)))
+BLOCK_SIZE = 64 * 1024
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def format_line(timestamp, device, setting, actual, ideal, compliant):
+    return f"{timestamp:<19} {device:<14} {setting:<19} {actual:<14} {ideal:<14} {compliant:<10}\n"
+
+
+def parse_line(line):
+    """Split a log line into (timestamp, device, setting, actual, ideal, compliant)
+
+    Returns None for headers and incomplete lines.
+    """
+    if not line or line.startswith("==="):
+        return None
+    parts = line.split()
+    if len(parts) < 7:  # Need at least 7 parts for complete log entry
+        return None
+    return (f"{parts[0]} {parts[1]}", parts[2], parts[3], parts[4], parts[5], parts[6])
+
+
+class AuditLogWriter:
+    """Buffers audit lines for one run and flushes them in a single write"""
+
+    def __init__(self, path=DEFAULT_LOG_PATH, max_bytes=MAX_SEGMENT_BYTES,
+                 max_age=MAX_SEGMENT_AGE, compress=True):
+        self.path = path
+        self.max_bytes, self.max_age, self.compress = max_bytes, max_age, compress
+        self.lines = []
+
+    def add(self, timestamp, device, setting, actual, ideal, compliant):
+        self.lines.append(format_line(timestamp, device, setting, actual, ideal, compliant))
+
+    def flush(self):
+        if not self.lines:
+            return
+        if self._should_rotate():
+            self.rotate()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(self.lines))
+        self.lines = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def _should_rotate(self):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return False
+        if size == 0:
+            return False
+        if self.max_bytes and size >= self.max_bytes:
+            return True
+        if self.max_age:
+            started = segment_start_time(self.path)
+            return started is not None and (datetime.datetime.now() - started).total_seconds() >= self.max_age
+        return False
+
+    def rotate(self):
+        """Move the active segment aside (compressed) and start a new one"""
+        base, ext = os.path.splitext(self.path)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        rotated = f"{base}.{stamp}{ext}"
+        n = 1
+        while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):
+            rotated = f"{base}.{stamp}-{n}{ext}"
+            n += 1
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+
+
+def segment_start_time(path):
+    """Timestamp of the first entry in a segment, or None"""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            entry = parse_line(line.strip())
+            if entry:
+                try:
+                    return datetime.datetime.strptime(entry[0], TIMESTAMP_FORMAT)
+                except ValueError:
+                    return None
+    return None
+
+
+def rotated_segments(path=DEFAULT_LOG_PATH):
+    """Rotated segments of the log, oldest first"""
+    base, ext = os.path.splitext(path)
+    return sorted(glob.glob(f"{glob.escape(base)}.*{ext}*"), key=os.path.getmtime)
+
+
+def iter_lines_reversed(f, block_size=BLOCK_SIZE):
+    """Yield the lines of a binary file from last to first"""
+    f.seek(0, os.SEEK_END)
+    pos = f.tell()
+    tail = b""
+    while pos > 0:
+        step = min(block_size, pos)
+        pos -= step
+        f.seek(pos)
+        lines = (f.read(step) + tail).split(b"\n")
+        tail = lines.pop(0)  # possibly cut by the block boundary
+        for line in reversed(lines):
+            yield line
+    yield tail
+
+
+def latest_block(lines_newest_first):
+    """Collect the entries sharing the newest timestamp, in file order"""
+    latest_timestamp = None
+    entries = []
+    for raw in lines_newest_first:
+        line = (raw.decode("utf-8", errors="replace") if isinstance(raw, bytes) else raw).strip()
+        entry = parse_line(line)
+        if entry is None:
+            continue
+        if latest_timestamp is None:
+            latest_timestamp = entry[0]
+        if entry[0] != latest_timestamp:
+            break  # We've found all entries for the latest timestamp
+        entries.append(entry)
+    entries.reverse()
+    return entries
+
+
+def read_latest_block(path=DEFAULT_LOG_PATH, block_size=BLOCK_SIZE):
+    """Return the newest timestamp block as a list of parsed entries.
+
+    Falls back to the newest rotated segment when the active one is empty.
+    """
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            entries = latest_block(iter_lines_reversed(f, block_size))
+        if entries:
+            return entries
+    for segment in reversed(rotated_segments(path)):
+        opener = gzip.open if segment.endswith(".gz") else open
+        with opener(segment, "rb") as f:
+            entries = latest_block(reversed(f.read().split(b"\n")))
+        if entries:
+            return entries
+    return []
@@ -0,0 +1,230 @@
+"""Change-driven background re-evaluation.
+
+``BackgroundEvaluator`` keeps one precomputed evaluation of this machine
+and serves it from memory, so GET /api/evaluation never runs GPT or the
+model. A thread waits for changes to the controls file, the audit log and
+the software inventory (inotify on Linux, polling elsewhere, see
+file_watch.py), or for IEPIS_REEVAL_INTERVAL seconds, and then:
+
+* fingerprints its inputs: the software inventory, the parsed audit log
+  settings and latest_controls.json (sha256 of their content, so a file
+  rewritten with the same content counts as unchanged)
+* reruns only the stages whose inputs changed:
+
+  ==============  ==========================================
+  system_risk     inventory changed (GPT refine + classify)
+  policy          settings or system risk changed
+  predict         controls or model version changed
+  score           any of the above
+  ==============  ==========================================
+
+* publishes a new immutable ``EvaluationSnapshot``: the JSON body already
+  serialized, plus a strong ETag. Readers take the reference and send it.
+
+The PowerShell inventory itself is only rerun at startup, on the interval
+tick and on ``refresh(force=True)``; the watcher event caused by that
+write is ignored, so a run never triggers the next one. A Medium fallback
+from a failed GPT call is never kept, so the next run asks again.
+``refresh(force=True)`` reruns every stage.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from audit_log import CONTROLS_PATH, DEFAULT_LOG_PATH
+from compare_controls import (
+    INVENTORY_MAX_AGE,
+    SOFTWARE_LIST,
+    compare_with_policy,
+    parse_audit_log,
+    save_installed_software_to_file,
+    system_risk_from_inventory
+)
+from file_watch import file_signature, make_watcher
+from metrics import callback, counter
+
+log = logging.getLogger("iepis.reeval")
+
+# Re-check this often even when no file changed (inventory refresh, GPT retries)
+REEVAL_INTERVAL = float(os.getenv("IEPIS_REEVAL_INTERVAL", "300"))
+
+REEVAL_RUNS = counter("iepis_reeval_runs_total", "Background re-evaluations by trigger", ("trigger",))
+REEVAL_STAGES = counter("iepis_reeval_stages_total", "Re-evaluation stages recomputed or skipped",
+                        ("stage", "outcome"))
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _read_bytes(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+@dataclass(frozen=True)
+class EvaluationSnapshot:
+    """One published evaluation; body is the serialized JSON response"""
+    body: bytes
+    etag: str
+    computed_at: float
+
+
+class BackgroundEvaluator:
+    """Recomputes the evaluation when its inputs change and keeps the latest result.
+
+    predict(loaded, controls) returns the ML risk label; score(system_risk,
+    ml_risk, mismatch_count) returns the final score fields. state is the
+    app's ModelState.
+    """
+
+    def __init__(self, state, predict, score, interval=REEVAL_INTERVAL, controls_path=CONTROLS_PATH,
+                 audit_log_path=DEFAULT_LOG_PATH, software_list=SOFTWARE_LIST, ready_timeout=None):
+        self.state = state
+        self.predict = predict
+        self.score = score
+        self.interval = interval
+        self.controls_path = controls_path
+        self.software_list = software_list
+        self.paths = [controls_path, audit_log_path, software_list]
+        self._own_inventory = None  # signature of the software list as this class last wrote it
+        self.ready_timeout = ready_timeout
+        self.snapshot = None
+        self.last_error = None
+        self.watcher = None
+        self._memo = {}  # stage -> (input key, output)
+        self._requested = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._pid = None
+        state.listeners.append(lambda version: self.request("model"))
+        callback("iepis_reeval_snapshot_age_seconds", "Seconds since the published evaluation was computed",
+                 lambda: time.time() - self.snapshot.computed_at if self.snapshot else float("nan"))
+
+    # === Thread ===
+    def start(self):
+        if self._pid is not None:
+            # Forked child: the parent's refresh may have held the lock at fork time
+            self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.watcher = make_watcher(self.paths)
+        threading.Thread(target=self._run, args=(self._pid,), name="reeval", daemon=True).start()
+        log.info("👀 Background evaluation watching %s (%s, every %ss)",
+                 ", ".join(self.paths), self.watcher.kind, self.interval)
+
+    def ensure_running(self):
+        # Threads don't survive fork: a worker restarts its own watcher thread
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self.start()
+
+    def request(self, trigger):
+        """Ask the thread to re-evaluate now, e.g. after a model swap"""
+        self._requested = trigger
+        if self.watcher is not None:
+            self.watcher.wake()
+
+    def _run(self, pid):
+        trigger = "startup"
+        while self._pid == pid:
+            try:
+                self.refresh(trigger)
+            except Exception as e:
+                self.last_error = str(e)
+                log.warning("⚠️ Background evaluation failed: %s", e)
+            trigger = self._next_trigger()
+
+    def _next_trigger(self):
+        """Wait for a change someone else made, a request or the interval"""
+        deadline = time.monotonic() + self.interval
+        software_list = os.path.abspath(self.software_list)
+        while True:
+            changed = self.watcher.wait(max(0.0, deadline - time.monotonic()))
+            if software_list in changed and file_signature(software_list) == self._own_inventory:
+                changed.discard(software_list)  # our own inventory write
+            requested, self._requested = self._requested, None
+            if changed:
+                return "change"
+            if requested:
+                return requested
+            if time.monotonic() >= deadline:
+                return "interval"
+
+    # === Evaluation ===
+    def _stage(self, name, key, compute, force):
+        cached = self._memo.get(name)
+        if not force and cached is not None and cached[0] == key:
+            REEVAL_STAGES.labels(name, "skipped").inc()
+            return cached[1], False
+        value = compute()
+        self._memo[name] = (key, value)
+        REEVAL_STAGES.labels(name, "recomputed").inc()
+        return value, True
+
+    def refresh(self, trigger="manual", force=False):
+        """Re-evaluate what changed since the last run; returns the published snapshot"""
+        with self._lock:
+            REEVAL_RUNS.labels(trigger).inc()
+            loaded = self.state.wait(self.ready_timeout)
+
+            if force or trigger in ("startup", "interval"):
+                save_installed_software_to_file(self.software_list, max_age=INVENTORY_MAX_AGE)
+                self._own_inventory = file_signature(self.software_list)
+            inventory = _read_bytes(self.software_list) or b""
+            controls_raw = _read_bytes(self.controls_path)
+            if controls_raw is None:
+                raise FileNotFoundError(f"File not found: {self.controls_path}")
+            controls = json.loads(controls_raw)
+            try:
+                settings = parse_audit_log()
+            except (OSError, ValueError) as e:
+                log.debug("No audit log settings (%s), using the controls file", e)
+                settings = {key: str(value) for key, value in controls.items()}
+
+            system_risk, risk_changed = self._stage(
+                "system_risk", _digest(inventory), lambda: system_risk_from_inventory(self.software_list), force
+            )
+            if system_risk.fallback:
+                del self._memo["system_risk"]  # retry GPT next time
+            mismatches, policy_changed = self._stage(
+                "policy", (_digest(json.dumps(settings, sort_keys=True).encode()), system_risk.level),
+                lambda: compare_with_policy(settings, system_risk.level), force
+            )
+            ml_risk, predict_changed = self._stage(
+                "predict", (_digest(controls_raw), loaded.version),
+                lambda: self.predict(loaded, controls), force
+            )
+            recomputed = [name for name, changed in (("system_risk", risk_changed), ("policy", policy_changed),
+                                                     ("predict", predict_changed)) if changed]
+            if not recomputed and self.snapshot is not None:
+                REEVAL_STAGES.labels("score", "skipped").inc()
+                self.last_error = None
+                return self.snapshot
+
+            REEVAL_STAGES.labels("score", "recomputed").inc()
+            computed_at = time.time()
+            body = json.dumps({
+                "system_risk": system_risk.level,
+                "system_risk_fallback": system_risk.fallback,
+                "ml_risk": ml_risk,
+                "mismatches": [m.to_dict() for m in mismatches],
+                **self.score(system_risk.level, ml_risk, len(mismatches)),
+                "model_version": loaded.version,
+                "evaluated_at": datetime.fromtimestamp(computed_at, timezone.utc).isoformat(),
+                "trigger": trigger,
+                "recomputed": recomputed,
+            }).encode("utf-8")
+            self.snapshot = EvaluationSnapshot(body, _digest(body)[:32], computed_at)
+            self.last_error = None
+            log.info("📈 Re-evaluated (%s): system %s, ML %s, recomputed %s",
+                     trigger, system_risk.level, ml_risk, ", ".join(recomputed))
+            return self.snapshot
@@ -0,0 +1,223 @@
+"""Concurrent /api/evaluate load against the Flask and the ASGI service.
+
+A local stand-in for the OpenAI API (chat completions over HTTP, answers
+from fixtures.StubOpenAI after --gpt-latency seconds) is started and both
+servers are pointed at it with OPENAI_BASE_URL, with the GPT cache turned
+off so every request makes its refine and classify calls. Each server runs
+in its own process:
+
+* flask: ml_model_api.create_app() behind a WSGI server with a fixed pool
+  of --threads request threads (like gunicorn --threads)
+* asgi: asgi_app.create_asgi_app() under uvicorn, one event loop
+
+Then --clients connections send --requests POSTs in total. After the ASGI
+run, one more request is abandoned mid-flight to check that the client
+disconnect is noticed and counted, and the /api/evaluate bodies of both
+servers are compared.
+
+    python py/bench/bench_async.py --clients 1 8 32 --requests 64 --gpt-latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [HERE, os.path.dirname(HERE)]
+import fixtures  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# === Stand-in GPT service ===
+def start_fake_gpt(latency):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency)
+            answer = fixtures.StubOpenAI.answer(body["messages"][-1]["content"])
+            payload = json.dumps({
+                "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+                "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": answer}}],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# === Servers under test (run in a child process) ===
+def serve(kind, port, threads):
+    import warnings
+    warnings.filterwarnings("ignore")
+    if kind == "asgi":
+        import uvicorn
+        from asgi_app import create_asgi_app
+        uvicorn.run(create_asgi_app({"MODEL_LOAD": "eager"}), host="127.0.0.1", port=port, log_level="error")
+        return
+
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+    from ml_model_api import create_app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+
+    class PooledWSGIServer(BaseWSGIServer):
+        """At most `threads` requests in progress, the rest wait in the backlog"""
+        pool = ThreadPoolExecutor(threads)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._process, request, client_address)
+
+        def _process(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    PooledWSGIServer("127.0.0.1", port, create_app({"MODEL_LOAD": "eager"}), QuietHandler).serve_forever()
+
+
+def wait_ready(port, process, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"❌ server exited with {process.returncode}")
+        try:
+            status, _ = asyncio.run(request(port, "GET", "/readyz"))
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit("❌ server did not become ready")
+
+
+# === Load generator ===
+async def request(port, method, path):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Length: 0\r\n"
+                 f"Connection: close\r\n\r\n".encode())
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    return int(data.split(b" ", 2)[1]), data.split(b"\r\n\r\n", 1)[-1]
+
+
+async def load(port, clients, requests):
+    latencies, statuses = [], {}
+    remaining = requests
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            status, _ = await request(port, "POST", "/api/evaluate")
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return time.perf_counter() - start, latencies, statuses
+
+
+async def abandon(port, after):
+    """Start an evaluation and hang up before it finishes"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"POST /api/evaluate HTTP/1.1\r\nHost: bench\r\nContent-Length: 0\r\n\r\n")
+    await writer.drain()
+    await asyncio.sleep(after)
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64, help="requests per run")
+    parser.add_argument("--threads", type=int, default=4, help="Flask request threads")
+    parser.add_argument("--gpt-latency", type=float, default=0.5, help="seconds per stand-in GPT call")
+    parser.add_argument("--serve", choices=("flask", "asgi"), help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args.serve, args.port, args.threads)
+
+    workdir = tempfile.mkdtemp(prefix="iepis-async-")
+    log_dir = os.path.join(workdir, "logs")
+    os.makedirs(log_dir)
+    fixtures.write_audit_log(os.path.join(log_dir, "security_audit_log.txt"), runs=10)
+    fixtures.write_controls_json(os.path.join(log_dir, "latest_controls.json"))
+    software_list = fixtures.write_software_list(os.path.join(workdir, "software_list.txt"), 80)
+    gpt = start_fake_gpt(args.gpt_latency)
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "bench", "OPENAI_BASE_URL": f"http://127.0.0.1:{gpt.server_port}/v1",
+        "IEPIS_LOG_DIR": log_dir, "IEPIS_SOFTWARE_LIST": software_list,
+        "IEPIS_INVENTORY_MAX_AGE": "1e9",  # no PowerShell here; keep the fixture list
+        "IEPIS_GPT_CACHE": "", "IEPIS_LOCAL_RISK_MODEL": os.path.join(workdir, "none.pkl"),
+        "IEPIS_GPT_MAX_CONCURRENCY": "256", "IEPIS_GPT_RPM": "1e6", "IEPIS_GPT_TPM": "1e9",
+        "IEPIS_MODEL_REGISTRY": "", "IEPIS_MODEL_POLL_SECONDS": "0", "IEPIS_LOG_LEVEL": "ERROR",
+    }
+
+    print(f"📊 /api/evaluate, {args.requests} requests per run, stand-in GPT latency {args.gpt_latency}s, "
+          f"Flask with {args.threads} threads")
+    print(f"{'server':<7}{'clients':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}  statuses")
+    bodies = {}
+    for kind in ("flask", "asgi"):
+        port = free_port()
+        server = subprocess.Popen([sys.executable, __file__, "--serve", kind, "--port", str(port),
+                                   "--threads", str(args.threads)], env=env, cwd=workdir)
+        try:
+            wait_ready(port, server)
+            bodies[kind] = json.loads(asyncio.run(request(port, "POST", "/api/evaluate"))[1])
+            for clients in args.clients:
+                elapsed, latencies, statuses = asyncio.run(load(port, clients, args.requests))
+                p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+                print(f"{kind:<7}{clients:>8}{args.requests / elapsed:>9.1f}{p50:>9.0f}{p95:>9.0f}  {statuses}")
+            if kind == "asgi":
+                asyncio.run(abandon(port, args.gpt_latency / 2))
+                time.sleep(args.gpt_latency)
+                _, body = asyncio.run(request(port, "GET", "/metrics"))
+                lines = [ln for ln in body.decode().splitlines() if ln.startswith("iepis_client_disconnects_total")]
+                print("🔌 " + ("; ".join(lines) if lines else "❌ disconnect not counted"))
+        finally:
+            server.terminate()
+            server.wait()
+    gpt.shutdown()
+    same = bodies["flask"] == bodies["asgi"]
+    print(("✅ Both servers return the same /api/evaluate body" if same else
+           f"❌ Responses differ:\n{bodies['flask']}\n{bodies['asgi']}"))
+
+
+if __name__ == "__main__":
+    main()
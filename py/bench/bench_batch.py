@@ -0,0 +1,72 @@
+"""Compare /api/evaluate_batch against one request per host.
+
+Run from the repository root or from py/:
+
+    python py/bench/bench_batch.py --hosts 2000 --chunk-size 1024
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+PY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PY_DIR)
+
+CHOICES = {
+    "SmartScreen": ["Enabled", "Disabled"],
+    "TPM": ["Enabled", "Disabled"],
+    "BitLocker": ["Enabled", "Disabled", "Unknown"],
+    "GuestUser": ["Enabled", "Disabled"],
+    "GuestGroup": ["HasMembers", "NoMembers"],
+    "PasswordLength": ["0", "8", "12", "16"],
+    "FIPS": ["Enabled", "Disabled"],
+    "UAC": ["Enabled", "Disabled"],
+    "AutoPlay": ["Enabled", "Disabled"],
+    "AVProductsInstalled": [0, 1],
+    "Census_IsSecureBootEnabled": [0, 1],
+    "Census_IsVirtualDevice": [0, 1],
+}
+
+
+def make_snapshots(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        {
+            "host": f"host-{i:06d}",
+            "system_risk": rng.choice(["Low", "Medium", "High"]),
+            "controls": {k: rng.choice(v) for k, v in CHOICES.items()},
+        }
+        for i in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=1000)
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    import ml_model_api
+    client = ml_model_api.create_app({"MODEL_LOAD": "eager"}).test_client()
+    snapshots = make_snapshots(args.hosts)
+
+    t0 = time.perf_counter()
+    for snapshot in snapshots:
+        r = client.post("/api/evaluate_batch", json={"snapshots": [snapshot]})
+        assert r.status_code == 200, r.data
+    per_host = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    r = client.post("/api/evaluate_batch", json={"snapshots": snapshots, "chunk_size": args.chunk_size})
+    assert r.status_code == 200, r.data
+    batched = time.perf_counter() - t0
+
+    print(f"hosts={args.hosts} chunk_size={args.chunk_size}")
+    print(f"one request per host: {per_host:.3f}s ({args.hosts / per_host:,.0f} hosts/s)")
+    print(f"single batch request: {batched:.3f}s ({args.hosts / batched:,.0f} hosts/s)")
+    print(f"speedup: {per_host / batched:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Latency and throughput of the ML predict path with and without micro-batching.
+
+Each client thread repeatedly calls ml_model_api.predict_ml_risk() (encode +
+predict for one host), the path /api/evaluate takes for its ML step.
+
+    python py/bench/bench_microbatch.py --clients 1 16 128 --requests 2000
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_batch import make_snapshots  # noqa: E402  (also sets sys.path)
+
+
+def run(api, loaded, controls, clients, requests):
+    latencies = []
+    lock = threading.Lock()
+    per_client = max(1, requests // clients)
+
+    def client(k):
+        local = []
+        for i in range(per_client):
+            start = time.perf_counter()
+            api.predict_ml_risk(loaded, controls[(k * per_client + i) % len(controls)])
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(k,)) for k in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    ms = np.array(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(ms, 50), np.percentile(ms, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 16, 128])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--wait-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    import ml_model_api as api
+    from microbatch import MicroBatcher
+
+    loaded = api.create_app({"MODEL_LOAD": "eager"}).extensions["iepis_model"].wait()
+    controls = [s["controls"] for s in make_snapshots(1000)]
+    batcher = MicroBatcher(loaded.predict, args.max_batch, args.wait_ms)
+
+    print(f"{'mode':<12}{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for clients in args.clients:
+        for mode, b in (("direct", None), ("microbatch", batcher)):
+            loaded.batcher = b
+            rps, p50, p99 = run(api, loaded, controls, clients, args.requests)
+            print(f"{mode:<12}{clients:>8}{rps:>10.0f}{p50:>10.2f}{p99:>10.2f}")
+    batcher.close()
+    print("batch sizes:", batcher.stats()["batch_size_histogram"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Per-stage benchmarks of the evaluation pipeline, fully offline.
+
+Builds synthetic fixtures in a temporary IEPIS_LOG_DIR (audit log,
+latest_controls.json, software_list.txt), replaces the OpenAI client with
+fixtures.StubOpenAI and times every stage of /api/evaluate on its own and
+the whole request through Flask's test client. Each stage reports
+latency percentiles, throughput and the tracemalloc peak of one call.
+
+    python py/bench/bench_pipeline.py --log-runs 10000 --out results.json
+    python py/bench/compare.py baseline.json results.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_batch import PY_DIR, make_snapshots  # noqa: E402  (also sets sys.path)
+
+START_DIR = os.getcwd()
+
+
+def measure(fn, iterations, setup=None, warmup=3, memory_iterations=5):
+    """Latencies of fn() in seconds plus the largest extra memory one call traced.
+
+    setup() runs before every call and is not timed.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+
+    latencies = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+
+    peak = 0
+    tracemalloc.start()
+    try:
+        for _ in range(min(iterations, memory_iterations)):
+            if setup:
+                setup()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            fn()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    return np.array(latencies), peak
+
+
+def summarize(latencies, peak, items=1):
+    ms = latencies * 1000
+    return {
+        "iterations": len(latencies),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "ops_per_s": float(len(latencies) / latencies.sum()),
+        "items_per_s": float(items * len(latencies) / latencies.sum()),
+        "peak_kib": peak / 1024,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=PY_DIR,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log-runs", type=int, default=10_000, help="collection runs in the audit log")
+    parser.add_argument("--devices", type=int, default=1, help="devices per run in the audit log")
+    parser.add_argument("--software", type=int, default=300, help="titles in software_list.txt")
+    parser.add_argument("--hosts", type=int, default=1000, help="snapshots per /api/evaluate_batch call")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--gpt-latency", type=float, default=0.0, help="stub GPT delay per call, seconds")
+    parser.add_argument("--stages", nargs="*", help="only run these stages")
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--keep-fixtures", action="store_true", help="don't delete the scratch directory")
+    args = parser.parse_args()
+
+    # Everything the pipeline reads or writes goes to a scratch directory;
+    # these must be set before the pipeline modules are imported
+    workdir = tempfile.mkdtemp(prefix="iepis-bench-")
+    os.environ.update({
+        "IEPIS_LOG_DIR": workdir,
+        "IEPIS_CONTROL_STORE": os.path.join(workdir, "controls.db"),
+        "IEPIS_GPT_CACHE": os.path.join(workdir, "gpt_cache.sqlite3"),
+        "IEPIS_INVENTORY_MAX_AGE": str(10 ** 9),
+        "IEPIS_MODEL_REGISTRY": os.path.join(workdir, "models"),
+        "IEPIS_MODEL_POLL_SECONDS": "0",
+        "IEPIS_LOG_LEVEL": os.getenv("IEPIS_LOG_LEVEL", "ERROR"),
+    })
+    os.chdir(workdir)
+
+    import warnings
+    warnings.filterwarnings("ignore")
+
+    import audit_log
+    import compare_controls
+    import fixtures
+    import ml_model_api
+    import risk_assisment_modified as gpt
+
+    t0 = time.perf_counter()
+    fixtures.write_audit_log(audit_log.DEFAULT_LOG_PATH, args.log_runs, args.devices)
+    fixtures.write_controls_json(audit_log.CONTROLS_PATH)
+    fixtures.write_software_list("software_list.txt", args.software)
+    print(f"📁 Fixtures in {workdir} ({os.path.getsize(audit_log.DEFAULT_LOG_PATH) / 1e6:.1f} MB audit log, "
+          f"{time.perf_counter() - t0:.1f}s)")
+
+    gpt._client = fixtures.StubOpenAI(args.gpt_latency)
+    app = ml_model_api.create_app({"MODEL_LOAD": "eager"})
+    loaded = app.extensions["iepis_model"].wait()
+    client = app.test_client()
+
+    with open(audit_log.CONTROLS_PATH) as f:
+        controls = json.load(f)
+    refined = gpt.refine_user_software("software_list.txt")
+    settings = compare_controls.parse_audit_log()
+    row = np.array([ml_model_api.encode_controls(loaded, controls)], dtype=np.float32)
+    snapshots = make_snapshots(args.hosts)
+
+    def api_evaluate():
+        r = client.post("/api/evaluate")
+        assert r.status_code == 200, r.data
+
+    def api_evaluate_batch():
+        r = client.post("/api/evaluate_batch", json={"snapshots": snapshots})
+        assert r.status_code == 200, r.data
+
+    n = args.iterations
+    stages = {
+        # name: (fn, setup, iterations, items per call)
+        "inventory": (lambda: compare_controls.save_installed_software_to_file(
+            "software_list.txt", max_age=compare_controls.INVENTORY_MAX_AGE), None, n, 1),
+        "gpt_refine": (lambda: gpt.refine_user_software("software_list.txt"), gpt.invalidate_cache, n // 4, 1),
+        "gpt_refine_cached": (lambda: gpt.refine_user_software("software_list.txt"), None, n, 1),
+        "gpt_classify": (lambda: gpt.classify_risk(refined), gpt.invalidate_cache, n // 4, 1),
+        "system_risk": (compare_controls.get_system_risk_level, None, n, 1),
+        "parse_audit_log": (compare_controls.parse_audit_log, None, n, 1),
+        "compare_with_policy": (lambda: compare_controls.compare_with_policy(settings, "Medium"), None, n * 10, 1),
+        "encode_features": (lambda: ml_model_api.encode_controls(loaded, controls), None, n * 10, 1),
+        "predict": (lambda: loaded.predict(row), None, n, 1),
+        "calculate_final_score": (lambda: ml_model_api.calculate_final_score("High", "Medium", 3, 9), None, n * 10, 1),
+        "evaluate_system": (compare_controls.evaluate_system, None, n, 1),
+        "api_evaluate": (api_evaluate, None, n, 1),
+        "api_evaluate_batch": (api_evaluate_batch, None, max(5, n // 20), args.hosts),
+    }
+
+    results = {}
+    print(f"{'stage':<24}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'ops/s':>12}{'peak KiB':>11}")
+    for name, (fn, setup, iterations, items) in stages.items():
+        if args.stages and name not in args.stages:
+            continue
+        # Keep stray prints from the pipeline out of the report
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            latencies, peak = measure(fn, max(1, iterations), setup)
+        results[name] = summarize(latencies, peak, items)
+        r = results[name]
+        print(f"{name:<24}{r['p50_ms']:>10.3f}{r['p90_ms']:>10.3f}{r['p99_ms']:>10.3f}"
+              f"{r['ops_per_s']:>12,.0f}{r['peak_kib']:>11.1f}")
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runner": loaded.config["INFERENCE_RUNNER"],
+            "params": {k: v for k, v in vars(args).items() if k != "out"},
+        },
+        "stages": results,
+    }
+    if args.out:
+        with open(args.out if os.path.isabs(args.out) else os.path.join(START_DIR, args.out), "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results written to {args.out}")
+    if not args.keep_fixtures:
+        os.chdir(START_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""Worker memory and hot model reload latency with the model registry.
+
+Publishes TabnetRfHybrid.h5 twice (v1, v2) into a temporary registry, then:
+
+* memory: starts --workers processes either forked from a master that
+  already loaded the model ("preload") or each loading it themselves
+  ("spawn"), and reports RSS and PSS per worker. PSS splits shared pages
+  between processes, so its sum is the real combined footprint.
+* swap: flips CURRENT to the other version and measures how long each
+  worker takes to pick it up through its pointer watcher.
+* reload: client threads keep posting to /api/evaluate_batch while
+  /api/model/reload alternates versions; reports reload latency, request
+  latency percentiles and failed requests.
+
+    python py/bench/bench_reload.py --workers 4 --clients 8 --reloads 10
+"""
+import argparse
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_batch import PY_DIR, make_snapshots  # noqa: E402  (also sets sys.path)
+
+
+def _config(registry):
+    return {"MODEL_LOAD": "eager", "MODEL_REGISTRY": registry, "MODEL_POLL_SECONDS": 0.05}
+
+
+def _serve(app, conn):
+    import ml_model_api
+    from model_registry import memory_usage
+
+    client = app.test_client()
+    r = client.post("/api/evaluate_batch", json={"snapshots": make_snapshots(32)})
+    assert r.status_code == 200, r.data
+    conn.send(memory_usage())
+    state = app.extensions["iepis_model"]
+    while True:
+        target = conn.recv()
+        if target is None:
+            return
+        start = time.perf_counter()
+        while state.active.version != target and time.perf_counter() - start < 10:
+            time.sleep(0.005)
+        assert ml_model_api.RISK_LABELS  # module stays importable in the worker
+        conn.send((state.active.version, time.perf_counter() - start))
+
+
+def _spawned_worker(registry, conn):
+    import ml_model_api
+    _serve(ml_model_api.create_app(_config(registry)), conn)
+
+
+def run_workers(mode, registry, n):
+    from model_registry import ModelRegistry
+
+    if mode == "preload":
+        import ml_model_api
+        app = ml_model_api.create_app(_config(registry))
+        ctx = mp.get_context("fork")
+        procs = [(ctx.Process(target=_serve, args=(app, child)), parent)
+                 for parent, child in (ctx.Pipe() for _ in range(n))]
+    else:
+        ctx = mp.get_context("spawn")
+        procs = [(ctx.Process(target=_spawned_worker, args=(registry, child)), parent)
+                 for parent, child in (ctx.Pipe() for _ in range(n))]
+    for p, _ in procs:
+        p.start()
+    usage = [conn.recv() for _, conn in procs]
+
+    reg = ModelRegistry(registry)
+    target = "v2" if reg.current_version() == "v1" else "v1"
+    reg.activate(target)
+    for _, conn in procs:
+        conn.send(target)
+    swaps = [conn.recv() for _, conn in procs]
+    for p, conn in procs:
+        conn.send(None)
+        p.join()
+
+    mb = 1024 * 1024
+    rss = [u.get("rss", 0) / mb for u in usage]
+    pss = [u.get("pss", 0) / mb for u in usage]
+    print(f"{mode:<8} workers={n}  RSS/worker {np.mean(rss):7.1f} MB  PSS/worker {np.mean(pss):7.1f} MB  "
+          f"PSS total {sum(pss):7.1f} MB")
+    ok = all(v == target for v, _ in swaps)
+    print(f"{'':<8} swap to {target}: all workers switched={ok}, "
+          f"max pickup {max(s for _, s in swaps) * 1000:.0f} ms (poll interval 50 ms)")
+
+
+def run_reload_under_load(registry, clients, reloads):
+    import ml_model_api
+
+    app = ml_model_api.create_app(dict(_config(registry), MODEL_POLL_SECONDS=0))
+    snapshots = make_snapshots(64)
+    latencies, failures, stop = [], [0], threading.Event()
+    lock = threading.Lock()
+
+    def client():
+        c = app.test_client()
+        local = []
+        while not stop.is_set():
+            start = time.perf_counter()
+            r = c.post("/api/evaluate_batch", json={"snapshots": snapshots[:8]})
+            local.append(time.perf_counter() - start)
+            if r.status_code != 200 or r.get_json()["failed"]:
+                with lock:
+                    failures[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    time.sleep(0.5)
+    admin = app.test_client()
+    loads, swaps = [], []
+    for i in range(reloads):
+        r = admin.post("/api/model/reload", json={"version": "v2" if i % 2 == 0 else "v1"})
+        assert r.status_code == 200, r.data
+        reload = r.get_json()["reload"]
+        # the first two reloads load from disk, after that the version is the kept previous one
+        (loads if i < 2 else swaps).append(reload["seconds"])
+        time.sleep(0.2)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    ms = np.array(latencies) * 1000
+    print(f"reload   clients={clients} reloads={reloads}: load from registry {np.mean(loads) * 1000:.1f} ms, "
+          f"swap to kept version {np.mean(swaps) * 1000:.3f} ms")
+    print(f"{'':<8} {len(ms)} requests during reloads: p50 {np.percentile(ms, 50):.2f} ms, "
+          f"p99 {np.percentile(ms, 99):.2f} ms, failed {failures[0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--reloads", type=int, default=10)
+    args = parser.parse_args()
+
+    import warnings
+    warnings.filterwarnings("ignore")
+    from model_registry import ModelRegistry
+
+    with tempfile.TemporaryDirectory() as registry:
+        reg = ModelRegistry(registry)
+        model = os.path.join(PY_DIR, "TabnetRfHybrid.h5")
+        encoders = os.path.join(PY_DIR, "tabnet_encoders.pkl")
+        reg.publish(model, encoders, "v1", activate=True)
+        reg.publish(model, encoders, "v2")
+
+        run_workers("spawn", registry, args.workers)
+        reg.activate("v1")
+        run_workers("preload", registry, args.workers)
+        reg.activate("v1")
+        run_reload_under_load(registry, args.clients, args.reloads)
+
+
+if __name__ == "__main__":
+    main()
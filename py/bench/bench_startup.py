@@ -0,0 +1,75 @@
+"""Cold start to first prediction, measured in a fresh interpreter per run.
+
+Each run starts a new Python process, imports ml_model_api, creates the app
+with the given IEPIS_MODEL_LOAD mode and posts one snapshot to
+/api/evaluate_batch. Times are measured from interpreter start:
+
+    python py/bench/bench_startup.py --modes background lazy eager --runs 3 --json startup.jsonl
+
+With --json each run is appended as one JSON line, so results can be
+tracked across commits.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+PY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import ml_model_api
+t_import = time.perf_counter()
+app = ml_model_api.create_app({"MODEL_LOAD": sys.argv[2]})
+client = app.test_client()
+assert client.get("/healthz").status_code == 200
+t_live = time.perf_counter()
+snapshot = {"host": "cold-start", "controls": {"SmartScreen": "Enabled", "TPM": 1}}
+r = client.post("/api/evaluate_batch", json={"snapshots": [snapshot]})
+assert r.status_code == 200 and r.get_json()["failed"] == 0, r.data
+t_first = time.perf_counter()
+ready = client.get("/readyz").get_json()
+print(json.dumps({
+    "import_s": t_import - t0,
+    "live_s": t_live - t0,
+    "first_prediction_s": t_first - t0,
+    "model_load_s": ready["load_seconds"],
+}))
+"""
+
+
+def run_once(mode):
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", CHILD, PY_DIR, mode],
+        capture_output=True, text=True, check=True, cwd=os.getcwd(),
+    ).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    result["process_s"] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["background", "lazy", "eager"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--json", help="append each run to this JSON lines file")
+    args = parser.parse_args()
+
+    print(f"{'mode':<12}{'import s':>10}{'live s':>10}{'load s':>10}{'first pred s':>14}")
+    for mode in args.modes:
+        for _ in range(args.runs):
+            r = run_once(mode)
+            print(f"{mode:<12}{r['import_s']:>10.3f}{r['live_s']:>10.3f}"
+                  f"{r['model_load_s']:>10.3f}{r['first_prediction_s']:>14.3f}")
+            if args.json:
+                with open(args.json, "a") as f:
+                    f.write(json.dumps({"mode": mode, "time": time.time(), **r}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
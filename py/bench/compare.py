@@ -0,0 +1,53 @@
+"""Compare two bench_pipeline.py result files and flag regressions.
+
+    python py/bench/compare.py baseline.json results.json --metric p50_ms --threshold 0.10
+
+Run both on the same machine; timings on shared hosts vary by 10-30%
+between runs, so compare p50 rather than p99 and rerun suspicious stages.
+
+Exits with status 1 if any stage got slower than the threshold allows.
+"""
+import argparse
+import json
+
+
+def compare(baseline, current, metric="p50_ms", threshold=0.10, min_delta=0.005):
+    """[(stage, base, new, relative change, verdict)] for stages in both files.
+
+    A change only counts if it is beyond threshold and larger than
+    min_delta in absolute terms, so microsecond stages don't flap.
+    """
+    rows = []
+    for stage, new in current["stages"].items():
+        base = baseline["stages"].get(stage)
+        if base is None or not base.get(metric):
+            continue
+        change = new[metric] / base[metric] - 1
+        verdict = ""
+        if abs(new[metric] - base[metric]) > min_delta:
+            verdict = "REGRESSION" if change > threshold else "faster" if change < -threshold else ""
+        rows.append((stage, base[metric], new[metric], change, verdict))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--metric", default="p50_ms",
+                        help="mean_ms, p50_ms, p90_ms, p99_ms or peak_kib (lower is better)")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change that counts")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="smallest absolute change that counts")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    print(f"{baseline['meta'].get('commit')} -> {current['meta'].get('commit')} ({args.metric})")
+    rows = compare(baseline, current, args.metric, args.threshold, args.min_delta)
+    for stage, base, new, change, verdict in rows:
+        print(f"{stage:<24}{base:>12.3f}{new:>12.3f}{change:>+10.1%}  {verdict}")
+    if any(verdict == "REGRESSION" for *_, verdict in rows):
+        raise SystemExit(1)
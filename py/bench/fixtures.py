@@ -0,0 +1,104 @@
+"""Synthetic inputs for the offline benchmarks.
+
+* ``write_audit_log``: a security_audit_log.txt with many collection runs
+* ``write_controls_json``: a latest_controls.json snapshot
+* ``write_software_list``: a software_list.txt inventory
+* ``StubOpenAI``: answers chat completions like GPT would, without a network
+
+Everything is seeded, so two runs with the same arguments write the same
+files and send the same prompts.
+"""
+import datetime
+import json
+import random
+import time
+from types import SimpleNamespace
+
+from audit_log import format_line
+from bench_batch import CHOICES
+
+AUDITED = {  # setting -> ideal value, as written by Research1.py
+    "GuestUser": "Disabled",
+    "GuestGroup": "NoMembers",
+    "BitLocker": "Enabled",
+    "PasswordLength": ">=8",
+    "FIPS": "Enabled",
+    "TPM": "Enabled",
+    "SmartScreen": "Enabled",
+    "UAC": "Enabled",
+    "AutoPlay": "Disabled",
+}
+
+VENDORS = ["Microsoft", "Google", "Mozilla", "Adobe", "Oracle", "NVIDIA", "Intel", "Zoom", "Slack", "Python"]
+PRODUCTS = ["Chrome", "Firefox", "Reader", "Visual C++ Redistributable", "Java Runtime", "Driver",
+            "Update Helper", "Teams", "Office", "Runtime", "SDK", "Toolkit", "Client", "Launcher"]
+SYSTEM_HINTS = ("Redistributable", "Driver", "Runtime", "SDK", "Update Helper")
+
+
+def write_audit_log(path, runs=1000, devices=1, seed=0):
+    """Append-order log of runs x devices snapshots, newest last"""
+    rng = random.Random(seed)
+    start = datetime.datetime(2025, 1, 1)
+    with open(path, "w", encoding="utf-8") as f:
+        for run in range(runs):
+            timestamp = (start + datetime.timedelta(minutes=run)).strftime("%Y-%m-%d %H:%M:%S")
+            for d in range(devices):
+                device = f"DESKTOP-{d:04d}"
+                for setting, ideal in AUDITED.items():
+                    actual = str(rng.choice(CHOICES[setting]))
+                    f.write(format_line(timestamp, device, setting, actual, ideal,
+                                        "Yes" if actual == ideal else "No"))
+    return path
+
+
+def make_controls(seed=0):
+    rng = random.Random(seed)
+    return {k: rng.choice(v) for k, v in CHOICES.items()}
+
+
+def write_controls_json(path, seed=0):
+    with open(path, "w") as f:
+        json.dump(make_controls(seed), f, indent=2)
+    return path
+
+
+def write_software_list(path, titles=300, seed=0):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < titles:
+        names.add(f"{rng.choice(VENDORS)} {rng.choice(PRODUCTS)} {rng.randint(1, 30)}.{rng.randint(0, 9)}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(sorted(names)))
+    return path
+
+
+class StubOpenAI:
+    """Stands in for openai.OpenAI in risk_assisment_modified.
+
+    Refinement prompts get back the titles that don't look like system
+    components; classification prompts get a label derived from the list
+    length. latency adds a fixed delay per call.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    def create(self, model, messages, temperature=0, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = messages[-1]["content"]
+        message = SimpleNamespace(content=self.answer(prompt))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    @staticmethod
+    def answer(prompt):
+        if prompt.startswith("Classify"):
+            lines = [ln for ln in prompt.splitlines() if ln.strip()]
+            return ["Low", "Medium", "High"][len(lines) % 3]
+        titles = prompt.split("\n\n", 1)[-1].splitlines()
+        return "\n".join(t for t in titles if t.strip() and not any(h in t for h in SYSTEM_HINTS))
+
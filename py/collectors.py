@@ -0,0 +1,280 @@
+"""Pluggable, concurrent security control collectors.
+
+Each control is a ``Probe`` with a timeout and a default used when the probe
+fails, which is the value ``Research1.py`` always fell back to. Probes read
+the system through a backend:
+
+* ``WindowsBackend`` runs commands, reads the registry (``winreg`` is only
+  imported here) and runs every PowerShell probe in a single
+  ``powershell`` invocation that returns JSON
+* ``FixtureBackend`` answers from a dict or JSON file, so collection runs
+  on Linux and in tests
+
+``collect_controls`` runs the probes concurrently on a thread pool, so a
+collection takes about as long as the slowest probe instead of the sum of
+all of them. Set ``IEPIS_COLLECTOR_BACKEND=fixture:<path.json>`` to use a
+fixture backend from ``Research1.py``.
+"""
+import json
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+DEFAULT_TIMEOUT = float(os.getenv("IEPIS_PROBE_TIMEOUT", "20"))
+POWERSHELL = "powershell"
+
+
+class ProbeError(Exception):
+    pass
+
+
+class Probe:
+    """One control: how to read it, how to parse it, and its fallback value.
+
+    kind is "command" (source = argv list), "registry" (source =
+    (hive, key path, value name)) or "powershell" (source = expression).
+    ideal is the expected value written to the audit log; probes with
+    ideal=None only go to latest_controls.json.
+    """
+
+    def __init__(self, name, kind, source, parse, default, ideal=None, timeout=DEFAULT_TIMEOUT):
+        self.name, self.kind, self.source = name, kind, source
+        self.parse, self.default, self.ideal, self.timeout = parse, default, ideal, timeout
+
+    def run(self, backend):
+        if self.kind == "command":
+            return self.parse(backend.run_command(self.source, self.timeout))
+        if self.kind == "registry":
+            return self.parse(backend.read_registry(*self.source))
+        raise ProbeError(f"{self.name}: {self.kind} probes run in a PowerShell batch")
+
+    def __repr__(self):
+        return f"Probe({self.name!r}, {self.kind!r})"
+
+
+PROBES = []
+
+
+def register(probe):
+    """Add a probe to the default registry (replacing one with the same name)"""
+    PROBES[:] = [p for p in PROBES if p.name != probe.name] + [probe]
+    return probe
+
+
+# === Backends ===
+class WindowsBackend:
+    def run_command(self, args, timeout):
+        return subprocess.check_output(args, stderr=subprocess.DEVNULL, text=True, timeout=timeout)
+
+    def read_registry(self, hive, path, name):
+        import winreg
+        key = winreg.OpenKey(getattr(winreg, hive), path)
+        try:
+            val, _ = winreg.QueryValueEx(key, name)
+        finally:
+            winreg.CloseKey(key)
+        return val
+
+    def run_powershell_batch(self, expressions, timeout):
+        """Evaluate {name: expression} in one PowerShell process.
+
+        Returns {name: output string or None if the expression failed}.
+        Non-terminating errors (e.g. Get-Tpm without access) count as failures.
+        """
+        lines = ["$ErrorActionPreference = 'Stop'", "$r = @{}"]
+        for name, expr in expressions.items():
+            lines.append(f"try {{ $r['{name}'] = [string]({expr}) }} catch {{ $r['{name}'] = $null }}")
+        lines.append("$r | ConvertTo-Json -Compress")
+        out = subprocess.check_output(
+            [POWERSHELL, "-NoProfile", "-NonInteractive", "-Command", "\n".join(lines)],
+            stderr=subprocess.DEVNULL, text=True, timeout=timeout)
+        return json.loads(out or "{}")
+
+
+class FixtureBackend:
+    """Answers probes from canned data; delay simulates slow probes.
+
+    commands are keyed by the space-joined argv, registry values by
+    "HIVE\\path\\name", PowerShell outputs by expression. Anything missing
+    raises, just like a failing probe on Windows.
+    """
+
+    def __init__(self, commands=None, registry=None, powershell=None, delay=0.0):
+        self.commands = commands or {}
+        self.registry = registry or {}
+        self.powershell = powershell or {}
+        self.delay = delay
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r") as f:
+            return cls(**json.load(f))
+
+    def _lookup(self, table, key):
+        if self.delay:
+            time.sleep(self.delay)
+        if key not in table:
+            raise ProbeError(f"no fixture for {key!r}")
+        return table[key]
+
+    def run_command(self, args, timeout):
+        return self._lookup(self.commands, " ".join(args))
+
+    def read_registry(self, hive, path, name):
+        return self._lookup(self.registry, f"{hive}\\{path}\\{name}")
+
+    def run_powershell_batch(self, expressions, timeout):
+        if self.delay:
+            time.sleep(self.delay)
+        return {name: self.powershell.get(expr) for name, expr in expressions.items()}
+
+
+def get_backend():
+    spec = os.getenv("IEPIS_COLLECTOR_BACKEND", "windows")
+    if spec.startswith("fixture:"):
+        return FixtureBackend.from_file(spec[len("fixture:"):])
+    return WindowsBackend()
+
+
+# === Collection ===
+class CollectionResult:
+    def __init__(self, values, audit_entries, timings, errors):
+        self.values = values                # {name: value}, in probe order
+        self.audit_entries = audit_entries  # [(setting, actual, ideal, compliant)]
+        self.timings = timings              # {name: seconds}
+        self.errors = errors                # {name: error message}
+
+
+def collect_controls(backend=None, probes=None, max_workers=None):
+    """Run all probes concurrently and return a CollectionResult.
+
+    By default every probe (and the PowerShell batch) gets its own thread.
+    """
+    backend = backend or get_backend()
+    probes = list(PROBES if probes is None else probes)
+    ps_probes = [p for p in probes if p.kind == "powershell"]
+    values, timings, errors = {}, {}, {}
+
+    def timed(fn):
+        def run():
+            start = time.perf_counter()
+            try:
+                return fn()
+            finally:
+                timings[fn.__name__] = time.perf_counter() - start
+        return run
+
+    def run_probe(probe):
+        def probe_task():
+            return probe.run(backend)
+        probe_task.__name__ = probe.name
+        return timed(probe_task)
+
+    def ps_task():
+        exprs = {p.name: p.source for p in ps_probes}
+        outputs = backend.run_powershell_batch(exprs, max(p.timeout for p in ps_probes))
+        result = {}
+        for p in ps_probes:
+            try:
+                output = outputs.get(p.name)
+                if output is None:
+                    raise ProbeError("PowerShell expression failed")
+                if not output.strip():  # $null, or nothing read, is no answer rather than "not enabled"
+                    raise ProbeError("PowerShell expression returned no output")
+                result[p.name] = p.parse(output)
+            except Exception as e:
+                errors[p.name] = str(e) or type(e).__name__
+                result[p.name] = p.default
+        return result
+    ps_task.__name__ = "powershell"
+
+    n_tasks = len(probes) - len(ps_probes) + (1 if ps_probes else 0)
+    pool = ThreadPoolExecutor(max_workers=max_workers or max(1, n_tasks))
+    started = time.monotonic()
+    try:
+        tasks = [(pool.submit(run_probe(p)), p.timeout, [p]) for p in probes if p.kind != "powershell"]
+        if ps_probes:
+            tasks.append((pool.submit(timed(ps_task)), max(p.timeout for p in ps_probes), ps_probes))
+
+        # Each probe gets its own deadline, measured from the start of collection
+        for future, timeout, owners in sorted(tasks, key=lambda t: t[1]):
+            try:
+                result = future.result(timeout=max(0.0, started + timeout - time.monotonic()))
+                values.update(result if owners is ps_probes else {owners[0].name: result})
+            except Exception as e:
+                message = f"timed out after {timeout}s" if isinstance(e, FuturesTimeout) else (str(e) or type(e).__name__)
+                for p in owners:
+                    errors.setdefault(p.name, message)
+                    values[p.name] = p.default
+    finally:
+        # Don't wait for probes stuck past their timeout
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    values = {p.name: values[p.name] for p in probes}
+    audit_entries = []
+    for p in probes:
+        if p.ideal is not None:
+            actual = values[p.name]
+            audit_entries.append((p.name, actual, p.ideal, "Yes" if actual == p.ideal else "No"))
+    return CollectionResult(values, audit_entries, timings, errors)
+
+
+# === Built-in probes (same checks and fallbacks as the original Research1.py) ===
+def _guest_user(out):
+    active = [line for line in out.splitlines() if "Account active" in line]
+    return "Enabled" if active and active[0].strip().endswith("Yes") else "Disabled"
+
+
+def _guest_group(out):
+    return "HasMembers" if sum(1 for line in out.splitlines() if line.strip()) > 6 else "NoMembers"
+
+
+def _bitlocker(out):
+    return "Enabled" if "Protection Status" in out and "On" in out else "Disabled"
+
+
+def _password_length(out):
+    return str(next((int(line.split()[-1]) for line in out.splitlines() if "Minimum password length" in line), 0))
+
+
+def _enabled_if_one(val):
+    return "Enabled" if val == 1 else "Disabled"
+
+
+def _smartscreen(val):
+    return "Enabled" if str(val) in ("RequireAdmin", "Warn") else "Disabled"
+
+
+def _autoplay(val):
+    return "Disabled" if val == 1 else "Enabled"
+
+
+def _true_flag(out):
+    return int("True" in out.strip())
+
+
+def _virtual_device(out):
+    return 1 if any(v in out.lower() for v in ["vmware", "virtual", "qemu", "kvm", "hyper-v"]) else 0
+
+
+for _probe in [
+    Probe("GuestUser", "command", ["net", "user", "Guest"], _guest_user, "Unknown", "Disabled"),
+    Probe("GuestGroup", "command", ["net", "localgroup", "Guests"], _guest_group, "Unknown", "NoMembers"),
+    Probe("BitLocker", "command", ["manage-bde", "-status", "C:"], _bitlocker, "Unknown", "Enabled"),
+    Probe("PasswordLength", "command", ["net", "accounts"], _password_length, "0", ">=8"),
+    Probe("FIPS", "registry", ("HKEY_LOCAL_MACHINE", r"SYSTEM\CurrentControlSet\Control\Lsa\FipsAlgorithmPolicy", "Enabled"),
+          _enabled_if_one, "Disabled", "Enabled"),
+    Probe("TPM", "powershell", "(Get-Tpm).TpmPresent",
+          lambda out: "Enabled" if "True" in out else "Disabled", "Unknown", "Enabled"),
+    Probe("SmartScreen", "registry", ("HKEY_LOCAL_MACHINE", r"SOFTWARE\Microsoft\Windows\CurrentVersion\Explorer", "SmartScreenEnabled"),
+          _smartscreen, "Disabled", "Enabled"),
+    Probe("UAC", "registry", ("HKEY_LOCAL_MACHINE", r"SOFTWARE\Microsoft\Windows\CurrentVersion\Policies\System", "EnableLUA"),
+          _enabled_if_one, "Disabled", "Enabled"),
+    Probe("AutoPlay", "registry", ("HKEY_CURRENT_USER", r"Software\Microsoft\Windows\CurrentVersion\Explorer\AutoplayHandlers", "DisableAutoplay"),
+          _autoplay, "Enabled", "Disabled"),
+    Probe("AVProductsInstalled", "powershell", "(Get-MpComputerStatus).AntivirusEnabled", _true_flag, 0),
+    Probe("Census_IsSecureBootEnabled", "powershell", "Confirm-SecureBootUEFI", _true_flag, 0),
+    Probe("Census_IsVirtualDevice", "powershell", "(Get-WmiObject Win32_ComputerSystem).Model", _virtual_device, 0),
+]:
+    register(_probe)
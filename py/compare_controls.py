@@ -1,11 +1,59 @@
 import os
 import json
+import logging
+from dataclasses import asdict, dataclass, field
+from audit_log import CONTROLS_PATH, DEFAULT_LOG_PATH, read_latest_block, rotated_segments
+from control_store import get_control_store
+from metrics import counter, stage
+from policy_engine import get_policy_engine
 from risk_assisment_modified import (
     classify_risk,
     refine_user_software,
     save_installed_software_to_file
 )
 
+log = logging.getLogger("iepis.compliance")
+RISK_FALLBACKS = counter("iepis_risk_fallbacks_total", "System risk assumed to be Medium", ("reason",))
+
+# Reuse software_list.txt for this many seconds before re-running the
+# PowerShell inventory (0, the default = refresh on every call)
+INVENTORY_MAX_AGE = float(os.getenv("IEPIS_INVENTORY_MAX_AGE", "0"))
+SOFTWARE_LIST = os.getenv("IEPIS_SOFTWARE_LIST", "software_list.txt")
+
+
+@dataclass(frozen=True)
+class SystemRisk:
+    """GPT-derived system risk; fallback is True when Medium was assumed"""
+    level: str
+    fallback: bool = False
+    detail: str = ""
+
+
+@dataclass(frozen=True)
+class Mismatch:
+    """One control whose actual value does not meet the policy"""
+    setting: str
+    actual: str
+    expected: str
+
+    def to_dict(self):
+        return asdict(self)
+
+
+@dataclass
+class ComplianceReport:
+    """Combined result of the risk, audit log and policy steps"""
+    system_risk: str
+    mismatches: list = field(default_factory=list)
+    parsed_settings: dict = field(default_factory=dict)
+
+    def to_dict(self):
+        return {
+            "system_risk": self.system_risk,
+            "mismatches": [m.to_dict() for m in self.mismatches],
+            "parsed_settings": self.parsed_settings
+        }
+
 
 def check_compliance(actual, expected):
     """Check if actual value meets expected requirement"""
@@ -20,65 +68,68 @@ def check_compliance(actual, expected):
         return False
 
 
-def get_system_risk_level():
+def get_system_risk_level() -> SystemRisk:
     """Get system risk level from GPT analysis"""
     try:
-        save_installed_software_to_file("software_list.txt")
-        refined_list = refine_user_software("software_list.txt")
-        risk_level = classify_risk(refined_list).strip().capitalize()
-        return risk_level if risk_level in ["Low", "Medium", "High"] else "Medium"
+        save_installed_software_to_file(SOFTWARE_LIST, max_age=INVENTORY_MAX_AGE)
     except Exception as e:
-        print(f"Warning: Could not get system risk assessment: {e}")
-        return "Medium"  # default fallback
+        RISK_FALLBACKS.labels("gpt_error").inc()
+        log.warning("Could not get system risk assessment: %s", e)
+        return SystemRisk("Medium", fallback=True, detail=str(e))
+    return system_risk_from_inventory(SOFTWARE_LIST)
 
 
-def parse_audit_log():
-    """Parse the latest audit log entries to get actual settings"""
-    logfile = r"C:\SecurityDataset\security_audit_log.txt"
+def system_risk_from_inventory(path=SOFTWARE_LIST) -> SystemRisk:
+    """GPT risk level for an already saved software list"""
+    try:
+        refined_list = refine_user_software(path)
+        return risk_from_label(classify_risk(refined_list))
+    except Exception as e:
+        RISK_FALLBACKS.labels("gpt_error").inc()
+        log.warning("Could not get system risk assessment: %s", e)
+        return SystemRisk("Medium", fallback=True, detail=str(e))  # default fallback
+
+
+def risk_from_label(label) -> SystemRisk:
+    """SystemRisk for a GPT classification answer; Medium if it is not a tier"""
+    risk_level = label.strip().capitalize()
+    if risk_level in ["Low", "Medium", "High"]:
+        return SystemRisk(risk_level)
+    RISK_FALLBACKS.labels("unexpected_label").inc()
+    log.warning("Unexpected risk label %r, assuming Medium", risk_level)
+    return SystemRisk("Medium", fallback=True, detail=f"unexpected label '{risk_level}'")
+
+
+@stage("audit_parse")
+def parse_audit_log(device=None) -> dict:
+    """Parse the latest audit log entries into a {setting: actual} dict.
+
+    With a device name, the latest snapshot for that device is read from
+    the indexed control store instead of the shared text log.
+    """
+    if device is not None:
+        snapshot = get_control_store().latest(device)
+        if snapshot is None:
+            raise LookupError(f"No control snapshot for device '{device}'")
+        return {key: str(value) for key, value in snapshot.controls.items()}
+
+    logfile = DEFAULT_LOG_PATH
     
-    if not os.path.exists(logfile):
+    if not os.path.exists(logfile) and not rotated_segments(logfile):
         raise FileNotFoundError("Audit log not found")
 
-    with open(logfile, "r") as f:
-        lines = [line.strip() for line in f if line.strip() and not line.startswith("===")]
-
-    if not lines:
+    # Only the newest timestamp block is read, seeking back from the end
+    latest_entries = read_latest_block(logfile)
+    if not latest_entries:
         raise ValueError("No data in audit log")
 
-    # Get the most recent timestamp entries
-    latest_timestamp = None
-    latest_entries = []
-    
-    for line in reversed(lines):
-        parts = line.split()
-        if len(parts) >= 7:  # Need at least 7 parts for complete log entry
-            timestamp = f"{parts[0]} {parts[1]}"
-            if latest_timestamp is None:
-                latest_timestamp = timestamp
-                
-            if timestamp == latest_timestamp:
-                latest_entries.insert(0, line)  # Insert at beginning to maintain order
-            else:
-                break  # We've found all entries for the latest timestamp
-
     # Parse entries into settings dictionary
     actual_settings = {}
-    for line in latest_entries:
-        try:
-            parts = line.split()
-            if len(parts) >= 7:
-                # Correct parsing based on your log format:
-                # parts[0] = Date, parts[1] = Time, parts[2] = Device
-                # parts[3] = Setting name, parts[4] = Actual value, parts[5] = Expected, parts[6] = Compliant
-                setting = parts[3]    # Setting name (e.g., "GuestUser")
-                actual = parts[4]     # Actual value (e.g., "Disabled")
-                actual_settings[setting] = actual
-        except Exception as e:
-            print(f"Warning: Could not parse line: {line}, Error: {e}")
-            continue
+    for timestamp, device, setting, actual, expected, compliant in latest_entries:
+        actual_settings[setting] = actual
 
     # Also read from latest_controls.json for additional settings
-    json_path = r"C:\SecurityDataset\latest_controls.json"
+    json_path = CONTROLS_PATH
     if os.path.exists(json_path):
         try:
             with open(json_path, "r") as f:
@@ -89,48 +140,14 @@ def parse_audit_log():
                 if key not in actual_settings:
                     actual_settings[key] = str(value)
         except Exception as e:
-            print(f"Warning: Could not read JSON file: {e}")
+            log.warning("Could not read JSON file: %s", e)
 
     return actual_settings
 
 
 def get_risk_policy():
-    """Define security policies for different risk levels"""
-    return {
-        "Low": {
-            "GuestUser": "Disabled",
-            "GuestGroup": "NoMembers", 
-            "BitLocker": "Disabled",
-            "PasswordLength": ">=8",
-            "FIPS": "Disabled",
-            "TPM": "Disabled",
-            "SmartScreen": "Enabled",
-            "UAC": "Enabled",
-            "AutoPlay": "Enabled"
-        },
-        "Medium": {
-            "GuestUser": "Disabled",
-            "GuestGroup": "NoMembers",
-            "BitLocker": "Enabled", 
-            "PasswordLength": ">=12",
-            "FIPS": "Disabled",
-            "TPM": "Enabled",
-            "SmartScreen": "Enabled",
-            "UAC": "Enabled",
-            "AutoPlay": "Disabled"
-        },
-        "High": {
-            "GuestUser": "Disabled",
-            "GuestGroup": "NoMembers",
-            "BitLocker": "Enabled",
-            "PasswordLength": ">=16", 
-            "FIPS": "Enabled",
-            "TPM": "Enabled",
-            "SmartScreen": "Disabled",
-            "UAC": "Disabled",
-            "AutoPlay": "Disabled"
-        }
-    }
+    """Security policies for different risk levels (from policies.json)"""
+    return get_policy_engine().policies
 
 
 def calculate_final_score(system_risk, ml_risk, mismatches, total_controls):
@@ -160,43 +177,35 @@ def calculate_final_score(system_risk, ml_risk, mismatches, total_controls):
     return int(final_score)
 
 
-def compare_with_policy(actual_settings, system_risk):
-    """Compare actual settings with policy requirements"""
-    risk_policy = get_risk_policy()
-    expected_settings = risk_policy[system_risk]
-    
-    mismatches = []
-    for setting, expected_value in expected_settings.items():
-        actual_value = actual_settings.get(setting, "Missing")
-        if not check_compliance(actual_value, expected_value):
-            mismatches.append({
-                "setting": setting,
-                "actual": actual_value,
-                "expected": expected_value
-            })
-    
-    return mismatches
+@stage("policy")
+def compare_with_policy(actual_settings, system_risk) -> list:
+    """Compare actual settings with policy requirements, returning Mismatch items"""
+    return [
+        Mismatch(setting, actual_value, expected_value)
+        for setting, actual_value, expected_value in get_policy_engine().compare(actual_settings, system_risk)
+    ]
+
+
+def evaluate_system(device=None) -> ComplianceReport:
+    """Run the full GPT risk -> audit log -> policy comparison in-process"""
+    # Step 1: Get system risk level from GPT
+    system_risk = get_system_risk_level()
+
+    # Step 2: Parse actual settings from audit log
+    actual_settings = parse_audit_log(device)
+
+    # Step 3: Compare with policy
+    mismatches = compare_with_policy(actual_settings, system_risk.level)
+
+    return ComplianceReport(system_risk.level, mismatches, actual_settings)
 
 
 if __name__ == "__main__":
+    from log_config import setup_logging
+    setup_logging()
     try:
-        # Step 1: Get system risk level from GPT
-        system_risk = get_system_risk_level()
-        
-        # Step 2: Parse actual settings from audit log
-        actual_settings = parse_audit_log()
-        
-        # Step 3: Compare with policy
-        mismatches = compare_with_policy(actual_settings, system_risk)
-        
-        # Step 4: Output result as JSON only
-        result = {
-            "system_risk": system_risk,
-            "mismatches": mismatches,
-            "parsed_settings": actual_settings
-        }
-        
-        print(json.dumps(result, indent=2))
+        # Output result as JSON only
+        print(json.dumps(evaluate_system().to_dict(), indent=2))
         
     except Exception as e:
         print(json.dumps({"error": f"Script execution failed: {str(e)}"}))
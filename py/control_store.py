@@ -0,0 +1,178 @@
+"""Indexed multi-device store for control snapshots.
+
+Snapshots are appended to a SQLite database in WAL mode, keyed by
+(device, timestamp). WAL lets many collectors write while the scoring API
+keeps reading. A small ``latest`` table is kept up to date on insert, so
+"latest snapshot per device" never scans the history.
+
+Usage:
+
+    python control_store.py import C:\\SecurityDataset\\security_audit_log.txt
+    python control_store.py latest [DEVICE]
+"""
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import threading
+from typing import NamedTuple
+
+from audit_log import LOG_DIR, parse_line, rotated_segments
+
+DEFAULT_STORE_PATH = os.getenv("IEPIS_CONTROL_STORE", os.path.join(LOG_DIR, "controls.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    device   TEXT NOT NULL,
+    ts       TEXT NOT NULL,
+    controls TEXT NOT NULL,
+    PRIMARY KEY (device, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS latest (
+    device TEXT PRIMARY KEY,
+    ts     TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class Snapshot(NamedTuple):
+    device: str
+    timestamp: str  # "YYYY-MM-DD HH:MM:SS", sorts chronologically as text
+    controls: dict
+
+
+class ControlStore:
+    """Append-only (device, timestamp) -> controls store on SQLite WAL"""
+
+    def __init__(self, path=DEFAULT_STORE_PATH, busy_timeout=5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        # sqlite3 connections must not be shared between threads, nor with
+        # a forked worker (which inherits the forking thread's local)
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def insert(self, device, timestamp, controls):
+        return self.insert_many([(device, timestamp, controls)])
+
+    def insert_many(self, rows):
+        """Insert (device, timestamp, controls) rows in one transaction.
+
+        Existing (device, timestamp) keys are left untouched, so re-importing
+        the same log is a no-op. Returns the number of new snapshots.
+        """
+        rows = [(d, ts, json.dumps(c, sort_keys=True)) for d, ts, c in rows]
+        if not rows:
+            return 0
+        db = self._connect()
+        with db:
+            before = db.total_changes
+            db.executemany("INSERT OR IGNORE INTO snapshots VALUES (?, ?, ?)", rows)
+            inserted = db.total_changes - before
+            db.executemany(
+                "INSERT INTO latest VALUES (?, ?) ON CONFLICT(device) "
+                "DO UPDATE SET ts = excluded.ts WHERE excluded.ts > latest.ts",
+                [(d, ts) for d, ts, _ in rows])
+        return inserted
+
+    def latest(self, device):
+        row = self._connect().execute(
+            "SELECT s.device, s.ts, s.controls FROM latest l "
+            "JOIN snapshots s ON s.device = l.device AND s.ts = l.ts WHERE l.device = ?",
+            (device,)).fetchone()
+        return Snapshot(row[0], row[1], json.loads(row[2])) if row else None
+
+    def latest_per_device(self):
+        rows = self._connect().execute(
+            "SELECT s.device, s.ts, s.controls FROM latest l "
+            "JOIN snapshots s ON s.device = l.device AND s.ts = l.ts ORDER BY l.device")
+        return {d: Snapshot(d, ts, json.loads(c)) for d, ts, c in rows}
+
+    def range(self, device, start=None, end=None):
+        """Snapshots for device with start <= timestamp <= end, oldest first"""
+        rows = self._connect().execute(
+            "SELECT device, ts, controls FROM snapshots "
+            "WHERE device = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+            (device, start or "", end or "\uffff"))
+        return [Snapshot(d, ts, json.loads(c)) for d, ts, c in rows]
+
+    def devices(self):
+        return [d for (d,) in self._connect().execute("SELECT device FROM latest ORDER BY device")]
+
+    def import_audit_log(self, path, batch_size=1000):
+        """One-time import of a security_audit_log.txt (and its rotated segments)"""
+        total = 0
+        for segment in rotated_segments(path) + ([path] if os.path.exists(path) else []):
+            batch = []
+            for snapshot in iter_log_snapshots(segment):
+                batch.append(snapshot)
+                if len(batch) >= batch_size:
+                    total += self.insert_many(batch)
+                    batch = []
+            total += self.insert_many(batch)
+        return total
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_control_store():
+    """Process-wide ControlStore on DEFAULT_STORE_PATH, opened on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ControlStore()
+    return _store
+
+
+def iter_log_snapshots(path):
+    """Group a text audit log into (device, timestamp, {setting: actual}) runs"""
+    opener = gzip.open if path.endswith(".gz") else open
+    key, controls = None, {}
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            entry = parse_line(line.strip())
+            if entry is None:
+                continue
+            timestamp, device, setting, actual = entry[:4]
+            if (device, timestamp) != key:
+                if key is not None:
+                    yield key[0], key[1], controls
+                key, controls = (device, timestamp), {}
+            controls[setting] = actual
+    if key is not None:
+        yield key[0], key[1], controls
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IEPIS control snapshot store")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="import text audit logs")
+    imp.add_argument("logs", nargs="+")
+    show = sub.add_parser("latest", help="print the latest snapshot per device")
+    show.add_argument("device", nargs="?")
+    args = parser.parse_args()
+
+    store = ControlStore(args.store)
+    if args.command == "import":
+        for log in args.logs:
+            print(f"✅ Imported {store.import_audit_log(log)} snapshots from {log}")
+    elif args.device:
+        snapshot = store.latest(args.device)
+        print(json.dumps(snapshot._asdict() if snapshot else None, indent=2))
+    else:
+        print(json.dumps({d: s._asdict() for d, s in store.latest_per_device().items()}, indent=2))
@@ -0,0 +1,35 @@
+"""Collect controls and score them once, printing the combined result as JSON.
+
+Command line twin of POST /api/evaluate_all:
+
+    python evaluate_all.py              # collect, assess, score
+    python evaluate_all.py --no-collect # score the last latest_controls.json
+
+Logs go to stderr, so stdout is exactly one JSON document.
+"""
+import argparse
+import json
+import sys
+
+from ml_model_api import create_app, evaluate_all
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--no-collect", action="store_true", help="don't run the control collectors")
+    args = parser.parse_args(argv)
+
+    app = create_app({"MODEL_LOAD": "eager", "MODEL_POLL_SECONDS": 0})
+    with app.app_context():
+        loaded = app.extensions["iepis_model"].wait()
+        try:
+            result = evaluate_all(loaded, collect=not args.no_collect)
+        except Exception as e:
+            print(json.dumps({"error": "Evaluation failed", "detail": str(e)}))
+            return 1
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""Precompiled feature encoder for the TabNet risk model.
+
+``tabnet_encoders.pkl`` holds one sklearn ``LabelEncoder`` per categorical
+column. Calling ``transform`` once per value is slow, so the encoders are
+compiled once into plain lookup tables and whole batches of control
+snapshots are encoded into a float32 matrix: each column is factorized,
+every distinct value is encoded once and the codes gather the result.
+
+Encoding rules (identical to the original per-value loop in
+``ml_model_api.evaluate``):
+
+* categorical column: ``"Missing"``/``"Unknown"`` -> 0, a known class ->
+  its ``LabelEncoder`` index, any unseen category -> 0
+* numerical column: ``"Missing"``/``"Unknown"`` -> 0.0, otherwise
+  ``float(value)``, and 0 if the value cannot be converted
+
+Run ``python feature_encoder.py --check`` to compare against the
+``LabelEncoder.transform`` reference.
+"""
+import argparse
+from collections import Counter
+
+import numpy as np
+
+from metrics import counter
+
+ENCODER_FALLBACKS = counter("iepis_encoder_fallbacks_total",
+                            "Feature values encoded as 0 because they were unseen or not numeric", ("column",))
+MISSING_VALUES = ("Missing", "Unknown")
+
+
+def _factorize(values, by_type=False):
+    """(distinct values, index of each value into them), one dict lookup per value.
+
+    Equal values of different types (True, 1, 1.0) share an entry unless
+    by_type is set, which categorical columns need because str() tells
+    them apart. Unhashable values (e.g. a list) get an entry each.
+    """
+    vocab = {}
+    try:
+        if by_type:
+            keys = ((v.__class__, v) for v in values)
+        else:
+            keys = values
+        codes = np.fromiter((vocab.setdefault(k, len(vocab)) for k in keys), dtype=np.intp, count=len(values))
+    except TypeError:
+        vocab = {}
+        codes = np.fromiter((vocab.setdefault(_hashable_key(v), len(vocab)) for v in values),
+                            dtype=np.intp, count=len(values))
+        first = np.unique(codes, return_index=True)[1]
+        return [values[i] for i in first], codes
+    return [k[1] for k in vocab] if by_type else list(vocab), codes
+
+
+def _hashable_key(value):
+    try:
+        key = (value.__class__, value)
+        hash(key)
+        return key
+    except TypeError:
+        return (value.__class__, id(value))
+
+
+def _occurrences(codes, flagged):
+    """How many of the encoded values map to a flagged distinct value"""
+    return int(np.count_nonzero(flagged[codes])) if flagged.any() else 0
+
+
+class FeatureEncoder:
+    """Lookup-table encoder compiled from a dict of fitted LabelEncoders"""
+
+    def __init__(self, columns, encoders):
+        self.columns = list(columns)
+        self.tables = {}
+        for col in self.columns:
+            encoder = encoders.get(col)
+            if encoder and hasattr(encoder, 'transform'):
+                classes = [str(c) for c in encoder.classes_]
+                self.tables[col] = {c: float(i) for i, c in enumerate(classes)}
+        # Values that fell back to 0, per column (unseen categories / bad numbers)
+        self.fallbacks = Counter()
+
+    @classmethod
+    def from_file(cls, path, columns):
+        import joblib
+        return cls(columns, joblib.load(path))
+
+    def is_categorical(self, col):
+        return col in self.tables
+
+    def _encode_categorical(self, col, values):
+        table = self.tables[col]
+        uniques, codes = _factorize(values)
+        if not all(isinstance(value, str) for value in uniques):
+            uniques, codes = _factorize(values, by_type=True)
+        lut = np.zeros(len(uniques), dtype=np.float32)
+        unseen = np.zeros(len(uniques), dtype=bool)
+        for k, value in enumerate(uniques):
+            if value == "Missing" or value == "Unknown":
+                continue
+            code = table.get(str(value))
+            if code is None:
+                unseen[k] = True
+            else:
+                lut[k] = code
+        return lut[codes], _occurrences(codes, unseen)
+
+    @staticmethod
+    def _encode_numeric(values):
+        if isinstance(values, np.ndarray) and values.dtype.kind in "biuf":
+            return values.astype(np.float32), 0
+        uniques, codes = _factorize(values)
+        lut = np.zeros(len(uniques), dtype=np.float32)
+        invalid = np.zeros(len(uniques), dtype=bool)
+        for k, value in enumerate(uniques):
+            if value == "Missing" or value == "Unknown":
+                continue
+            try:
+                lut[k] = float(value)
+            except (TypeError, ValueError):
+                invalid[k] = True
+        return lut[codes], _occurrences(codes, invalid)
+
+    def encode(self, snapshots):
+        """Encode a list of control dicts into an N x len(columns) float32 matrix"""
+        return self.encode_columns(
+            {col: [data.get(col, "Missing") for data in snapshots] for col in self.columns}, len(snapshots)
+        )
+
+    def encode_columns(self, columns, n):
+        """Encode {column: sequence of n values}; absent columns are "Missing" """
+        X = np.zeros((n, len(self.columns)), dtype=np.float32)
+        for j, col in enumerate(self.columns):
+            values = columns[col] if col in columns else ["Missing"] * n
+            if col in self.tables:
+                X[:, j], failed = self._encode_categorical(col, values)
+            else:
+                X[:, j], failed = self._encode_numeric(values)
+            if failed:
+                self.fallbacks[col] += failed
+                ENCODER_FALLBACKS.labels(col).inc(failed)
+        return X
+
+    def encode_one(self, data):
+        """Encode a single control dict into a feature vector (list of floats)"""
+        return self.encode([data])[0].tolist()
+
+
+def reference_encode(data, columns, encoders):
+    """Original per-value encoding loop, kept as the parity reference"""
+    feature_vector = []
+    for col in columns:
+        value = data.get(col, "Missing")
+        encoder = encoders.get(col)
+        try:
+            if encoder and hasattr(encoder, 'transform'):
+                if value == "Missing" or value == "Unknown":
+                    encoded_value = 0
+                else:
+                    encoded_value = encoder.transform([str(value)])[0]
+            else:
+                encoded_value = float(value) if value not in ["Missing", "Unknown"] else 0.0
+        except Exception:
+            encoded_value = 0
+        feature_vector.append(encoded_value)
+    return [float(x) for x in feature_vector]
+
+
+# Mixed-type values the parity check draws from: classes, near-misses,
+# numbers as strings and numbers, bools, None and unhashables
+CHECK_VALUES = (
+    "Enabled", "Disabled", "Missing", "Unknown", "enabled", "", "On",
+    "0", "1", "12", " 3 ", "1.5", "nan", "abc", 0, 1, 7, 2.5, True, False,
+    None, [1], {"a": 1},
+)
+
+
+def random_snapshots(columns, n, seed=0):
+    """n control dicts with values drawn from CHECK_VALUES (10% of keys absent)"""
+    rng = np.random.default_rng(seed)
+    snapshots = []
+    for _ in range(n):
+        data = {}
+        for col in columns:
+            if rng.random() < 0.9:
+                data[col] = CHECK_VALUES[rng.integers(len(CHECK_VALUES))]
+        snapshots.append(data)
+    return snapshots
+
+
+def check_parity(columns, encoders, n=2000, seed=0):
+    """Compare FeatureEncoder against reference_encode on random snapshots"""
+    snapshots = random_snapshots(columns, n, seed)
+
+    expected = np.array(
+        [reference_encode(d, columns, encoders) for d in snapshots], dtype=np.float32
+    )
+    actual = FeatureEncoder(columns, encoders).encode(snapshots)
+    return np.array_equal(expected, actual, equal_nan=True), expected, actual
+
+
+if __name__ == "__main__":
+    import warnings
+
+    import joblib
+    from ml_model_api import TABNET_FEATURE_COLUMNS
+
+    parser = argparse.ArgumentParser(description="Check FeatureEncoder parity")
+    parser.add_argument("--check", action="store_true", help="run the parity check")
+    parser.add_argument("--encoders", default="tabnet_encoders.pkl")
+    parser.add_argument("--rows", type=int, default=2000)
+    args = parser.parse_args()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        encoders = joblib.load(args.encoders)
+        ok, expected, actual = check_parity(TABNET_FEATURE_COLUMNS, encoders, args.rows)
+
+    if not ok:
+        bad = np.argwhere(expected != actual)
+        print(f"❌ Parity check failed on {len(bad)} cells, first: {bad[:5].tolist()}")
+        raise SystemExit(1)
+    print(f"✅ FeatureEncoder matches LabelEncoder.transform on {args.rows} snapshots")
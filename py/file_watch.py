@@ -0,0 +1,169 @@
+"""Wait for changes to a handful of files.
+
+``make_watcher(paths)`` returns an ``InotifyWatcher`` on Linux (inotify
+through ctypes, no extra packages) and a ``PollingWatcher`` everywhere
+else, or when inotify is unavailable. Both have the same interface::
+
+    watcher = make_watcher([controls_path, software_list_path])
+    changed = watcher.wait(timeout=300)   # set of changed paths, empty on timeout
+    watcher.wake()                        # from another thread: return from wait() now
+    watcher.close()
+
+inotify watches the parent directories, so files that are replaced with
+os.replace() or created later are still noticed.
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+log = logging.getLogger("iepis.watch")
+
+POLL_SECONDS = float(os.getenv("IEPIS_WATCH_POLL_SECONDS", "1"))
+DEBOUNCE_SECONDS = float(os.getenv("IEPIS_WATCH_DEBOUNCE_SECONDS", "0.2"))
+
+
+def file_signature(path):
+    """(mtime, size, inode) of path, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size, st.st_ino
+    except OSError:
+        return None
+
+
+class PollingWatcher:
+    """Compares mtime, size and inode of every path every poll seconds"""
+
+    kind = "polling"
+
+    def __init__(self, paths, poll=POLL_SECONDS, debounce=DEBOUNCE_SECONDS):
+        self.paths = [os.path.abspath(p) for p in paths]
+        self.poll, self.debounce = poll, debounce
+        self._seen = {p: file_signature(p) for p in self.paths}
+        self._wake = threading.Event()
+
+    def _changed(self):
+        changed = set()
+        for path in self.paths:
+            signature = file_signature(path)
+            if signature != self._seen[path]:
+                self._seen[path] = signature
+                changed.add(path)
+        return changed
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self._changed()
+            if changed:
+                # Let a burst of writes settle before reporting it
+                time.sleep(self.debounce)
+                return changed | self._changed()
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return set()
+            if self._wake.wait(self.poll if remaining is None else min(self.poll, remaining)):
+                self._wake.clear()
+                return self._changed()
+
+    def wake(self):
+        self._wake.set()
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Linux inotify on the parent directories of the watched paths"""
+
+    kind = "inotify"
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    MASK = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, paths, debounce=DEBOUNCE_SECONDS):
+        self.paths = {os.path.abspath(p) for p in paths}
+        self.debounce = debounce
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}
+        for directory in {os.path.dirname(p) for p in self.paths}:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+            self._dirs[wd] = directory
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+
+    def _read(self):
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, _, _, length = self.EVENT.unpack_from(data, offset)
+                offset += self.EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                path = os.path.join(self._dirs.get(wd, ""), os.fsdecode(name))
+                if path in self.paths:
+                    changed.add(path)
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fd, self._wake_r], [], [], remaining)
+            if not ready:
+                return set()
+            if self._wake_r in ready:
+                self._drain_wake()
+                return self._read()
+            changed = self._read()
+            if changed:
+                time.sleep(self.debounce)
+                return changed | self._read()
+
+    def _drain_wake(self):
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def wake(self):
+        try:
+            os.write(self._wake_w, b"w")
+        except BlockingIOError:
+            pass  # a wake-up is already pending
+
+    def close(self):
+        if self.fd >= 0:
+            for fd in (self.fd, self._wake_r, self._wake_w):
+                os.close(fd)
+            self.fd = -1
+
+
+def make_watcher(paths, poll=POLL_SECONDS):
+    """inotify on Linux, polling elsewhere or when inotify fails"""
+    for path in paths:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as e:
+            log.warning("⚠️ inotify unavailable (%s), polling every %ss", e, poll)
+    return PollingWatcher(paths, poll)
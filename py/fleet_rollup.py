@@ -0,0 +1,410 @@
+"""Fleet compliance rollups, updated incrementally as results arrive.
+
+``FleetRollup`` keeps the latest result of every host and a few NumPy
+counters over them, so fleet-wide questions are answered without scanning
+per-host results:
+
+* hosts per system risk tier
+* mismatches per control and tier (tiers x controls)
+* hosts by number of mismatched controls per tier (tiers x controls + 1)
+* final_score distribution per tier (tiers x 101 bins, exact quantiles)
+* (system_risk, ml_risk) pair counts, the cells of RISK_ALIGNMENT_SCORES
+* time-bucketed trends (results, mean score, mismatches) in a ring of
+  ``ROLLUP_BUCKETS`` buckets of ``ROLLUP_BUCKET_SECONDS``
+
+A host evaluated again replaces its previous contribution; its last tier,
+ML risk, score and mismatch row live in growable arrays indexed by a
+per-host slot. Trends count every result as it arrives. Queries cost
+O(tiers x controls + 101) whatever the fleet size.
+
+    python fleet_rollup.py results.ndjson    # output of ndjson_stream.py
+    python fleet_rollup.py scores/           # parts written by iepis_score.py
+    python fleet_rollup.py --check           # compare against a brute-force recount
+"""
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+ROLLUP_BUCKET_SECONDS = int(os.getenv("IEPIS_ROLLUP_BUCKET_SECONDS", "3600"))
+ROLLUP_BUCKETS = int(os.getenv("IEPIS_ROLLUP_BUCKETS", "168"))  # one week of hours
+
+TIERS = ("Low", "Medium", "High")
+SCORE_BINS = 101  # final_score is an int in 0..100
+
+
+class FleetRollup:
+    def __init__(self, controls=None, bucket_seconds=ROLLUP_BUCKET_SECONDS, buckets=ROLLUP_BUCKETS):
+        if controls is None:
+            from policy_engine import get_policy_engine
+            controls = get_policy_engine().controls
+        self.controls = list(controls)
+        self.control_index = {c: i for i, c in enumerate(self.controls)}
+        self.tier_index = {t: i for i, t in enumerate(TIERS)}
+        self.bucket_seconds = bucket_seconds
+        n_tiers, n_controls = len(TIERS), len(self.controls)
+
+        # Fleet aggregates over the latest result per host
+        self.tier_hosts = np.zeros(n_tiers, dtype=np.int64)
+        self.control_mismatches = np.zeros((n_tiers, n_controls), dtype=np.int64)
+        self.mismatch_counts = np.zeros((n_tiers, n_controls + 1), dtype=np.int64)
+        self.scores = np.zeros((n_tiers, SCORE_BINS), dtype=np.int64)
+        self.pairs = np.zeros((n_tiers, n_tiers), dtype=np.int64)
+
+        # Latest result per host, one slot each
+        self.slots = {}
+        self._tier = np.zeros(1024, dtype=np.int8)
+        self._ml = np.zeros(1024, dtype=np.int8)
+        self._score = np.zeros(1024, dtype=np.int16)
+        self._mask = np.zeros((1024, n_controls), dtype=bool)
+
+        # Trend ring: bucket number -> position bucket % buckets
+        self.bucket_ids = np.full(buckets, -1, dtype=np.int64)
+        self.bucket_results = np.zeros(buckets, dtype=np.int64)
+        self.bucket_score_sum = np.zeros(buckets, dtype=np.int64)
+        self.bucket_mismatches = np.zeros(buckets, dtype=np.int64)
+
+        self.results = 0
+        self.skipped = 0  # error records and unknown risk labels
+        self._lock = threading.Lock()
+
+    # === Updates ===
+    def _slots_for(self, hosts):
+        slots = np.empty(len(hosts), dtype=np.intp)
+        fresh = np.zeros(len(hosts), dtype=bool)
+        for i, host in enumerate(hosts):
+            slot = self.slots.get(host)
+            if slot is None:
+                slot = self.slots[host] = len(self.slots)
+                fresh[i] = True
+            slots[i] = slot
+        capacity = len(self._tier)
+        if len(self.slots) > capacity:
+            size = max(len(self.slots), 2 * capacity)
+            self._tier = np.resize(self._tier, size)
+            self._ml = np.resize(self._ml, size)
+            self._score = np.resize(self._score, size)
+            self._mask = np.resize(self._mask, (size, len(self.controls)))
+        return slots, fresh
+
+    def _apply(self, tier, ml, score, mask, sign):
+        np.add.at(self.tier_hosts, tier, sign)
+        np.add.at(self.control_mismatches, tier, sign * mask.astype(np.int64))
+        np.add.at(self.mismatch_counts, (tier, mask.sum(axis=1)), sign)
+        np.add.at(self.scores, (tier, score), sign)
+        np.add.at(self.pairs, (tier, ml), sign)
+
+    def add_columns(self, hosts, system_risk, ml_risk, final_score, mismatch_mask, at=None):
+        """Add a batch of results given as columns.
+
+        system_risk / ml_risk are tier indices (0 = Low), final_score ints
+        and mismatch_mask a bool array of hosts x self.controls. at is the
+        arrival time in epoch seconds, one per result or one for all.
+        """
+        system_risk = np.asarray(system_risk, dtype=np.intp)
+        ml_risk = np.asarray(ml_risk, dtype=np.intp)
+        final_score = np.clip(np.asarray(final_score, dtype=np.intp), 0, SCORE_BINS - 1)
+        mismatch_mask = np.asarray(mismatch_mask, dtype=bool)
+        n = len(hosts)
+        if n == 0:
+            return
+        # Every result counts in the trend, even a host repeated within the batch
+        trend_scores, trend_mismatches = final_score, mismatch_mask.sum(axis=1)
+        with self._lock:
+            # A host repeated within the batch counts with its last result
+            last = {host: i for i, host in enumerate(hosts)}
+            if len(last) < n:
+                keep = np.fromiter(sorted(last.values()), dtype=np.intp, count=len(last))
+                hosts = [hosts[i] for i in keep]
+                system_risk, ml_risk, final_score = system_risk[keep], ml_risk[keep], final_score[keep]
+                mismatch_mask = mismatch_mask[keep]
+
+            slots, fresh = self._slots_for(hosts)
+            old = slots[~fresh]
+            if len(old):
+                self._apply(self._tier[old].astype(np.intp), self._ml[old].astype(np.intp),
+                            self._score[old].astype(np.intp), self._mask[old], -1)
+            self._apply(system_risk, ml_risk, final_score, mismatch_mask, 1)
+            self._tier[slots], self._ml[slots], self._score[slots] = system_risk, ml_risk, final_score
+            self._mask[slots] = mismatch_mask
+            self.results += n
+            # Only once the host tables took the batch, so both always agree
+            self._add_trend(time.time() if at is None else at, trend_scores, trend_mismatches)
+
+    def _add_trend(self, at, final_score, mismatch_counts):
+        bucket = (np.broadcast_to(np.asarray(at, dtype=np.float64), final_score.shape)
+                  // self.bucket_seconds).astype(np.int64)
+        ring = len(self.bucket_ids)
+        for b in np.unique(bucket):
+            pos = b % ring
+            if self.bucket_ids[pos] > b:
+                continue  # older than the ring keeps
+            if self.bucket_ids[pos] != b:
+                self.bucket_ids[pos] = b
+                self.bucket_results[pos] = self.bucket_score_sum[pos] = self.bucket_mismatches[pos] = 0
+            rows = bucket == b
+            self.bucket_results[pos] += int(rows.sum())
+            self.bucket_score_sum[pos] += int(final_score[rows].sum())
+            self.bucket_mismatches[pos] += int(mismatch_counts[rows].sum())
+
+    def add(self, results, at=None):
+        """Add evaluate_batch style result dicts.
+
+        Error records and results without a host name (a non-empty string)
+        are skipped.
+        """
+        hosts, tiers, ml, scores, rows = [], [], [], [], []
+        skipped = 0
+        for result in results:
+            if not isinstance(result, dict) or "error" in result:
+                skipped += 1
+                continue
+            tier = self.tier_index.get(result.get("system_risk"))
+            ml_risk = self.tier_index.get(result.get("ml_risk"))
+            host = result.get("host")
+            if tier is None or ml_risk is None or not isinstance(host, str) or not host:
+                skipped += 1
+                continue
+            hosts.append(result["host"])
+            tiers.append(tier)
+            ml.append(ml_risk)
+            scores.append(result["final_score"])
+            rows.append([self.control_index[m["setting"]] for m in result.get("mismatches", ())
+                         if m["setting"] in self.control_index])
+        mask = np.zeros((len(hosts), len(self.controls)), dtype=bool)
+        for i, row in enumerate(rows):
+            mask[i, row] = True
+        self.add_columns(hosts, tiers, ml, scores, mask, at)
+        with self._lock:
+            self.skipped += skipped
+        return len(hosts)
+
+    # === Queries ===
+    def _tier_rows(self, tier):
+        return slice(None) if tier is None else slice(self.tier_index[tier], self.tier_index[tier] + 1)
+
+    def host_count(self, tier=None):
+        return int(self.tier_hosts[self._tier_rows(tier)].sum())
+
+    def mismatch_rates(self, tier=None):
+        """Share of hosts failing each control"""
+        rows = self._tier_rows(tier)
+        hosts = self.tier_hosts[rows].sum()
+        counts = self.control_mismatches[rows].sum(axis=0)
+        return {c: (int(n) / hosts if hosts else 0.0) for c, n in zip(self.controls, counts)}
+
+    def score_histogram(self, tier=None):
+        return self.scores[self._tier_rows(tier)].sum(axis=0)
+
+    def score_quantile(self, q, tier=None):
+        """Exact final_score quantile (lower), or None without hosts"""
+        histogram = self.score_histogram(tier)
+        total = histogram.sum()
+        if not total:
+            return None
+        rank = min(total - 1, int(q * (total - 1)))
+        return int(np.searchsorted(np.cumsum(histogram), rank, side="right"))
+
+    def mean_score(self, tier=None):
+        histogram = self.score_histogram(tier)
+        total = histogram.sum()
+        return float(histogram @ np.arange(SCORE_BINS)) / total if total else None
+
+    def alignment(self):
+        """{"system/ml": hosts} for every (system_risk, ml_risk) pair"""
+        return {f"{s}/{m}": int(self.pairs[i, j]) for i, s in enumerate(TIERS) for j, m in enumerate(TIERS)}
+
+    def trend(self, last=None):
+        """Per-bucket results, mean score and mismatches, oldest first.
+
+        last keeps the newest buckets (at least one); None keeps all.
+        """
+        order = np.argsort(self.bucket_ids)
+        order = order[self.bucket_ids[order] >= 0]
+        if last is not None:
+            order = order[-max(1, last):]
+        return [{
+            "start": int(self.bucket_ids[p]) * self.bucket_seconds,
+            "results": int(self.bucket_results[p]),
+            "mean_score": float(self.bucket_score_sum[p] / self.bucket_results[p]) if self.bucket_results[p] else None,
+            "mismatches": int(self.bucket_mismatches[p]),
+        } for p in order]
+
+    def tier_summary(self, tier):
+        with self._lock:
+            return {
+                "tier": tier,
+                "hosts": self.host_count(tier),
+                "mean_score": self.mean_score(tier),
+                "score_quantiles": {f"p{int(q * 100)}": self.score_quantile(q, tier) for q in (0.1, 0.5, 0.9)},
+                "fully_compliant_hosts": int(self.mismatch_counts[self._tier_rows(tier), 0].sum()),
+                "mismatch_rates": self.mismatch_rates(tier),
+            }
+
+    def summary(self, last=24):
+        with self._lock:
+            return {
+                "hosts": self.host_count(),
+                "results": self.results,
+                "skipped": self.skipped,
+                "hosts_by_tier": {t: int(n) for t, n in zip(TIERS, self.tier_hosts)},
+                "mean_score": self.mean_score(),
+                "score_quantiles": {f"p{int(q * 100)}": self.score_quantile(q) for q in (0.1, 0.5, 0.9)},
+                "fully_compliant_hosts": int(self.mismatch_counts[:, 0].sum()),
+                "mismatch_rates": self.mismatch_rates(),
+                "mismatch_rates_by_tier": {t: self.mismatch_rates(t) for t in TIERS},
+                "alignment": self.alignment(),
+                "trend": self.trend(last),
+            }
+
+
+# === Loading results ===
+def read_ndjson_results(path, batch=10_000):
+    """Result records of an ndjson_stream.py output file, in batches"""
+    results = []
+    with open(path, "rb") as f:
+        for line in f:
+            record = json.loads(line)
+            if "summary" in record:
+                continue
+            results.append(record)
+            if len(results) >= batch:
+                yield results
+                results = []
+    if results:
+        yield results
+
+
+def add_score_parts(rollup, directory):
+    """Feed the part files written by iepis_score.py; rows are keyed by id, else row number"""
+    import pandas as pd
+
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith("part-") or name.endswith(".tmp"):
+            continue
+        path = os.path.join(directory, name)
+        frame = pd.read_parquet(path) if name.endswith(".parquet") else pd.read_csv(path, keep_default_na=False)
+        hosts = (frame["id"] if "id" in frame else frame["row"]).astype(str).tolist()
+        mask = np.zeros((len(frame), len(rollup.controls)), dtype=bool)
+        for i, names in enumerate(frame["mismatched_controls"].astype(str)):
+            mask[i, [rollup.control_index[c] for c in names.split(",") if c in rollup.control_index]] = True
+        tiers = frame["system_risk"].map(rollup.tier_index).to_numpy()
+        ml = frame["ml_risk"].map(rollup.tier_index).to_numpy()
+        rollup.add_columns(hosts, tiers, ml, frame["final_score"].to_numpy(), mask, os.path.getmtime(path))
+
+
+# === Brute-force parity check ===
+def brute_force(latest, controls):
+    """The rollup's numbers recomputed from {host: result} by scanning every host"""
+    hosts = list(latest.values())
+    scores = sorted(r["final_score"] for r in hosts)
+    failing = {c: sum(1 for r in hosts if any(m["setting"] == c for m in r["mismatches"])) for c in controls}
+    return {
+        "hosts": len(hosts),
+        "hosts_by_tier": {t: sum(1 for r in hosts if r["system_risk"] == t) for t in TIERS},
+        "mean_score": sum(scores) / len(scores),
+        "score_quantiles": {f"p{int(q * 100)}": scores[int(q * (len(scores) - 1))] for q in (0.1, 0.5, 0.9)},
+        "fully_compliant_hosts": sum(1 for r in hosts if not r["mismatches"]),
+        "mismatch_rates": {c: n / len(hosts) for c, n in failing.items()},
+        "alignment": {f"{s}/{m}": sum(1 for r in hosts if (r["system_risk"], r["ml_risk"]) == (s, m))
+                      for s in TIERS for m in TIERS},
+    }
+
+
+def simulate(controls, hosts, batches, batch_size, seed=0):
+    """Feed random batches (hosts repeat, one error record each) into a
+    small-ring rollup; returns (rollup, latest result per host, arrivals)"""
+    import random
+
+    rng = random.Random(seed)
+    rollup = FleetRollup(controls, bucket_seconds=60, buckets=10)
+    latest, arrivals = {}, []
+    start = 1_700_000_000
+    for b in range(batches):
+        at = start + b * 30  # two batches per bucket, more batches than the ring holds
+        batch = []
+        for _ in range(batch_size):
+            mismatches = [{"setting": c} for c in controls if rng.random() < 0.3]
+            result = {"host": f"PC-{rng.randrange(hosts):06d}", "system_risk": rng.choice(TIERS),
+                      "ml_risk": rng.choice(TIERS), "final_score": rng.randint(40, 100), "mismatches": mismatches}
+            batch.append(result)
+            latest[result["host"]] = result
+            arrivals.append((at, result))
+        batch.append({"host": "PC-broken", "error": "Scoring failed"})
+        rollup.add(batch, at)
+    return rollup, latest, arrivals
+
+
+def compare(rollup, latest, arrivals, skipped):
+    """Where the rollup disagrees with a brute-force recount, as messages"""
+    problems = []
+    expected = brute_force(latest, rollup.controls)
+    actual = rollup.summary(last=None)
+    for key, value in expected.items():
+        got = actual[key]
+        if key in ("mean_score", "mismatch_rates"):
+            ok = np.allclose(list(got.values()) if isinstance(got, dict) else got,
+                             list(value.values()) if isinstance(value, dict) else value)
+        else:
+            ok = got == value
+        if not ok:
+            problems.append(f"{key}: rollup {got} vs brute force {value}")
+
+    kept = {int(b) for b in rollup.bucket_ids if b >= 0}
+    for row in actual["trend"]:
+        bucket = [r for at, r in arrivals if at // rollup.bucket_seconds * rollup.bucket_seconds == row["start"]]
+        if row["results"] != len(bucket) or row["mismatches"] != sum(len(r["mismatches"]) for r in bucket):
+            problems.append(f"trend bucket {row['start']}: {row} vs {len(bucket)} results")
+    if arrivals and len(kept) != min(len(rollup.bucket_ids), len({at // rollup.bucket_seconds for at, _ in arrivals})):
+        problems.append(f"trend ring holds {len(kept)} of {len(rollup.bucket_ids)} buckets")
+    if actual["skipped"] != skipped:
+        problems.append(f"{actual['skipped']} records skipped, expected {skipped}")
+    return problems
+
+
+def run_check(hosts, batches, batch_size, seed=0):
+    from policy_engine import get_policy_engine
+
+    controls = get_policy_engine().controls
+    rollup, latest, arrivals = simulate(controls, hosts, batches, batch_size, seed)
+    problems = compare(rollup, latest, arrivals, skipped=batches)
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        raise SystemExit(1)
+    print(f"✅ FleetRollup matches a brute-force recount ({len(latest)} hosts, {len(arrivals)} results)")
+
+    started = time.perf_counter()
+    for _ in range(100):
+        rollup.summary()
+    query = (time.perf_counter() - started) / 100
+    started = time.perf_counter()
+    brute_force(latest, controls)
+    scan = time.perf_counter() - started
+    print(f"📊 summary() {query * 1000:.2f} ms vs {scan * 1000:.1f} ms to rescan {len(latest)} hosts")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fleet compliance rollups from result files, or the parity check")
+    parser.add_argument("results", nargs="?", help="ndjson_stream.py output file or iepis_score.py output directory")
+    parser.add_argument("--check", action="store_true", help="compare the rollup against a brute-force recount")
+    parser.add_argument("--hosts", type=int, default=50_000)
+    parser.add_argument("--batches", type=int, default=40)
+    parser.add_argument("--batch-size", type=int, default=5_000)
+    args = parser.parse_args()
+
+    if args.check:
+        run_check(args.hosts, args.batches, args.batch_size)
+    elif args.results:
+        rollup = FleetRollup()
+        if os.path.isdir(args.results):
+            add_score_parts(rollup, args.results)
+        else:
+            for results in read_ndjson_results(args.results):
+                rollup.add(results)
+        print(json.dumps(rollup.summary(), indent=2))
+    else:
+        parser.error("give a results file or directory, or --check")
@@ -0,0 +1,187 @@
+"""Async GPT client for scoring many hosts at once.
+
+``AsyncGPTClient`` bounds the number of in-flight requests, throttles by
+requests and tokens per minute, retries with jittered exponential backoff
+and merges identical in-flight prompts into a single call. The network
+layer is an injectable ``transport`` coroutine, so tests and benchmarks can
+swap in a local fake instead of the OpenAI API.
+
+Example:
+
+    client = AsyncGPTClient(max_concurrency=16, rpm=500, tpm=150_000)
+    results = asyncio.run(assess_hosts({"host-a": raw_a, "host-b": raw_b}, client))
+"""
+import asyncio
+import hashlib
+import os
+import time
+
+from metrics import stage
+from software_filter import estimate_tokens
+from risk_assisment_modified import (
+    API_KEY,
+    GPT_FAILURES,
+    GPT_RETRIES,
+    MODEL,
+    SYSTEM_PROMPT,
+    backoff_delay,
+    classify_steps,
+    refine_steps
+)
+
+GPT_MAX_CONCURRENCY = int(os.getenv("IEPIS_GPT_MAX_CONCURRENCY", "8"))
+GPT_RPM = float(os.getenv("IEPIS_GPT_RPM", "500"))
+GPT_TPM = float(os.getenv("IEPIS_GPT_TPM", "150000"))
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at rate_per_minute"""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1):
+        # A request larger than the whole bucket is allowed once it is full
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def openai_transport(api_key: str = None):
+    """Transport backed by the OpenAI async client, created on first use"""
+    client = None
+
+    async def transport(messages, model):
+        nonlocal client
+        if client is None:
+            from openai import AsyncOpenAI
+            if not (api_key or API_KEY):
+                raise RuntimeError("OPENAI_API_KEY not set")
+            client = AsyncOpenAI(api_key=api_key or API_KEY)
+        r = await client.chat.completions.create(model=model, messages=messages, temperature=0)
+        return r.choices[0].message.content.strip()
+
+    return transport
+
+
+class AsyncGPTClient:
+    """Concurrency- and rate-limited GPT client with request coalescing"""
+
+    def __init__(self, transport=None, model=MODEL, max_concurrency=GPT_MAX_CONCURRENCY,
+                 rpm=GPT_RPM, tpm=GPT_TPM, tries=5, base_delay=1.0, max_delay=30.0):
+        self.transport = transport or openai_transport()
+        self.model = model
+        self.tries, self.base_delay, self.max_delay = tries, base_delay, max_delay
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._requests = TokenBucket(rpm)
+        self._tokens = TokenBucket(tpm)
+        self._inflight = {}
+        self.stats = {"calls": 0, "coalesced": 0, "retries": 0, "failures": 0}
+
+    async def complete(self, prompt: str) -> str:
+        """Answer prompt; concurrent identical prompts share one request"""
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        future = self._inflight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(self._call(prompt))
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def _call(self, prompt: str) -> str:
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        for attempt in range(self.tries):
+            try:
+                async with self._semaphore:
+                    await self._requests.acquire(1)
+                    await self._tokens.acquire(estimate_tokens(SYSTEM_PROMPT + prompt))
+                    self.stats["calls"] += 1
+                    return await self.transport(messages, self.model)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                if attempt == self.tries - 1:
+                    self.stats["failures"] += 1
+                    GPT_FAILURES.inc()
+                    raise
+                self.stats["retries"] += 1
+                GPT_RETRIES.inc()
+                await asyncio.sleep(backoff_delay(attempt, self.base_delay, self.max_delay))
+
+
+def _advance(step, *args):
+    """One generator step: (True, prompt) or (False, return value)"""
+    try:
+        return True, step(*args)
+    except StopIteration as done:
+        # A Future cannot carry StopIteration, so the result is returned instead
+        return False, done.value
+
+
+async def run_steps_async(steps, client: AsyncGPTClient):
+    """Async counterpart of risk_assisment_modified.run_steps.
+
+    The generator's own work between prompts (SQLite cache lookups, the
+    local classifier) runs on a worker thread, so it never blocks the loop.
+    """
+    running, prompt = await asyncio.to_thread(_advance, next, steps)
+    while running:
+        try:
+            answer = await client.complete(prompt)
+        except Exception as e:
+            running, prompt = await asyncio.to_thread(_advance, steps.throw, e)
+        else:
+            running, prompt = await asyncio.to_thread(_advance, steps.send, answer)
+    return prompt
+
+
+async def refine_user_software_async(raw: str, client: AsyncGPTClient, report: dict = None) -> str:
+    """Refine one host's raw software list (the text of software_list.txt)"""
+    with stage("gpt_refine"):
+        return await run_steps_async(refine_steps(raw, report), client)
+
+
+async def classify_risk_async(refined: str, client: AsyncGPTClient) -> str:
+    with stage("gpt_classify"):
+        return await run_steps_async(classify_steps(refined), client)
+
+
+async def assess_host(raw: str, client: AsyncGPTClient) -> dict:
+    prefilter = {}
+    refined = await refine_user_software_async(raw, client, prefilter)
+    risk = await classify_risk_async(refined, client)
+    return {"user_software": refined.splitlines(), "system_risk": risk, "prefilter": prefilter}
+
+
+async def assess_hosts(software_lists: dict, client: AsyncGPTClient = None) -> dict:
+    """Refine and classify {host: raw software list} concurrently.
+
+    A host whose GPT calls fail gets {"error": ...} instead of failing the
+    whole fleet.
+    """
+    client = client or AsyncGPTClient()
+    hosts = list(software_lists)
+    results = await asyncio.gather(
+        *(assess_host(software_lists[h], client) for h in hosts), return_exceptions=True
+    )
+    return {
+        host: ({"error": str(r)} if isinstance(r, Exception) else r)
+        for host, r in zip(hosts, results)
+    }
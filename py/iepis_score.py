@@ -0,0 +1,367 @@
+"""Offline bulk scoring of control datasets (iepis-score).
+
+Reads a CSV or Parquet file of control vectors (one row per endpoint,
+columns named like TABNET_FEATURE_COLUMNS plus the policy-only controls
+such as GuestGroup) in chunks, and scores every
+chunk on a process pool; each worker loads the encoders and TabNet once.
+Rows go through the same steps as /api/evaluate_batch, column-wise:
+FeatureEncoder, TabNet, PolicyEngine and the final score.
+
+    python iepis_score.py train.csv -o scores/ --workers 8
+    python iepis_score.py fleet.parquet -o scores/ --risk-column system_risk --id-column MachineIdentifier
+    ./iepis-score fleet.parquet -o scores/   # same CLI; the script can be linked onto PATH
+
+Results are written as Parquet parts, ``scores/part-000000.parquet`` and so
+on, one per input chunk (``--format csv`` for CSV parts). A part is only
+renamed into place once complete, so an interrupted run restarted with the
+same arguments skips the finished chunks. ``scores/_job.json`` records the
+arguments and ``scores/_SUCCESS`` the totals.
+
+``python iepis_score.py --check`` scores a generated CSV and compares every
+row with ``ml_model_api.evaluate_batch``.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+log = logging.getLogger("iepis.score")
+
+DEFAULT_CHUNK_ROWS = 50_000
+JOB_FILE = "_job.json"
+SUCCESS_FILE = "_SUCCESS"
+
+_worker = {}
+
+
+# === Input ===
+def _to_values(series):
+    """Column values as the API would see them in a JSON snapshot; nulls are "Missing" """
+    if series.dtype.kind == "f":  # 1.0 -> 1, so "1" and 1 encode the same
+        values = [int(v) if v.is_integer() else v for v in series.tolist()]
+    else:
+        values = series.tolist()
+    # Filled after the float normalization: a NaN makes the column float, and
+    # filling it first would turn the column into objects that skip it
+    for i in np.flatnonzero(series.isna().to_numpy()):
+        values[i] = "Missing"
+    return values
+
+
+def _frame_columns(frame, wanted):
+    return {col: _to_values(frame[col]) for col in wanted if col in frame.columns}
+
+
+def input_format(path):
+    return "parquet" if path.lower().endswith((".parquet", ".pq")) else "csv"
+
+
+def count_rows(path):
+    """Row count from Parquet metadata; None for CSV"""
+    if input_format(path) != "parquet":
+        return None
+    import pyarrow.parquet as pq
+    return pq.ParquetFile(path).metadata.num_rows
+
+
+def read_chunks(path, columns, chunk_rows):
+    """Yield {column: values} dicts of at most chunk_rows rows"""
+    if input_format(path) == "parquet":
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+        present = [c for c in columns if c in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=chunk_rows, columns=present):
+            yield _frame_columns(batch.to_pandas(), present)
+    else:
+        import pandas as pd
+        wanted = set(columns)
+        for frame in pd.read_csv(path, chunksize=chunk_rows, dtype=str, usecols=lambda c: c in wanted):
+            yield _frame_columns(frame, columns)
+
+
+def input_columns():
+    """Model features plus the controls only the policy looks at"""
+    from ml_model_api import TABNET_FEATURE_COLUMNS
+    from policy_engine import get_policy_engine
+    columns = list(TABNET_FEATURE_COLUMNS)
+    return columns + [c for c in get_policy_engine().controls if c not in columns]
+
+
+# === Scoring ===
+def final_scores(system_idx, ml_idx, mismatch_counts, total_controls):
+    """Vectorized ml_model_api.calculate_final_score over label indices"""
+    from ml_model_api import RISK_ALIGNMENT_SCORES, RISK_LABELS
+    labels = [label.lower() for label in RISK_LABELS]
+    table = np.array([[RISK_ALIGNMENT_SCORES.get((s, m), 70) for m in labels] for s in labels], dtype=np.float64)
+    base = table[system_idx, ml_idx]
+    bonus = (total_controls - mismatch_counts) / total_controls * 10 if total_controls > 0 else 0
+    return np.minimum(100, base + bonus).astype(np.int16)
+
+
+def score_columns(loaded, columns, n, system_risk):
+    """Score one chunk; returns a dict of result columns"""
+    from ml_model_api import RISK_LABELS, TOTAL_CONTROLS
+    from policy_engine import get_policy_engine
+
+    # Normalize the tier like evaluate_batch does; unknown tiers fall back to Medium
+    if isinstance(system_risk, str):
+        tiers = [system_risk] * n
+        fallback = np.zeros(n, dtype=bool)
+    else:
+        tiers = [str(v).capitalize() for v in system_risk]
+        fallback = np.fromiter((t not in RISK_LABELS for t in tiers), dtype=bool, count=n)
+        tiers = ["Medium" if bad else t for t, bad in zip(tiers, fallback)]
+
+    X = loaded.feature_encoder.encode_columns(columns, n)
+    y_pred = np.asarray(loaded.predict(X), dtype=np.intp)
+
+    engine = get_policy_engine()
+    settings = {col: [str(v) for v in values] for col, values in columns.items()}
+    compliance = engine.evaluate_columns(settings, tiers)
+    counts = compliance.mismatch_counts()
+
+    system_idx = np.fromiter((RISK_LABELS.index(t) for t in tiers), dtype=np.intp, count=n)
+    controls = np.array(compliance.controls, dtype=object)
+    return {
+        "system_risk": tiers,
+        "system_risk_fallback": fallback,
+        "ml_risk": [RISK_LABELS[i] for i in y_pred],
+        "final_score": final_scores(system_idx, y_pred, counts, TOTAL_CONTROLS),
+        "mismatches": counts.astype(np.int16),
+        "compliant_controls": (TOTAL_CONTROLS - counts).astype(np.int16),
+        "mismatched_controls": [",".join(controls[row]) for row in compliance.mismatch_mask],
+    }
+
+
+def _init_worker(config, threads):
+    """Load the model once per worker process"""
+    import warnings
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent decides what happens on Ctrl+C
+    warnings.filterwarnings("ignore")
+    from log_config import setup_logging
+    from ml_model_api import ModelState
+
+    setup_logging("WARNING")
+    state = ModelState(config)
+    if not state.load():
+        raise RuntimeError(f"Model loading failed: {state.error}")
+    import torch
+    torch.set_num_threads(threads)
+    _worker["loaded"] = state.active
+
+
+def _score_chunk(index, start, columns, ids, system_risk, out_dir, fmt):
+    """Worker task: score a chunk and write its part file atomically"""
+    started = time.perf_counter()
+    n = len(next(iter(columns.values()))) if columns else len(ids or ())
+    result = {"row": np.arange(start, start + n, dtype=np.int64)}
+    if ids is not None:
+        result["id"] = ids
+    result.update(score_columns(_worker["loaded"], columns, n, system_risk))
+
+    path = os.path.join(out_dir, part_name(index, fmt))
+    tmp = path + ".tmp"
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        pq.write_table(pa.table(result), tmp)
+    else:
+        import pandas as pd
+        pd.DataFrame(result).to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    return index, n, time.perf_counter() - started
+
+
+# === Job bookkeeping ===
+def part_name(index, fmt):
+    return f"part-{index:06d}.{fmt}"
+
+
+def job_description(args):
+    stat = os.stat(args.input)
+    return {
+        "input": os.path.abspath(args.input),
+        "input_size": stat.st_size,
+        "input_mtime": stat.st_mtime,
+        "chunk_rows": args.chunk_rows,
+        "format": args.format,
+        "id_column": args.id_column,
+        "risk_column": args.risk_column,
+        "system_risk": args.system_risk,
+    }
+
+
+def prepare_output(args):
+    """Create or validate the output directory; returns indices of finished parts"""
+    os.makedirs(args.output, exist_ok=True)
+    job_path = os.path.join(args.output, JOB_FILE)
+    job = job_description(args)
+    if os.path.exists(job_path):
+        with open(job_path, "r") as f:
+            previous = json.load(f)
+        if previous != job and not args.restart:
+            raise SystemExit(f"❌ {args.output} holds a different job; use --restart to discard it")
+        if previous != job or args.restart:
+            for name in os.listdir(args.output):
+                if name.startswith("part-") or name == SUCCESS_FILE:
+                    os.remove(os.path.join(args.output, name))
+    with open(job_path, "w") as f:
+        json.dump(job, f, indent=2)
+
+    suffix = "." + args.format
+    return {int(name[5:11]) for name in os.listdir(args.output)
+            if name.startswith("part-") and name.endswith(suffix)}
+
+
+# === Self-check ===
+def run_check(rows=3000, chunk_rows=700):
+    """Score a generated CSV (policy-only controls included) and compare with evaluate_batch"""
+    import random
+
+    import pandas as pd
+
+    from ml_model_api import RISK_LABELS, TABNET_FEATURE_COLUMNS, ModelState, default_config, evaluate_batch
+
+    columns = input_columns()
+    pool = ["Enabled", "Disabled", "Unknown", "NoMembers", "HasMembers", "0", "1", "8", "12", "16", None]
+    rng = random.Random(0)
+    frame = pd.DataFrame({c: [rng.choice(pool) for _ in range(rows)] for c in columns})
+    frame["system_risk"] = [rng.choice(RISK_LABELS) for _ in range(rows)]
+
+    workdir = tempfile.mkdtemp(prefix="iepis-score-")
+    try:
+        path = os.path.join(workdir, "controls.csv")
+        frame.to_csv(path, index=False)
+        out = os.path.join(workdir, "scores")
+        main([path, "-o", out, "--format", "csv", "--workers", "1", "--chunk-rows", str(chunk_rows),
+              "--risk-column", "system_risk"])
+        scored = pd.concat([pd.read_csv(os.path.join(out, name), keep_default_na=False)
+                            for name in sorted(os.listdir(out)) if name.startswith("part-")])
+
+        state = ModelState({**default_config(), "MODEL_POLL_SECONDS": 0, "MICROBATCH": False})
+        if not state.load():
+            raise RuntimeError(f"Model loading failed: {state.error}")
+        snapshots = [{"host": str(i), "system_risk": row.pop("system_risk"),
+                      "controls": {c: v for c, v in row.items() if v is not None}}
+                     for i, row in enumerate(frame.astype(object).where(frame.notna(), None).to_dict("records"))]
+        expected = evaluate_batch(state.active, snapshots)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    bad = 0
+    for (_, got), want in zip(scored.sort_values("row").iterrows(), expected):
+        mismatched = sorted(m["setting"] for m in want["mismatches"])
+        if (got["ml_risk"] != want["ml_risk"] or int(got["final_score"]) != want["final_score"]
+                or sorted(filter(None, got["mismatched_controls"].split(","))) != mismatched):
+            bad += 1
+    policy_only = [c for c in columns if c not in TABNET_FEATURE_COLUMNS]
+    ok = bad == 0 and len(scored) == rows
+    print(f"{'✅' if ok else '❌'} {len(scored) - bad} of {rows} rows match evaluate_batch "
+          f"(policy-only columns: {', '.join(policy_only) or 'none'})")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a CSV or Parquet dataset of control vectors")
+    parser.add_argument("input", nargs="?", help="CSV or Parquet file")
+    parser.add_argument("-o", "--output", help="output directory for the result parts")
+    parser.add_argument("--format", choices=("parquet", "csv"), default="parquet")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads-per-worker", type=int, default=1, help="torch threads in each worker")
+    parser.add_argument("--id-column", help="copy this column into the results")
+    parser.add_argument("--risk-column", help="column with each row's system risk (Low/Medium/High)")
+    parser.add_argument("--system-risk", default="Medium", choices=("Low", "Medium", "High"),
+                        help="system risk for every row when there is no --risk-column")
+    parser.add_argument("--restart", action="store_true", help="discard results of a previous, different job")
+    parser.add_argument("--progress", type=float, default=5.0, help="seconds between progress lines")
+    parser.add_argument("--check", action="store_true", help="compare with evaluate_batch on generated data")
+    args = parser.parse_args(argv)
+
+    from log_config import setup_logging
+    from ml_model_api import default_config
+
+    setup_logging()
+    if args.check:
+        return 0 if run_check() else 1
+    if not args.input or not args.output:
+        parser.error("input and -o/--output are required")
+    done = prepare_output(args)
+    total_rows = count_rows(args.input)
+    config = {**default_config(), "MODEL_POLL_SECONDS": 0, "MICROBATCH": False}
+    columns = input_columns()
+    extra = [c for c in (args.id_column, args.risk_column) if c and c not in columns]
+
+    log.info("📥 Scoring %s with %d workers, %d rows per chunk (%d chunks already done)",
+             args.input, args.workers, args.chunk_rows, len(done))
+    started = last_report = time.perf_counter()
+    scored = skipped = 0
+    pending = set()
+
+    def take(chunk, name):
+        # Extra columns leave the chunk; a feature column used as id stays in it
+        return chunk.pop(name, None) if name in extra else chunk.get(name) if name else None
+
+    def collect():
+        nonlocal scored, last_report
+        finished, still_pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in finished:
+            _, n, _ = future.result()
+            scored += n
+        now = time.perf_counter()
+        if now - last_report >= args.progress:
+            last_report = now
+            rate = scored / (now - started)
+            progress = f" ({(scored + skipped) / total_rows:.0%})" if total_rows else ""
+            log.info("⏳ %s rows scored%s, %s rows/s", f"{scored:,}", progress, f"{rate:,.0f}")
+        return still_pending
+
+    pool = ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(config, args.threads_per_worker))
+    try:
+        start = 0
+        for index, chunk in enumerate(read_chunks(args.input, columns + extra, args.chunk_rows)):
+            n = len(next(iter(chunk.values()))) if chunk else 0
+            if index in done:
+                skipped += n
+                start += n
+                continue
+            ids = take(chunk, args.id_column)
+            risk = take(chunk, args.risk_column) if args.risk_column else args.system_risk
+            if risk is None:
+                raise SystemExit(f"❌ Column '{args.risk_column}' not found in {args.input}")
+            pending.add(pool.submit(_score_chunk, index, start, chunk, ids, risk, args.output, args.format))
+            start += n
+            # Keep a bounded number of chunks in flight so memory stays flat
+            while len(pending) >= 2 * args.workers:
+                pending = collect()
+        while pending:
+            pending = collect()
+    except KeyboardInterrupt:
+        # Chunks already running finish and keep their parts; queued ones are dropped
+        log.warning("⚠️ Interrupted after %s rows; run the same command again to resume", f"{scored:,}")
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        pool.shutdown(wait=True, cancel_futures=True)
+        return 130
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    summary = {"rows": scored + skipped, "scored": scored, "resumed": skipped,
+               "seconds": round(elapsed, 3), "rows_per_s": round(scored / elapsed) if elapsed else None}
+    with open(os.path.join(args.output, SUCCESS_FILE), "w") as f:
+        json.dump(summary, f, indent=2)
+    log.info("✅ %s rows scored in %.1fs (%s rows/s, %s resumed)", f"{scored:,}", elapsed,
+             f"{summary['rows_per_s'] or 0:,}", f"{skipped:,}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
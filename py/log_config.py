@@ -0,0 +1,67 @@
+"""Logging setup for the IEPIS services.
+
+Modules log through ``logging.getLogger("iepis.<area>")``. The API and the
+command line entry points call ``setup_logging()``, which attaches one
+stderr handler to the ``iepis`` logger:
+
+* ``IEPIS_LOG_LEVEL`` (default INFO) - DEBUG, INFO, WARNING, ERROR
+* ``IEPIS_LOG_FORMAT`` (default text) - ``json`` writes one object per
+  line, including any ``extra={...}`` fields of the call
+
+A disabled level costs a single level check, as long as values are passed
+as arguments (``log.debug("controls %s", data)``) instead of pre-formatted.
+"""
+import json
+import logging
+import os
+import sys
+import time
+
+LOG_LEVEL = os.getenv("IEPIS_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("IEPIS_LOG_FORMAT", "text")
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def _extra(record):
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS}
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        extra = _extra(record)
+        if extra:
+            line += " " + " ".join(f"{k}={v}" for k, v in extra.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        doc = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created))
+                  + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            **_extra(record),
+        }
+        if record.exc_info:
+            doc["exc"] = self.formatException(record.exc_info)
+        return json.dumps(doc, default=str, ensure_ascii=False)
+
+
+def setup_logging(level=None, fmt=None, stream=None):
+    """Configure the "iepis" logger once; later calls only change the level"""
+    logger = logging.getLogger("iepis")
+    logger.setLevel(level or LOG_LEVEL)
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream or sys.stderr)
+        handler.setFormatter(JsonFormatter() if (fmt or LOG_FORMAT) == "json" else TextFormatter())
+        logger.addHandler(handler)
+        logger.propagate = False
+    return logger
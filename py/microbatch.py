@@ -0,0 +1,116 @@
+"""Dynamic micro-batching for single-row model predictions.
+
+Concurrent requests each want ``model.predict`` on one row, and most of
+that call is fixed per-call overhead. ``MicroBatcher`` queues the rows; a
+worker thread collects up to ``max_batch`` rows, or whatever arrived
+within ``max_wait_ms`` of the first one, runs one predict and resolves
+each caller's future with its own result.
+"""
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn, max_batch=64, max_wait_ms=2.0):
+        self.predict_fn = predict_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.batch_sizes = Counter()  # batch size bucket (power of two) -> count
+        self._worker = threading.Thread(target=self._run, name="microbatch", daemon=True)
+        self._worker.start()
+
+    def submit(self, row):
+        """Queue one feature row; the Future resolves to its prediction.
+
+        After close() rows are predicted directly in the caller's thread, so
+        a caller still holding a retired batcher (e.g. across a model swap)
+        gets its answer instead of an error.
+        """
+        future = Future()
+        row = np.asarray(row, dtype=np.float32)
+        with self._close_lock:
+            if not self._closed:
+                self._queue.put((row, future))
+                return future
+        try:
+            future.set_result(self.predict_fn(row[None])[0])
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def predict(self, row, timeout=None):
+        return self.submit(row).result(timeout)
+
+    def close(self):
+        """Stop the worker after it has answered every row already queued"""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._worker.join()
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches": self.batches,
+            "rows": self.rows,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batch_size_histogram": {str(k): v for k, v in sorted(self.batch_sizes.items())},
+        }
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                # Take whatever is already queued without waiting
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                self._queue.put(None)  # let the main loop see the close marker
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            # Skip rows whose caller already cancelled
+            live = [(r, f) for r, f in self._collect(first) if f.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            rows = [r for r, _ in live]
+            futures = [f for _, f in live]
+
+            self.batches += 1
+            self.rows += len(rows)
+            self.batch_sizes[1 << (len(rows) - 1).bit_length()] += 1
+            try:
+                predictions = self.predict_fn(np.stack(rows))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, prediction in zip(futures, predictions):
+                future.set_result(prediction)
@@ -1,13 +1,45 @@
-from flask import Flask, jsonify
+from flask import Blueprint, Flask, Response, current_app, g, jsonify, request, stream_with_context
 import os
 import json
+import logging
+import time
+import threading
 import numpy as np
-import joblib
 import subprocess
 import re
-from pytorch_tabnet.tab_model import TabNetClassifier
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import Research1
+from feature_encoder import FeatureEncoder
+from microbatch import MicroBatcher
+from compare_controls import Mismatch, compare_with_policy, evaluate_system, get_system_risk_level
+from policy_engine import get_policy_engine
+from control_store import get_control_store
+from audit_log import CONTROLS_PATH
+from model_registry import REGISTRY_DIR, ModelRegistry, memory_usage
+import metrics
+from compare_controls import RISK_FALLBACKS
+from log_config import setup_logging
+from risk_assisment_modified import get_local_classifier
+from metrics import stage
+import ndjson_stream
+from background_eval import REEVAL_INTERVAL, BackgroundEvaluator
+from fleet_rollup import TIERS, FleetRollup
 
-app = Flask(__name__)
+# torch, pytorch_tabnet and joblib are imported by ModelState.load(), so
+# importing this module stays cheap. Serve with the app factory:
+#
+#     gunicorn "ml_model_api:create_app()"
+
+_IMPORT_STARTED = time.perf_counter()
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+api = Blueprint("iepis", __name__)
+log = logging.getLogger("iepis.api")
+
+HTTP_REQUESTS = metrics.counter("iepis_http_requests_total", "HTTP requests by route and status",
+                                ("route", "status"))
+HTTP_SECONDS = metrics.histogram("iepis_http_request_seconds", "HTTP request latency by route", ("route",))
 
 # === ALL 11 features based on your actual data ===
 TABNET_FEATURE_COLUMNS = [
@@ -24,27 +56,412 @@ TABNET_FEATURE_COLUMNS = [
     "Census_IsVirtualDevice"
 ]
 
-# === Load model and encoders ===
-def load_model_safely():
-    global model, encoders
-    try:
+RISK_LABELS = ["Low", "Medium", "High"]
+TOTAL_CONTROLS = 9  # Number of security controls we check
+
+# Score matrix based on risk level alignment: (system risk, ML risk) -> base score
+RISK_ALIGNMENT_SCORES = {
+    ("low", "low"): 90,
+    ("low", "medium"): 70,
+    ("low", "high"): 50,
+    ("medium", "low"): 80,
+    ("medium", "medium"): 85,
+    ("medium", "high"): 60,
+    ("high", "low"): 60,
+    ("high", "medium"): 75,
+    ("high", "high"): 90
+}
+
+# Rows per TabNet predict call in /api/evaluate_batch
+BATCH_CHUNK_SIZE = int(os.getenv("IEPIS_BATCH_CHUNK_SIZE", "1024"))
+
+# "inprocess" calls compare_controls directly; "subprocess" keeps the old
+# one-interpreter-per-request isolation mode
+COMPARE_MODE = os.getenv("IEPIS_COMPARE_MODE", "inprocess")
+
+# Micro-batching of single-row predictions from concurrent /api/evaluate calls
+MICROBATCH = os.getenv("IEPIS_MICROBATCH", "0") == "1"
+MICROBATCH_MAX_BATCH = int(os.getenv("IEPIS_MICROBATCH_MAX_BATCH", "64"))
+MICROBATCH_WAIT_MS = float(os.getenv("IEPIS_MICROBATCH_WAIT_MS", "2"))
+
+# "tabnet" predicts through TabNetClassifier; "torchscript" uses the lean
+# runner over the artifact written by tabnet_export.py
+INFERENCE_RUNNER = os.getenv("IEPIS_INFERENCE_RUNNER", "tabnet")
+
+# Artifact paths default to the files next to this module, not the cwd
+MODEL_PATH = os.getenv("IEPIS_MODEL_PATH", os.path.join(BASE_DIR, "TabnetRfHybrid.h5"))
+ENCODERS_PATH = os.getenv("IEPIS_ENCODERS_PATH", os.path.join(BASE_DIR, "tabnet_encoders.pkl"))
+TORCHSCRIPT_PATH = os.getenv("IEPIS_TORCHSCRIPT_PATH", os.path.join(BASE_DIR, "TabnetRfHybrid.pt"))
+
+# Versioned models (model_registry.py); used instead of MODEL_PATH once the
+# registry has a CURRENT version. Each process checks CURRENT this often.
+MODEL_REGISTRY = REGISTRY_DIR
+MODEL_POLL_SECONDS = float(os.getenv("IEPIS_MODEL_POLL_SECONDS", "2"))
+
+# "background" starts loading the model when the app is created, "lazy" on
+# the first request that needs it, "eager" before create_app() returns
+MODEL_LOAD = os.getenv("IEPIS_MODEL_LOAD", "background")
+# How long a scoring request waits for a model that is still loading
+READY_TIMEOUT = float(os.getenv("IEPIS_READY_TIMEOUT", "30"))
+
+CONTROLS_FILE = CONTROLS_PATH
+
+# Keep a precomputed evaluation up to date in the background and serve it
+# from GET /api/evaluation (background_eval.py)
+BACKGROUND_EVAL = os.getenv("IEPIS_BACKGROUND_EVAL", "0") == "1"
+
+
+def default_config():
+    return {
+        "MODEL_PATH": MODEL_PATH,
+        "ENCODERS_PATH": ENCODERS_PATH,
+        "TORCHSCRIPT_PATH": TORCHSCRIPT_PATH,
+        "MODEL_REGISTRY": MODEL_REGISTRY,
+        "MODEL_POLL_SECONDS": MODEL_POLL_SECONDS,
+        "INFERENCE_RUNNER": INFERENCE_RUNNER,
+        "MODEL_LOAD": MODEL_LOAD,
+        "READY_TIMEOUT": READY_TIMEOUT,
+        "BATCH_CHUNK_SIZE": BATCH_CHUNK_SIZE,
+        "COMPARE_MODE": COMPARE_MODE,
+        "MICROBATCH": MICROBATCH,
+        "MICROBATCH_MAX_BATCH": MICROBATCH_MAX_BATCH,
+        "MICROBATCH_WAIT_MS": MICROBATCH_WAIT_MS,
+        "CONTROLS_FILE": CONTROLS_FILE,
+        "BACKGROUND_EVAL": BACKGROUND_EVAL,
+        "REEVAL_INTERVAL": REEVAL_INTERVAL,
+    }
+
+
+class ModelNotReady(Exception):
+    pass
+
+
+class VersionConflict(Exception):
+    """A registry version was requested but the runner can't serve versions"""
+
+
+# === Model, encoders and micro-batcher, loaded off the import path ===
+class LoadedModel:
+    """One model version with its encoders and micro-batcher.
+
+    A request pins the LoadedModel it started with, so a hot swap never
+    mixes one version's encoders with another version's weights.
+    """
+
+    def __init__(self, state, version, model, encoders):
+        self.state = state
+        self.config = state.config
+        self.version = version
+        self.model = model
+        self.encoders = encoders
+        self.feature_encoder = FeatureEncoder(TABNET_FEATURE_COLUMNS, encoders)
+        self.batcher = None
+        self.start_batcher()
+
+    def start_batcher(self):
+        if self.config["MICROBATCH"]:
+            # Requests share predict calls through a micro-batching queue
+            self.batcher = MicroBatcher(
+                self.predict, self.config["MICROBATCH_MAX_BATCH"], self.config["MICROBATCH_WAIT_MS"]
+            )
+
+    def predict(self, X):
+        with stage("predict"):
+            y_pred = self.model.predict(X)
+        if self.state.first_prediction_seconds is None:
+            self.state.first_prediction_seconds = time.perf_counter() - self.state.created
+        return y_pred
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+
+
+class ModelState:
+    """Holds the active model version for one app, plus the previous one.
+
+    status goes idle -> loading -> ready | failed. wait() is what request
+    handlers call: it starts the load in lazy mode, blocks while a load is
+    in progress and returns the active LoadedModel, or raises ModelNotReady.
+
+    With a model registry, each process polls its CURRENT pointer and swaps
+    to the new version in the background; in-flight requests finish on the
+    version they started with and the previous version is kept for rollback.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.status = "idle"
+        self.error = None
+        self.active = None
+        self.previous = None
+        # The torchscript runner serves the one exported TORCHSCRIPT_PATH, so
+        # registry versions (and the CURRENT watcher) don't apply to it
+        self.registry = (ModelRegistry(config["MODEL_REGISTRY"])
+                         if config["MODEL_REGISTRY"] and config["INFERENCE_RUNNER"] != "torchscript" else None)
+        self.created = time.perf_counter()
+        self.load_seconds = None
+        self.ready_at = None
+        self.first_prediction_seconds = None  # app creation -> first predict
+        self.last_reload = None
+        self.listeners = []  # called with the new version after every swap
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._done = threading.Event()
+        self._pointer_mtime = None
+        self._pid = None  # process that owns the watcher and batcher threads
+
+    def start(self):
+        mode = self.config["MODEL_LOAD"]
+        if mode == "eager":
+            self.load()
+        elif mode == "background":
+            threading.Thread(target=self.load, name="model-load", daemon=True).start()
+
+    def _build(self, version=None):
+        """Load version from the registry, or the plain model files when
+        there is no registry version (or the runner is torchscript)"""
+        import joblib
+
+        runner = self.config["INFERENCE_RUNNER"]
+        if runner == "torchscript":
+            # Exported with: python tabnet_export.py --check
+            from tabnet_export import TorchScriptRunner
+            path = self.config["TORCHSCRIPT_PATH"]
+            if version:
+                raise VersionConflict(f"model version '{version}' requested but the torchscript runner "
+                                      f"only serves {os.path.basename(path)}")
+            return LoadedModel(self, f"file:{os.path.basename(path)}",
+                               TorchScriptRunner(path), joblib.load(self.config["ENCODERS_PATH"]))
+        if self.registry is not None and (version or self.registry.current_version()):
+            model, encoders, manifest = self.registry.load(version)
+            return LoadedModel(self, manifest["version"], model, encoders)
+        if version:
+            raise KeyError(f"model version '{version}' requested but there is no model registry")
+
+        from pytorch_tabnet.tab_model import TabNetClassifier
+        path = self.config["MODEL_PATH"]
         model = TabNetClassifier()
-        model.load_model("TabnetRfHybrid.h5")
-        encoders = joblib.load("tabnet_encoders.pkl")
-        print("✅ Model and encoders loaded successfully")
-        print(f"✅ Model expects {len(TABNET_FEATURE_COLUMNS)} features")
-        return True
-    except Exception as e:
-        print(f"❌ Model loading failed: {e}")
-        return False
+        model.load_model(path)
+        return LoadedModel(self, f"file:{os.path.basename(path)}", model, joblib.load(self.config["ENCODERS_PATH"]))
+
+    def load(self):
+        with self._lock:
+            if self._done.is_set():
+                return self.status == "ready"
+            self.status = "loading"
+            start = time.perf_counter()
+            try:
+                if self.registry is not None:
+                    self._pointer_mtime = self.registry.pointer_mtime()
+                self.active = self._build()
+                # sklearn + joblib cost ~1.5s; pay them here, not in the first request
+                get_local_classifier()
+                self._pid = os.getpid()
+                self._start_watcher()
+                self.status = "ready"
+                self.ready_at = time.perf_counter()
+                log.info("✅ Model %s (%s) and encoders loaded successfully",
+                         self.active.version, self.config["INFERENCE_RUNNER"])
+                log.info("✅ Model expects %d features", len(TABNET_FEATURE_COLUMNS))
+            except Exception as e:
+                self.status = "failed"
+                self.error = str(e)
+                log.error("❌ Model loading failed: %s", e)
+            finally:
+                self.load_seconds = time.perf_counter() - start
+                self._done.set()
+        return self.status == "ready"
 
-if not load_model_safely():
-    print("❌ Exiting due to model loading failure")
-    exit(1)
+    def wait(self, timeout=None):
+        if self.status == "idle" and self.config["MODEL_LOAD"] not in ("background", "eager"):
+            self.load()
+        self._done.wait(timeout)
+        active = self.active
+        if self.status != "ready" or active is None:
+            raise ModelNotReady(self.error or f"model is {self.status}")
+        if self._pid != os.getpid():
+            self._after_fork()
+        return active
+
+    def _after_fork(self):
+        # Threads don't survive fork: a worker that inherited a model loaded
+        # by a preloading master restarts its own batchers and watcher
+        with self._reload_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for loaded in (self.active, self.previous):
+                if loaded is not None and loaded.batcher is not None:
+                    loaded.start_batcher()
+            self._start_watcher()
+
+    # === Hot swap ===
+    def reload(self, version=None):
+        """Swap in version (default: registry CURRENT, or the model files again).
+
+        The new model is loaded while the old one keeps serving; the swap is
+        a single reference assignment. Returns the reload record.
+        """
+        with self._reload_lock:
+            start = time.perf_counter()
+            version = version or (self.registry.current_version() if self.registry else None)
+            if version and self.active is not None and version == self.active.version:
+                return {"version": version, "seconds": 0.0, "changed": False}
+            if version and self.previous is not None and version == self.previous.version:
+                self.active, self.previous = self.previous, self.active
+            else:
+                loaded = self._build(version)
+                retired = self.previous
+                self.active, self.previous = loaded, self.active
+                if retired is not None:
+                    retired.close()
+            return self._swapped(start)
+
+    def rollback(self):
+        """Swap back to the previous version, which is still loaded"""
+        with self._reload_lock:
+            if self.previous is None:
+                raise ModelNotReady("no previous model version loaded")
+            start = time.perf_counter()
+            self.active, self.previous = self.previous, self.active
+            return self._swapped(start)
+
+    def _swapped(self, start):
+        self.status, self.error = "ready", None
+        self._done.set()
+        self.last_reload = {
+            "version": self.active.version,
+            "seconds": time.perf_counter() - start,
+            "changed": True,
+            "at": time.time(),
+        }
+        log.info("🔁 Model %s active (reload took %.1f ms)", self.active.version, self.last_reload["seconds"] * 1000)
+        for listener in self.listeners:
+            listener(self.active.version)
+        return self.last_reload
+
+    def _start_watcher(self):
+        if self.registry is None or self.config["MODEL_POLL_SECONDS"] <= 0:
+            return
+        threading.Thread(target=self._watch, args=(os.getpid(),), name="model-watch", daemon=True).start()
+
+    def _watch(self, pid):
+        while self._pid == pid:
+            time.sleep(self.config["MODEL_POLL_SECONDS"])
+            mtime = self.registry.pointer_mtime()
+            if mtime == self._pointer_mtime:
+                continue
+            self._pointer_mtime = mtime
+            try:
+                self.reload()
+            except Exception as e:
+                log.warning("⚠️ Model reload failed, keeping %s: %s", self.active.version, e)
+
+    def info(self):
+        return {
+            "status": self.status,
+            "version": self.active.version if self.active else None,
+            "previous_version": self.previous.version if self.previous else None,
+            "runner": self.config["INFERENCE_RUNNER"],
+            "load_mode": self.config["MODEL_LOAD"],
+            "load_seconds": self.load_seconds,
+            "first_prediction_seconds": self.first_prediction_seconds,
+            "last_reload": self.last_reload,
+            "error": self.error,
+        }
+
+
+def create_app(config=None):
+    """Build the Flask app; config overrides default_config() keys"""
+    setup_logging()
+    app = Flask(__name__)
+    app.config.update(default_config())
+    app.config.update(config or {})
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    state = ModelState(app.config)
+    app.extensions["iepis_model"] = state
+    app.extensions["iepis_rollup"] = FleetRollup()
+    app.register_blueprint(api)
+    state.start()
+    if app.config["BACKGROUND_EVAL"]:
+        evaluator = BackgroundEvaluator(
+            state, predict_ml_risk, score_fields, app.config["REEVAL_INTERVAL"],
+            controls_path=app.config["CONTROLS_FILE"], ready_timeout=app.config["READY_TIMEOUT"]
+        )
+        app.extensions["iepis_evaluator"] = evaluator
+        evaluator.start()
+    return app
+
+
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+def _record_request(response):
+    # The route template, not the raw path, keeps label cardinality bounded
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_SECONDS.labels(route).observe(time.perf_counter() - g.get("request_started", time.perf_counter()))
+    HTTP_REQUESTS.labels(route, str(response.status_code)).inc()
+    return response
+
+
+def get_state():
+    return current_app.extensions["iepis_model"]
+
+
+def ready_model():
+    """The current app's active LoadedModel, waiting up to READY_TIMEOUT for it to load"""
+    return get_state().wait(current_app.config["READY_TIMEOUT"])
 
 
 def get_system_risk_and_mismatches():
-    """Get system risk level and mismatches by running compare_controls.py"""
+    """Get system risk level and mismatches from compare_controls"""
+    if current_app.config["COMPARE_MODE"] == "subprocess":
+        return run_compare_controls_subprocess()
+    try:
+        return evaluate_system().to_dict()
+    except Exception as e:
+        RISK_FALLBACKS.labels("compliance_error").inc()
+        log.warning("⚠️ Could not evaluate system compliance: %s", e)
+        return {
+            "system_risk": "Medium",
+            "mismatches": [],
+            "parsed_settings": {}
+        }
+
+
+def parse_compare_output(output):
+    """Extract the JSON report from compare_controls.py's stdout"""
+    # Parse output - handle the case where there might be print statements before JSON
+    output = output.strip()
+    log.debug("📥 GPT Script Output: %s", output)
+    
+    # Try to extract JSON from the output
+    json_match = re.search(r'\{.*\}', output, re.DOTALL)
+    if json_match:
+        json_str = json_match.group(0)
+        return json.loads(json_str)
+    else:
+        # If no JSON found, try to parse line by line
+        lines = output.split('\n')
+        for line in lines:
+            line = line.strip()
+            if line.startswith('{'):
+                # Try to parse this line and subsequent lines as JSON
+                json_start = output.find(line)
+                potential_json = output[json_start:]
+                try:
+                    return json.loads(potential_json)
+                except:
+                    continue
+        
+        raise Exception("No valid JSON found in output")
+
+
+def run_compare_controls_subprocess():
+    """Isolation mode: run compare_controls.py in a separate interpreter"""
     try:
         result = subprocess.run(
             ["python", "compare_controls.py"], 
@@ -56,34 +473,12 @@ def get_system_risk_and_mismatches():
         if result.returncode != 0:
             raise Exception(f"compare_controls.py failed: {result.stderr}")
         
-        # Parse output - handle the case where there might be print statements before JSON
-        output = result.stdout.strip()
-        print(f"📥 GPT Script Output: {output}")
-        
-        # Try to extract JSON from the output
-        json_match = re.search(r'\{.*\}', output, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(0)
-            return json.loads(json_str)
-        else:
-            # If no JSON found, try to parse line by line
-            lines = output.split('\n')
-            for line in lines:
-                line = line.strip()
-                if line.startswith('{'):
-                    # Try to parse this line and subsequent lines as JSON
-                    json_start = output.find(line)
-                    potential_json = output[json_start:]
-                    try:
-                        return json.loads(potential_json)
-                    except:
-                        continue
-            
-            raise Exception("No valid JSON found in output")
+        return parse_compare_output(result.stdout)
         
     except Exception as e:
-        print(f"⚠️ Could not parse GPT risk level: {e}")
-        print(f"Raw output: {result.stdout if 'result' in locals() else 'No output'}")
+        RISK_FALLBACKS.labels("compliance_error").inc()
+        log.warning("⚠️ Could not parse GPT risk level: %s", e)
+        log.debug("Raw output: %s", result.stdout if 'result' in locals() else 'No output')
         return {
             "system_risk": "Medium",
             "mismatches": [],
@@ -91,24 +486,12 @@ def get_system_risk_and_mismatches():
         }
 
 
+@stage("score")
 def calculate_final_score(system_risk, ml_risk, mismatches_count, total_controls):
     """Calculate final score based on system risk, ML risk, and compliance"""
     
-    # Score matrix based on risk level alignment
-    risk_alignment_scores = {
-        ("low", "low"): 90,
-        ("low", "medium"): 70, 
-        ("low", "high"): 50,
-        ("medium", "low"): 80,
-        ("medium", "medium"): 85,
-        ("medium", "high"): 60,
-        ("high", "low"): 60,
-        ("high", "medium"): 75,
-        ("high", "high"): 90
-    }
-    
     # Base score from risk alignment
-    base_score = risk_alignment_scores.get(
+    base_score = RISK_ALIGNMENT_SCORES.get(
         (system_risk.lower(), ml_risk.lower()), 70
     )
     
@@ -123,23 +506,239 @@ def calculate_final_score(system_risk, ml_risk, mismatches_count, total_controls
     return int(final_score)
 
 
+def score_fields(system_risk, ml_risk, mismatches_count):
+    """Final score plus control totals, as returned by the evaluate endpoints"""
+    return {
+        "final_score": calculate_final_score(system_risk, ml_risk, mismatches_count, TOTAL_CONTROLS),
+        "total_controls": TOTAL_CONTROLS,
+        "compliant_controls": TOTAL_CONTROLS - mismatches_count
+    }
+
+
+@stage("encode")
+def encode_controls(loaded, data):
+    """Encode one control snapshot into the TabNet feature vector"""
+    return loaded.feature_encoder.encode_one(data)
+
+
+def predict_ml_risk(loaded, data):
+    """Encode one control snapshot and predict its ML risk label.
+
+    With IEPIS_MICROBATCH=1 the row goes through the shared micro-batcher
+    so concurrent requests share one predict call.
+    """
+    feature_vector = encode_controls(loaded, data)
+    if loaded.batcher is not None:
+        y_pred = loaded.batcher.predict(feature_vector)
+    else:
+        y_pred = loaded.predict(np.array([feature_vector], dtype=np.float32))[0]
+    return RISK_LABELS[int(y_pred)]
+
+
+def valid_chunk_size(value):
+    """chunk_size from a batch request: absent or a positive JSON integer"""
+    return value is None or (isinstance(value, int) and not isinstance(value, bool) and value > 0)
+
+
+def evaluate_batch(loaded, snapshots, chunk_size=None):
+    """Score many control snapshots with one TabNet predict pass per chunk.
+
+    Each snapshot is a dict with ``host``, ``controls`` and an optional
+    ``system_risk`` (defaults to Medium). Results come back in input order;
+    a snapshot that cannot be scored gets an ``error`` entry instead of
+    failing the whole batch.
+    """
+    chunk_size = max(1, int(chunk_size or loaded.config["BATCH_CHUNK_SIZE"]))
+    results = [None] * len(snapshots)
+
+    # Step 1: Encode every valid snapshot into one N x 11 matrix
+    row_index = []
+    for i, snapshot in enumerate(snapshots):
+        host = snapshot.get("host", f"host-{i}") if isinstance(snapshot, dict) else f"host-{i}"
+        try:
+            controls = snapshot.get("controls") if isinstance(snapshot, dict) else None
+            if not isinstance(controls, dict):
+                raise ValueError("snapshot has no 'controls' object")
+            if not snapshot.get("system_risk"):
+                RISK_FALLBACKS.labels("not_provided").inc()
+            system_risk = str(snapshot.get("system_risk") or "Medium").capitalize()
+            if system_risk not in RISK_LABELS:
+                raise ValueError(f"unknown system_risk '{system_risk}'")
+            row_index.append((i, host, controls, system_risk))
+        except Exception as e:
+            results[i] = {"host": host, "error": "Invalid snapshot", "detail": str(e)}
+
+    with stage("encode"):
+        X = loaded.feature_encoder.encode([controls for _, _, controls, _ in row_index])
+
+    # Step 2: Policy mismatches for all rows in one vectorized pass
+    policy_engine = get_policy_engine()
+    settings = [{key: str(value) for key, value in controls.items()} for _, _, controls, _ in row_index]
+    with stage("policy"):
+        compliance = policy_engine.evaluate(settings, [system_risk for _, _, _, system_risk in row_index])
+
+    # Step 3: Predict in chunks, then score each row
+    for start in range(0, len(row_index), chunk_size):
+        chunk = row_index[start:start + chunk_size]
+        try:
+            y_pred = loaded.predict(X[start:start + chunk_size])
+        except Exception as e:
+            for i, host, _, _ in chunk:
+                results[i] = {"host": host, "error": "Prediction failed", "detail": str(e)}
+            continue
+
+        for row, ((i, host, controls, system_risk), y) in enumerate(zip(chunk, y_pred), start):
+            try:
+                ml_risk = RISK_LABELS[int(y)]
+                mismatches = [
+                    Mismatch(*m).to_dict()
+                    for m in policy_engine.row_mismatches(compliance, row, settings[row], system_risk)
+                ]
+                results[i] = {
+                    "host": host,
+                    "system_risk": system_risk,
+                    "ml_risk": ml_risk,
+                    "mismatches": mismatches,
+                    "final_score": calculate_final_score(
+                        system_risk, ml_risk, len(mismatches), TOTAL_CONTROLS
+                    ),
+                    "total_controls": TOTAL_CONTROLS,
+                    "compliant_controls": TOTAL_CONTROLS - len(mismatches)
+                }
+            except Exception as e:
+                results[i] = {"host": host, "error": "Scoring failed", "detail": str(e)}
+
+    return results
+
+
+def update_rollup(rollup, snapshots, results):
+    """Feed scored results to the fleet rollup; never fails the scoring response.
+
+    Only snapshots that name their host count: the host-N / line-N
+    placeholders repeat across requests and would merge unrelated devices.
+    """
+    try:
+        rollup.add([result for snapshot, result in zip(snapshots, results)
+                    if isinstance(snapshot, dict) and snapshot.get("host") is not None])
+    except Exception:
+        log.exception("Fleet rollup update failed")
+
+
+def snapshots_from_store(devices, system_risk=None):
+    """Build evaluate_batch snapshots from the latest stored controls per device.
+
+    devices is a list of device names or "all".
+    """
+    store = get_control_store()
+    if devices == "all":
+        latest = store.latest_per_device()
+        devices = list(latest)
+    elif isinstance(devices, list):
+        latest = {d: store.latest(d) for d in devices}
+    else:
+        return None
+
+    snapshots = []
+    for device in devices:
+        snapshot = latest.get(device)
+        snapshots.append({
+            "host": device,
+            "controls": snapshot.controls if snapshot else None,
+            "system_risk": system_risk,
+            "timestamp": snapshot.timestamp if snapshot else None
+        })
+    return snapshots
+
+
+def evaluate_all(loaded, collect=True, backend=None):
+    """Collect controls once and score them in a single pass.
+
+    The GPT system risk runs on a helper thread while the controls are
+    collected, and the freshly collected values feed both the policy
+    comparison and the ML prediction, so nothing waits for files written by
+    an earlier step. With collect=False the last latest_controls.json is
+    scored instead.
+    """
+    run_id = uuid.uuid4().hex
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        risk_future = pool.submit(get_system_risk_level)
+        if collect:
+            with stage("collect"):
+                device, timestamp, controls = Research1.main(backend)
+        else:
+            with open(current_app.config["CONTROLS_FILE"], "r") as f:
+                controls = json.load(f)
+            device, timestamp = None, None
+        system_risk = risk_future.result()
+
+    settings = {key: str(value) for key, value in controls.items()}
+    mismatches = compare_with_policy(settings, system_risk.level)
+    ml_risk = predict_ml_risk(loaded, controls)
+    final_score = calculate_final_score(system_risk.level, ml_risk, len(mismatches), TOTAL_CONTROLS)
+
+    return {
+        "run_id": run_id,
+        "device": device,
+        "timestamp": timestamp,
+        "system_risk": system_risk.level,
+        "system_risk_fallback": system_risk.fallback,
+        "ml_risk": ml_risk,
+        "mismatches": [m.to_dict() for m in mismatches],
+        "final_score": final_score,
+        "total_controls": TOTAL_CONTROLS,
+        "compliant_controls": TOTAL_CONTROLS - len(mismatches),
+        "controls": controls,
+        "model_version": loaded.version,
+        "elapsed_seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def not_ready_response(e):
+    return jsonify({
+        "error": "Model not ready",
+        "detail": str(e)
+    }), 503
+
+
+# === Liveness and readiness probes ===
+@api.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok"})
+
+
+@api.route("/readyz", methods=["GET"])
+def readyz():
+    state = get_state()
+    info = state.info()
+    info["import_to_ready_seconds"] = state.ready_at - _IMPORT_STARTED if state.ready_at else None
+    return jsonify(info), 200 if state.status == "ready" else 503
+
+
+# === Prometheus metrics ===
+@api.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
 # === Evaluate endpoint ===
-@app.route("/api/evaluate", methods=["POST"])
+@api.route("/api/evaluate", methods=["POST"])
 def evaluate():
     try:
-        print("🔄 API HIT: /api/evaluate")
+        log.info("🔄 API HIT: /api/evaluate")
+        loaded = ready_model()
 
         # Step 1: Get system risk and mismatches
         system_data = get_system_risk_and_mismatches()
         system_risk = system_data.get("system_risk", "Medium")
         system_mismatches = system_data.get("mismatches", [])
         
-        print(f"📊 System Risk Level: {system_risk}")
-        print(f"📊 System Mismatches: {len(system_mismatches)}")
+        log.info("📊 System Risk Level: %s", system_risk)
+        log.info("📊 System Mismatches: %d", len(system_mismatches))
 
         # Step 2: Load control data for ML prediction
-        json_path = r"C:\SecurityDataset\latest_controls.json"
-        print(f"📁 Reading control file: {json_path}")
+        json_path = current_app.config["CONTROLS_FILE"]
+        log.debug("📁 Reading control file: %s", json_path)
 
         if not os.path.exists(json_path):
             return jsonify({
@@ -150,44 +749,14 @@ def evaluate():
         with open(json_path, "r") as f:
             data = json.load(f)
 
-        print("✅ Control data loaded:", data)
-
-        # Step 3: Build ML model input
-        feature_vector = []
-        for col in TABNET_FEATURE_COLUMNS:
-            value = data.get(col, "Missing")
-            
-            encoder = encoders.get(col)
-
-            try:
-                if encoder and hasattr(encoder, 'transform'):
-                    if value == "Missing" or value == "Unknown":
-                        encoded_value = 0  # Default fallback
-                    else:
-                        encoded_value = encoder.transform([str(value)])[0]
-                else:
-                    # Numerical feature
-                    encoded_value = float(value) if value not in ["Missing", "Unknown"] else 0.0
-            except Exception as e:
-                print(f"⚠️ '{col}' had invalid value '{value}' — using fallback 0. Error: {e}")
-                encoded_value = 0
-
-            feature_vector.append(encoded_value)
-
-        # Convert to numpy array
-        feature_vector = [float(x) for x in feature_vector]
-        X = np.array([feature_vector], dtype=np.float32)
-        
-        print(f"📊 Final input vector ({len(feature_vector)} features):", feature_vector)
-        print("✅ Shape before predict:", X.shape)
+        log.debug("✅ Control data loaded: %s", data)
 
-        # Step 4: Predict ML risk
-        y_pred = model.predict(X)[0]
-        ml_risk = ["Low", "Medium", "High"][int(y_pred)]
-        print("🤖 Predicted ML Risk:", ml_risk)
+        # Step 3 + 4: Build ML model input and predict ML risk
+        ml_risk = predict_ml_risk(loaded, data)
+        log.info("🤖 Predicted ML Risk: %s", ml_risk)
 
         # Step 5: Calculate final score
-        total_controls = 9  # Number of security controls we check
+        total_controls = TOTAL_CONTROLS
         final_score = calculate_final_score(
             system_risk, 
             ml_risk, 
@@ -195,7 +764,7 @@ def evaluate():
             total_controls
         )
         
-        print("📈 Final Score:", final_score)
+        log.info("📈 Final Score: %s", final_score)
 
         return jsonify({
             "system_risk": system_risk,
@@ -206,15 +775,267 @@ def evaluate():
             "compliant_controls": total_controls - len(system_mismatches)
         })
 
+    except ModelNotReady as e:
+        return not_ready_response(e)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        log.exception("Request failed")
         return jsonify({
             "error": "Evaluation failed",
             "detail": str(e)
         }), 500
 
 
+# === Single-pass collect and evaluate endpoint ===
+@api.route("/api/evaluate_all", methods=["POST"])
+def evaluate_all_endpoint():
+    """Collect, assess and score in one call; body {"collect": false} skips collection"""
+    payload = request.get_json(silent=True)
+    payload = {} if payload is None else payload
+    collect = payload.get("collect", True) if isinstance(payload, dict) else None
+    if not isinstance(collect, bool):
+        return jsonify({
+            "error": "Invalid request",
+            "detail": "Body must be a JSON object whose optional 'collect' is true or false"
+        }), 400
+    try:
+        loaded = ready_model()
+        result = evaluate_all(loaded, collect=collect)
+        log.info("📈 Run %s: system %s, ML %s, score %s, %d mismatches",
+                 result["run_id"], result["system_risk"], result["ml_risk"],
+                 result["final_score"], len(result["mismatches"]))
+        return jsonify(result)
+
+    except ModelNotReady as e:
+        return not_ready_response(e)
+    except FileNotFoundError as e:
+        return jsonify({
+            "error": "Controls file not found",
+            "detail": str(e)
+        }), 404
+    except Exception as e:
+        log.exception("Request failed")
+        return jsonify({
+            "error": "Evaluation failed",
+            "detail": str(e)
+        }), 500
+
+
+# === Precomputed evaluation endpoints ===
+def evaluation_response(snapshot):
+    response = Response(snapshot.body, content_type="application/json")
+    response.set_etag(snapshot.etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+@api.route("/api/evaluation", methods=["GET"])
+def evaluation():
+    """Latest background evaluation; If-None-Match with its ETag gets a 304"""
+    evaluator = current_app.extensions.get("iepis_evaluator")
+    if evaluator is None:
+        return jsonify({
+            "error": "Background evaluation disabled",
+            "detail": "Set IEPIS_BACKGROUND_EVAL=1"
+        }), 404
+    evaluator.ensure_running()
+    snapshot = evaluator.snapshot
+    if snapshot is None:
+        return jsonify({
+            "error": "Evaluation not ready",
+            "detail": evaluator.last_error or "first evaluation still running"
+        }), 503
+    return evaluation_response(snapshot)
+
+
+@api.route("/api/evaluation/refresh", methods=["POST"])
+def evaluation_refresh():
+    """Re-run every stage now and return the new evaluation"""
+    evaluator = current_app.extensions.get("iepis_evaluator")
+    if evaluator is None:
+        return jsonify({
+            "error": "Background evaluation disabled",
+            "detail": "Set IEPIS_BACKGROUND_EVAL=1"
+        }), 404
+    try:
+        evaluator.ensure_running()
+        return evaluation_response(evaluator.refresh("manual", force=True))
+    except ModelNotReady as e:
+        return not_ready_response(e)
+    except FileNotFoundError as e:
+        return jsonify({
+            "error": "Controls file not found",
+            "detail": str(e)
+        }), 404
+    except Exception as e:
+        log.exception("Request failed")
+        return jsonify({
+            "error": "Evaluation failed",
+            "detail": str(e)
+        }), 500
+
+
+# === Micro-batching stats endpoint ===
+@api.route("/api/microbatch/stats", methods=["GET"])
+def microbatch_stats():
+    active = get_state().active
+    batcher = active.batcher if active is not None else None
+    if batcher is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **batcher.stats()})
+
+
+# === Model version endpoints ===
+# Reload and rollback move the registry's CURRENT pointer, so every worker
+# process follows within IEPIS_MODEL_POLL_SECONDS; this one swaps at once.
+@api.route("/api/model", methods=["GET"])
+def model_info():
+    state = get_state()
+    return jsonify({
+        **state.info(),
+        "registry_versions": state.registry.versions() if state.registry else [],
+        "memory": memory_usage(),
+    })
+
+
+@api.route("/api/model/reload", methods=["POST"])
+def model_reload():
+    state = get_state()
+    try:
+        version = (request.get_json(silent=True) or {}).get("version")
+        if version and state.registry is not None:
+            state.registry.activate(version)
+        return jsonify({"reload": state.reload(version), **state.info()})
+    except VersionConflict as e:
+        return jsonify({
+            "error": "Model reload failed",
+            "detail": str(e)
+        }), 409
+    except Exception as e:
+        return jsonify({
+            "error": "Model reload failed",
+            "detail": str(e)
+        }), 400
+
+
+@api.route("/api/model/rollback", methods=["POST"])
+def model_rollback():
+    state = get_state()
+    try:
+        if state.registry is not None and state.registry.current_version():
+            reload = state.reload(state.registry.rollback())
+        else:
+            reload = state.rollback()
+        return jsonify({"reload": reload, **state.info()})
+    except Exception as e:
+        return jsonify({
+            "error": "Model rollback failed",
+            "detail": str(e)
+        }), 400
+
+
+# === Batch evaluate endpoint ===
+@api.route("/api/evaluate_batch", methods=["POST"])
+def evaluate_batch_endpoint():
+    try:
+        body = request.get_json(silent=True) or {}
+        snapshots = body.get("snapshots")
+        if snapshots is None and "devices" in body:
+            snapshots = snapshots_from_store(body["devices"], body.get("system_risk"))
+        if not isinstance(snapshots, list):
+            return jsonify({
+                "error": "Invalid request",
+                "detail": "Body must contain a 'snapshots' list or a 'devices' list"
+            }), 400
+        if not valid_chunk_size(body.get("chunk_size")):
+            return jsonify({
+                "error": "Invalid request",
+                "detail": "chunk_size must be a positive integer"
+            }), 400
+
+        log.info("🔄 API HIT: /api/evaluate_batch (%d snapshots)", len(snapshots))
+        results = evaluate_batch(ready_model(), snapshots, body.get("chunk_size"))
+        failed = sum(1 for r in results if "error" in r)
+        update_rollup(current_app.extensions["iepis_rollup"], snapshots, results)
+
+        return jsonify({
+            "results": results,
+            "total": len(results),
+            "failed": failed
+        })
+
+    except ModelNotReady as e:
+        return not_ready_response(e)
+    except Exception as e:
+        log.exception("Request failed")
+        return jsonify({
+            "error": "Batch evaluation failed",
+            "detail": str(e)
+        }), 500
+
+
+# === Streaming NDJSON endpoint ===
+@api.route("/api/evaluate_stream", methods=["POST"])
+def evaluate_stream_endpoint():
+    """Score an NDJSON body of snapshots, streaming NDJSON results back.
+
+    Query parameters: chunk_size (rows per predict pass) and store=1 to
+    keep timestamped snapshots in the control store. Input is read only as
+    fast as the client consumes the results; see ndjson_stream.py.
+    """
+    chunk_size = ndjson_stream.STREAM_CHUNK_SIZE
+    if "chunk_size" in request.args:
+        chunk_size = request.args.get("chunk_size", type=int)  # None when not an integer
+        if chunk_size is None or not valid_chunk_size(chunk_size):
+            return jsonify({
+                "error": "Invalid request",
+                "detail": "chunk_size must be a positive integer"
+            }), 400
+
+    try:
+        loaded = ready_model()
+    except ModelNotReady as e:
+        return not_ready_response(e)
+
+    store = get_control_store() if request.args.get("store") == "1" else None
+    log.info("🔄 API HIT: /api/evaluate_stream (chunk size %d)", chunk_size)
+    rollup = current_app.extensions["iepis_rollup"]
+
+    def score_chunk(snapshots):
+        results = evaluate_batch(loaded, snapshots)
+        update_rollup(rollup, snapshots, results)
+        return results
+
+    results = ndjson_stream.score_stream(request.stream, score_chunk, chunk_size, store=store)
+    return Response(stream_with_context(results), content_type=ndjson_stream.CONTENT_TYPE)
+
+
+# === Fleet rollup endpoint ===
+@api.route("/api/fleet/rollup", methods=["GET"])
+def fleet_rollup_endpoint():
+    """Fleet aggregates over the latest batch / stream result of every host.
+
+    Query parameters: last (trend buckets, default 24) and tier to narrow
+    the score and mismatch figures to one system risk tier. Counts are per
+    process, so run a single worker when the rollup must cover every request.
+    """
+    rollup = current_app.extensions["iepis_rollup"]
+    last = request.args.get("last", 24, type=int)
+    if last < 1:
+        return jsonify({
+            "error": "Invalid request",
+            "detail": "last must be a positive number of trend buckets"
+        }), 400
+    tier = request.args.get("tier")
+    if tier is None:
+        return jsonify(rollup.summary(last))
+    if tier not in TIERS:
+        return jsonify({
+            "error": "Invalid request",
+            "detail": f"tier must be one of {', '.join(TIERS)}"
+        }), 400
+    return jsonify(rollup.tier_summary(tier))
+
+
 # === Run Flask app ===
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=7000)
\ No newline at end of file
+    create_app().run(host="0.0.0.0", port=7000)
\ No newline at end of file
@@ -0,0 +1,244 @@
+"""Versioned model registry with memory-mapped weights.
+
+Layout under ``models/`` (``IEPIS_MODEL_REGISTRY``):
+
+    models/CURRENT            {"current": "v2", "previous": "v1", "updated": ...}
+    models/v2/manifest.json   TabNet init params, class mapping, tensor table
+    models/v2/weights.bin     every state_dict tensor, 64-byte aligned
+    models/v2/encoders.pkl    LabelEncoders for the categorical features
+
+``load`` builds the TabNet network and assigns tensors that are views into
+a read-only ``np.memmap`` of ``weights.bin``, so worker processes serving
+the same version share one copy of the weights through the page cache.
+
+Versions are published into a temporary directory and renamed into place,
+and ``CURRENT`` is replaced atomically, so a reader never sees a partial
+version. ``ml_model_api`` polls ``CURRENT`` and swaps models without a
+restart; the previous version stays loaded for instant rollback.
+
+    python model_registry.py publish --model TabnetRfHybrid.h5 --encoders tabnet_encoders.pkl --activate
+    python model_registry.py activate v2
+    python model_registry.py rollback
+    python model_registry.py list
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import time
+import warnings
+import zipfile
+
+import numpy as np
+
+from tabnet_export import _file_sha256
+
+REGISTRY_DIR = os.getenv(
+    "IEPIS_MODEL_REGISTRY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+)
+POINTER = "CURRENT"
+ALIGN = 64
+
+
+def _write_json_atomic(path, doc):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(doc, f, indent=2)
+    os.replace(tmp, path)
+
+
+class ModelRegistry:
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+
+    # === Versions and the CURRENT pointer ===
+    def versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        found = [v for v in os.listdir(self.root)
+                 if os.path.isfile(os.path.join(self.root, v, "manifest.json"))]
+        return sorted(found, key=lambda v: self.manifest(v)["created"])
+
+    def manifest(self, version):
+        with open(os.path.join(self.root, version, "manifest.json"), "r") as f:
+            return json.load(f)
+
+    def pointer(self):
+        try:
+            with open(os.path.join(self.root, POINTER), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def pointer_mtime(self):
+        try:
+            return os.stat(os.path.join(self.root, POINTER)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def current_version(self):
+        pointer = self.pointer()
+        return pointer["current"] if pointer else None
+
+    def activate(self, version):
+        """Point CURRENT at version; the old current becomes the rollback target"""
+        if version not in self.versions():
+            raise KeyError(f"unknown model version '{version}'")
+        current = self.current_version()
+        previous = current if current != version else (self.pointer() or {}).get("previous")
+        _write_json_atomic(os.path.join(self.root, POINTER),
+                           {"current": version, "previous": previous, "updated": time.time()})
+        return version
+
+    def rollback(self):
+        pointer = self.pointer()
+        if not pointer or not pointer.get("previous"):
+            raise KeyError("no previous model version to roll back to")
+        return self.activate(pointer["previous"])
+
+    # === Publishing ===
+    def publish(self, model_path, encoders_path, version=None, activate=False, training=None):
+        """Convert a TabNet .zip/.h5 and its encoders into a registry version.
+
+        training, if given, is stored in the manifest as is (see tabnet_train.py).
+        """
+        import torch
+
+        existing = self.versions()
+        if version is None:
+            version = f"v{len(existing) + 1}"
+            while os.path.exists(os.path.join(self.root, version)):
+                version = f"v{int(version[1:]) + 1}"
+        if version in existing:
+            raise FileExistsError(f"model version '{version}' already exists")
+
+        with zipfile.ZipFile(model_path) as z:
+            with z.open("model_params.json") as f:
+                model_params = json.load(f)
+            with z.open("network.pt") as f:
+                state_dict = torch.load(io.BytesIO(f.read()), map_location="cpu")
+
+        os.makedirs(self.root, exist_ok=True)
+        staging = os.path.join(self.root, f".{version}.{os.getpid()}.tmp")
+        os.makedirs(staging)
+        try:
+            tensors, offset = [], 0
+            with open(os.path.join(staging, "weights.bin"), "wb") as f:
+                for name, tensor in state_dict.items():
+                    array = tensor.detach().cpu().contiguous().numpy()
+                    pad = -offset % ALIGN
+                    f.write(b"\0" * pad)
+                    offset += pad
+                    f.write(array.tobytes())
+                    tensors.append({"name": name, "dtype": array.dtype.str,
+                                    "shape": list(array.shape), "offset": offset})
+                    offset += array.nbytes
+            shutil.copyfile(encoders_path, os.path.join(staging, "encoders.pkl"))
+            manifest = {
+                "format": 1,
+                "version": version,
+                "created": time.time(),
+                "model_params": model_params,
+                "tensors": tensors,
+                "source": os.path.basename(model_path),
+                "source_sha256": _file_sha256(model_path),
+            }
+            if training is not None:
+                manifest["training"] = training
+            _write_json_atomic(os.path.join(staging, "manifest.json"), manifest)
+            os.replace(staging, os.path.join(self.root, version))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        if activate:
+            self.activate(version)
+        return version
+
+    # === Loading ===
+    def load(self, version=None):
+        """(TabNetClassifier, encoders, manifest) for version (default: CURRENT).
+
+        The network's parameters and buffers are views into the mmapped
+        weights file and must be treated as read-only.
+        """
+        import joblib
+        import torch
+        from pytorch_tabnet.tab_model import TabNetClassifier
+
+        version = version or self.current_version()
+        if version is None:
+            raise KeyError(f"no current model version in {self.root}")
+        manifest = self.manifest(version)
+        path = os.path.join(self.root, version)
+
+        weights = np.memmap(os.path.join(path, "weights.bin"), dtype=np.uint8, mode="r")
+        state_dict = {}
+        with warnings.catch_warnings():
+            # torch warns that the mmapped arrays are not writable; inference never writes
+            warnings.simplefilter("ignore", UserWarning)
+            for t in manifest["tensors"]:
+                dtype = np.dtype(t["dtype"])
+                count = int(np.prod(t["shape"], dtype=np.int64))
+                view = weights[t["offset"]:t["offset"] + count * dtype.itemsize]
+                state_dict[t["name"]] = torch.from_numpy(view.view(dtype).reshape(t["shape"]))
+
+        init_params = dict(manifest["model_params"]["init_params"], device_name="cpu")
+        clf = TabNetClassifier(**init_params)
+        clf._set_network()
+        clf.network.load_state_dict(state_dict, assign=True)
+        clf.network.eval()
+        clf.load_class_attrs(manifest["model_params"]["class_attrs"])
+        encoders = joblib.load(os.path.join(path, "encoders.pkl"))
+        return clf, encoders, manifest
+
+
+def memory_usage():
+    """Resident and proportional set size of this process in bytes (Linux).
+
+    PSS divides shared pages between the processes mapping them, so summing
+    PSS across workers gives their real combined footprint.
+    """
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup", "r") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty"):
+                    usage[key.lower()] = int(rest.split()[0]) * 1024
+    except OSError:
+        pass
+    return usage
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IEPIS model registry")
+    parser.add_argument("--registry", default=REGISTRY_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    pub = sub.add_parser("publish", help="add a model version")
+    pub.add_argument("--model", default="TabnetRfHybrid.h5")
+    pub.add_argument("--encoders", default="tabnet_encoders.pkl")
+    pub.add_argument("--version")
+    pub.add_argument("--activate", action="store_true")
+    act = sub.add_parser("activate", help="make a version current")
+    act.add_argument("version")
+    sub.add_parser("rollback", help="switch back to the previous version")
+    sub.add_parser("list", help="list versions")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.registry)
+    if args.command == "publish":
+        version = registry.publish(args.model, args.encoders, args.version, args.activate)
+        print(f"✅ Published {args.model} as {version}" + (" (active)" if args.activate else ""))
+    elif args.command == "activate":
+        print(f"✅ Active model version: {registry.activate(args.version)}")
+    elif args.command == "rollback":
+        print(f"✅ Rolled back to {registry.rollback()}")
+    else:
+        pointer = registry.pointer() or {}
+        for version in registry.versions():
+            manifest = registry.manifest(version)
+            marker = "*" if version == pointer.get("current") else " "
+            print(f"{marker} {version}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(manifest['created']))}"
+                  f"  {manifest['source']}  {manifest['source_sha256'][:12]}")
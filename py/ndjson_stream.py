@@ -0,0 +1,256 @@
+"""Streaming NDJSON scoring for snapshots pushed by agents.
+
+Every input line is one snapshot::
+
+    {"host": "PC-01", "controls": {...}, "system_risk": "High"}
+    {"host": "PC-02", "controls": {...}, "software": ["Zoom 5.1", "7-Zip 23.01"]}
+
+``system_risk`` is optional. Without it, a ``software`` list (titles, or
+the raw text of software_list.txt) is refined and classified through the
+cached async GPT client, otherwise Medium is assumed. ``timestamp`` is
+optional too (``YYYY-MM-DD HH:MM:SS``); with ``store=True`` snapshots that
+have a host and a timestamp are appended to the control store, and a
+failed insert is reported on the records of that chunk as ``store_error``.
+
+``score_stream`` is a generator: it reads at most ``chunk_size`` lines,
+scores them with one encoder / TabNet / policy pass, yields one result
+line per input line in input order and only then reads on. A slow reader
+therefore throttles the input, and memory stays bounded by one chunk and
+one ``max_record_bytes`` line no matter how long the stream is. Broken
+lines produce an error record and the stream carries on. The last line is
+a ``{"summary": ...}`` record.
+
+    python ndjson_stream.py < snapshots.ndjson > results.ndjson
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import sys
+
+from metrics import counter
+
+log = logging.getLogger("iepis.stream")
+
+STREAM_CHUNK_SIZE = int(os.getenv("IEPIS_STREAM_CHUNK_SIZE", "256"))
+MAX_RECORD_BYTES = int(os.getenv("IEPIS_STREAM_MAX_RECORD_BYTES", str(1024 * 1024)))
+CONTENT_TYPE = "application/x-ndjson"
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"  # as in the audit log and the control store
+
+STREAM_RECORDS = counter("iepis_stream_records_total", "Streamed snapshots by outcome", ("outcome",))
+
+
+class RecordError(ValueError):
+    """A line that could not be turned into a snapshot"""
+
+
+def iter_lines(stream, max_bytes=MAX_RECORD_BYTES):
+    """Yield (line number, bytes) from a binary stream, one line at a time.
+
+    A line longer than max_bytes is not kept in memory; it comes back as a
+    RecordError in place of the bytes and the rest of it is skipped.
+    """
+    number = 0
+    while True:
+        line = stream.readline(max_bytes + 1)
+        if not line:
+            return
+        number += 1
+        if len(line) > max_bytes and not line.endswith(b"\n"):
+            while line and not line.endswith(b"\n"):
+                line = stream.readline(64 * 1024)
+            yield number, RecordError(f"record larger than {max_bytes} bytes")
+            continue
+        if line.strip():
+            yield number, line
+
+
+def parse_record(line):
+    """Decode and validate one NDJSON line into a snapshot dict"""
+    try:
+        record = json.loads(line)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise RecordError(f"invalid JSON: {e}")
+    if not isinstance(record, dict):
+        raise RecordError("record is not a JSON object")
+    if not isinstance(record.get("controls"), dict):
+        raise RecordError("record has no 'controls' object")
+    software = record.get("software")
+    if software is not None and not isinstance(software, (list, str)):
+        raise RecordError("'software' must be a list of titles or a string")
+    if "host" in record and not isinstance(record["host"], str):
+        raise RecordError("'host' must be a string")
+    timestamp = record.get("timestamp")
+    if timestamp is not None:
+        try:
+            if not isinstance(timestamp, str):
+                raise TypeError
+            datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+        except (TypeError, ValueError):
+            raise RecordError("'timestamp' must be a 'YYYY-MM-DD HH:MM:SS' string")
+    return record
+
+
+def _software_text(software):
+    return software if isinstance(software, str) else "\n".join(str(t) for t in software)
+
+
+def assess_software(records, loop, client_factory):
+    """Fill in system_risk for records that only sent a software list.
+
+    All such records of a chunk are assessed concurrently; returns
+    {index: fallback detail} for the ones that had to assume Medium.
+    """
+    from compare_controls import RISK_FALLBACKS
+    from gpt_async import assess_hosts
+
+    pending = {i: _software_text(r["software"]) for i, r in enumerate(records)
+               if not r.get("system_risk") and r.get("software")}
+    if not pending:
+        return {}
+    try:
+        results = loop.run_until_complete(assess_hosts(pending, client_factory()))
+    except Exception as e:
+        results = {i: {"error": str(e)} for i in pending}
+
+    fallbacks = {}
+    for i, result in results.items():
+        risk = result.get("system_risk")
+        if risk in ("Low", "Medium", "High"):
+            records[i]["system_risk"] = risk
+            continue
+        reason = "gpt_error" if "error" in result else "unexpected_label"
+        RISK_FALLBACKS.labels(reason).inc()
+        fallbacks[i] = result.get("error") or f"unexpected label '{risk}'"
+        records[i]["system_risk"] = "Medium"
+    return fallbacks
+
+
+def _dumps(doc):
+    return (json.dumps(doc, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def score_stream(stream, score_chunk, chunk_size=STREAM_CHUNK_SIZE, max_record_bytes=MAX_RECORD_BYTES,
+                 gpt_client=None, store=None):
+    """Score an NDJSON byte stream chunk by chunk, yielding NDJSON result lines.
+
+    score_chunk(snapshots) returns one result dict per snapshot in order,
+    like ml_model_api.evaluate_batch. gpt_client() builds the
+    gpt_async.AsyncGPTClient used for software lists; store is a
+    ControlStore for snapshots that carry a timestamp.
+    """
+    chunk_size = max(1, int(chunk_size))
+    totals = {"records": 0, "scored": 0, "failed": 0, "stored": 0, "store_failed": 0}
+    loop = None
+
+    def flush(chunk):
+        nonlocal loop
+        records = [item for _, item in chunk if isinstance(item, dict)]
+        fallbacks = {}
+        if any(not r.get("system_risk") and r.get("software") for r in records):
+            if loop is None:
+                loop = asyncio.new_event_loop()
+            from gpt_async import AsyncGPTClient
+            fallbacks = assess_software(records, loop, gpt_client or AsyncGPTClient)
+
+        # A record without a host is reported as line-N, but is not sent as that host
+        snapshots = [{**({"host": r["host"]} if "host" in r else {}), "controls": r["controls"],
+                      "system_risk": r.get("system_risk")}
+                     for r in records]
+        try:
+            scored = iter(score_chunk(snapshots) if snapshots else ())
+        except Exception as e:
+            log.exception("Chunk scoring failed")
+            scored = iter([{"host": s.get("host"), "error": "Scoring failed", "detail": str(e)} for s in snapshots])
+        store_errors = {}
+        if store is not None:
+            # Only records that name their host; a line number is not a device
+            keep = [i for i, r in enumerate(records) if r.get("host") and r.get("timestamp")]
+            try:
+                totals["stored"] += store.insert_many([
+                    (records[i]["host"], records[i]["timestamp"], records[i]["controls"]) for i in keep
+                ])
+            except Exception as e:
+                log.exception("Storing %d snapshots failed", len(keep))
+                totals["store_failed"] += len(keep)
+                store_errors = dict.fromkeys(keep, str(e))
+
+        out = []
+        valid = 0
+        for number, item in chunk:
+            if isinstance(item, dict):
+                result = {"line": number, **next(scored)}
+                if "host" not in item:
+                    result["host"] = f"line-{number}"
+                if valid in fallbacks:
+                    result["system_risk_fallback"] = True
+                    result["system_risk_detail"] = fallbacks[valid]
+                if valid in store_errors:
+                    result["store_error"] = store_errors[valid]
+                valid += 1
+            else:
+                result = {"line": number, "error": "Invalid record", "detail": str(item)}
+            failed = "error" in result
+            totals["failed" if failed else "scored"] += 1
+            STREAM_RECORDS.labels("failed" if failed else "scored").inc()
+            out.append(_dumps(result))
+        return b"".join(out)
+
+    try:
+        chunk = []
+        for number, line in iter_lines(stream, max_record_bytes):
+            totals["records"] += 1
+            if not isinstance(line, RecordError):
+                try:
+                    line = parse_record(line)
+                except RecordError as e:
+                    line = e
+            chunk.append((number, line))
+            if len(chunk) >= chunk_size:
+                yield flush(chunk)
+                chunk = []
+        if chunk:
+            yield flush(chunk)
+    finally:
+        if loop is not None:
+            loop.close()
+    log.info("📦 Stream done: %d records, %d scored, %d failed",
+             totals["records"], totals["scored"], totals["failed"])
+    yield _dumps({"summary": totals})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score NDJSON snapshots from a file or stdin")
+    parser.add_argument("input", nargs="?", help="NDJSON file (default: stdin)")
+    parser.add_argument("-o", "--output", help="write results here (default: stdout)")
+    parser.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_SIZE)
+    parser.add_argument("--store", action="store_true", help="append timestamped snapshots to the control store")
+    args = parser.parse_args(argv)
+
+    from control_store import ControlStore
+    from log_config import setup_logging
+    from ml_model_api import create_app, evaluate_batch
+
+    setup_logging()
+    app = create_app({"MODEL_LOAD": "eager", "MODEL_POLL_SECONDS": 0})
+    loaded = app.extensions["iepis_model"].wait()
+
+    source = open(args.input, "rb") if args.input else sys.stdin.buffer
+    sink = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for block in score_stream(source, lambda snapshots: evaluate_batch(loaded, snapshots),
+                                  args.chunk_size, store=ControlStore() if args.store else None):
+            sink.write(block)
+            sink.flush()
+    finally:
+        if args.input:
+            source.close()
+        if args.output:
+            sink.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,15 @@
-import os, re, json, time, subprocess, sys
-from openai import OpenAI
+import os, re, json, time, random, subprocess, sys, sqlite3, hashlib, threading, logging
+from audit_log import LOG_DIR
+from metrics import callback, counter, stage
+from software_filter import estimate_tokens, get_software_rules
+
+log = logging.getLogger("iepis.gpt")
+GPT_RETRIES = counter("iepis_gpt_retries_total", "GPT requests retried after an error")
+GPT_FAILURES = counter("iepis_gpt_failures_total", "GPT requests that failed after all retries")
+PROMPT_TOKENS_SAVED = counter("iepis_gpt_prompt_tokens_saved_total",
+                              "Estimated refine-prompt tokens not sent thanks to the prefilter and title cache")
 
 API_KEY = os.getenv("OPENAI_API_KEY")
-if not API_KEY:
-    print("❌ OPENAI_API_KEY not set"); sys.exit(1)
 
 RAW_FILE = "software_list.txt"
 PS = r"C:\Windows\System32\WindowsPowerShell\v1.0\powershell.exe"
@@ -13,52 +19,489 @@ $list2 = Get-ItemProperty 'HKLM:\Software\Wow6432Node\Microsoft\Windows\CurrentV
 ($list1 + $list2) | Sort-Object -Unique
 """
 
-client = OpenAI(api_key=API_KEY)
+MODEL = "gpt-4-1106-preview"  # OK; or a newer gpt-4o-mini if you prefer
+SYSTEM_PROMPT = "Reply concisely. If asked for a class label, reply with a single word."
+REFINE_PROMPT = "From the following list, return ONLY end-user applications (one per line). Do not include system components:\n\n"
+CLASSIFY_PROMPT = "Classify system risk as one word (Low, Medium, or High) based ONLY on this end-user software list:\n\n{refined}\n\nReturn exactly one of: Low | Medium | High."
+
+# Persistent GPT result cache ("" disables it), next to the other stores in LOG_DIR
+CACHE_PATH = os.getenv("IEPIS_GPT_CACHE", os.path.join(LOG_DIR, "gpt_cache.sqlite3"))
+CACHE_TTL = float(os.getenv("IEPIS_GPT_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("IEPIS_GPT_CACHE_MAX_ENTRIES", "50000"))
+
+# Local software risk classifier, trained from the GPT labels in the cache
+# (see train_local_classifier); GPT is only asked below the confidence threshold
+LOCAL_MODEL_PATH = os.getenv("IEPIS_LOCAL_RISK_MODEL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "software_risk_model.pkl"))
+LOCAL_THRESHOLD = float(os.getenv("IEPIS_LOCAL_RISK_THRESHOLD", "0.8"))
+LOCAL_RISK = counter("iepis_local_risk_total", "Risk classifications by who answered", ("source",))
+
+# Long-lived client, created on first use so importing this module stays cheap
+_client = None
+
+def get_client():
+    global _client
+    if _client is None:
+        if not API_KEY:
+            raise RuntimeError("OPENAI_API_KEY not set")
+        from openai import OpenAI  # ~1s import, only paid when GPT is actually called
+        _client = OpenAI(api_key=API_KEY)
+    return _client
+
+def normalize_title(title: str) -> str:
+    return " ".join(title.split()).casefold()
+
+def list_fingerprint(titles) -> str:
+    """Order- and case-insensitive fingerprint of a software list"""
+    joined = "\n".join(sorted({normalize_title(t) for t in titles if t.strip()}))
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()
+
+def prompt_namespace() -> str:
+    """Changes whenever the model, a prompt or the software rules change, invalidating the cache"""
+    key = "\x00".join([MODEL, SYSTEM_PROMPT, REFINE_PROMPT, CLASSIFY_PROMPT, get_software_rules().fingerprint])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+class SoftwareCache:
+    """SQLite cache of GPT refinement/classification results.
+
+    ``titles`` remembers, per normalized application title, whether GPT kept
+    it as an end-user application. ``lists`` maps a list fingerprint to the
+    refined list ("refine") or to the risk label ("classify"). Entries expire
+    after ``ttl`` seconds and each table keeps at most ``max_entries`` rows,
+    evicting the least recently used. The whole cache is dropped when the
+    prompt namespace (model, prompts and software rules) changes.
+
+    ``labels`` keeps every (refined list, GPT risk label) pair as training
+    data for the local classifier; it survives expiry and invalidation and
+    is capped at ``max_entries`` rows, dropping the oldest.
+    """
+
+    def __init__(self, path, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, namespace=None):
+        self.path, self.ttl, self.max_entries = path, ttl, max_entries
+        self.stats = {"title_hits": 0, "title_misses": 0, "list_hits": 0, "list_misses": 0}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS titles (
+                title TEXT PRIMARY KEY, is_app INTEGER, created REAL, accessed REAL);
+            CREATE TABLE IF NOT EXISTS lists (
+                kind TEXT, fingerprint TEXT, value TEXT, created REAL, accessed REAL,
+                PRIMARY KEY (kind, fingerprint));
+            CREATE TABLE IF NOT EXISTS labels (
+                fingerprint TEXT PRIMARY KEY, refined TEXT, label TEXT, namespace TEXT, created REAL);
+        """)
+        self.use_namespace(namespace or prompt_namespace())
+
+    def use_namespace(self, namespace):
+        """Switch to namespace, dropping entries cached under another one"""
+        with self._lock:
+            self.namespace = namespace
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'namespace'").fetchone()
+            if row is not None and row[0] == namespace:
+                return
+        self.invalidate()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('namespace', ?)", (namespace,))
+            self._db.commit()
+
+    def invalidate(self):
+        with self._lock:
+            self._db.execute("DELETE FROM titles")
+            self._db.execute("DELETE FROM lists")
+            self._db.commit()
+
+    def get_titles(self, titles) -> dict:
+        """Return {normalized title: is_app} for the titles that are cached"""
+        now, found = time.time(), {}
+        keys = list({normalize_title(t) for t in titles})
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT title, is_app FROM titles WHERE created > ? AND title IN ({','.join('?' * len(chunk))})",
+                    [now - self.ttl] + chunk).fetchall()
+                found.update((t, bool(v)) for t, v in rows)
+            self._db.executemany("UPDATE titles SET accessed = ? WHERE title = ?", [(now, t) for t in found])
+            self._db.commit()
+            self.stats["title_hits"] += len(found)
+            self.stats["title_misses"] += len(keys) - len(found)
+        return found
+
+    def put_titles(self, decisions: dict):
+        now = time.time()
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO titles VALUES (?, ?, ?, ?)",
+                                 [(normalize_title(t), int(v), now, now) for t, v in decisions.items()])
+            self._evict("titles")
+            self._db.commit()
 
-def save_installed_software_to_file(path: str):
+    def get_list(self, kind: str, fingerprint: str):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM lists WHERE kind = ? AND fingerprint = ? AND created > ?",
+                (kind, fingerprint, now - self.ttl)).fetchone()
+            if row is None:
+                self.stats["list_misses"] += 1
+                return None
+            self._db.execute("UPDATE lists SET accessed = ? WHERE kind = ? AND fingerprint = ?",
+                             (now, kind, fingerprint))
+            self._db.commit()
+            self.stats["list_hits"] += 1
+            return row[0]
+
+    def put_list(self, kind: str, fingerprint: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO lists VALUES (?, ?, ?, ?, ?)",
+                             (kind, fingerprint, value, now, now))
+            self._evict("lists")
+            self._db.commit()
+
+    def put_label(self, fingerprint: str, refined: str, label: str):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?, ?)",
+                             (fingerprint, refined, label, self.namespace, time.time()))
+            (count,) = self._db.execute("SELECT COUNT(*) FROM labels").fetchone()
+            if count > self.max_entries:
+                self._db.execute("DELETE FROM labels WHERE rowid IN (SELECT rowid FROM labels ORDER BY created LIMIT ?)",
+                                 (count - self.max_entries,))
+            self._db.commit()
+
+    def training_pairs(self) -> list:
+        """[(refined list, GPT label)] from the labels table, plus classify
+        entries whose refined list is still in the refine entries"""
+        with self._lock:
+            pairs = {fp: (refined, label) for fp, refined, label in
+                     self._db.execute("SELECT fingerprint, refined, label FROM labels")}
+            classify = dict(self._db.execute("SELECT fingerprint, value FROM lists WHERE kind = 'classify'"))
+            refined_lists = [v for (v,) in self._db.execute("SELECT value FROM lists WHERE kind = 'refine'")]
+        for refined in refined_lists:
+            fp = list_fingerprint(refined.splitlines())
+            if fp in classify and fp not in pairs:
+                pairs[fp] = (refined, classify[fp])
+        return [p for p in pairs.values() if p[1] in ("Low", "Medium", "High")]
+
+    def _evict(self, table: str):
+        self._db.execute(f"DELETE FROM {table} WHERE created <= ?", (time.time() - self.ttl,))
+        (count,) = self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+        if count > self.max_entries:
+            self._db.execute(
+                f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} ORDER BY accessed LIMIT ?)",
+                (count - self.max_entries,))
+
+
+_cache = None
+
+def get_cache():
+    """Process-wide SoftwareCache, or None when IEPIS_GPT_CACHE is empty"""
+    global _cache
+    if _cache is None and CACHE_PATH:
+        _cache = SoftwareCache(CACHE_PATH)
+    elif _cache is not None and _cache.namespace != prompt_namespace():
+        _cache.use_namespace(prompt_namespace())  # rules reloaded since
+    return _cache
+
+def cache_stats() -> dict:
+    cache = get_cache()
+    return dict(cache.stats) if cache else {}
+
+callback("iepis_gpt_cache_events_total", "GPT cache lookups by outcome",
+         lambda: {(k,): v for k, v in (dict(_cache.stats) if _cache else {}).items()},
+         ("event",), kind="counter")
+
+def invalidate_cache():
+    cache = get_cache()
+    if cache: cache.invalidate()
+
+INVENTORY_ERROR = "Error: Unable to retrieve installed software.\n"
+
+def inventory_is_fresh(path: str, max_age: float) -> bool:
+    """True if path holds an inventory (not the error placeholder) written less than max_age seconds ago"""
+    if not max_age:
+        return False
+    try:
+        if time.time() - os.path.getmtime(path) >= max_age:
+            return False
+        with open(path, "r", encoding="utf-8") as f:
+            return not f.read(len(INVENTORY_ERROR)).startswith("Error: Unable to retrieve")
+    except OSError:
+        return False
+
+@stage("inventory")
+def save_installed_software_to_file(path: str, max_age: float = 0):
+    """Write the uninstall-registry software list to path.
+
+    If max_age is set and path holds an inventory refreshed less than
+    max_age seconds ago, the PowerShell inventory is skipped and the
+    existing file is kept. A failed run's placeholder is never reused.
+    """
+    if inventory_is_fresh(path, max_age):
+        return
     try:
         out = subprocess.check_output([PS, "-Command", PS_SCRIPT], text=True, stderr=subprocess.STDOUT, timeout=60)
         lines = [ln.strip() for ln in out.splitlines() if ln.strip()]
         with open(path, "w", encoding="utf-8") as f: f.write("\n".join(lines))
-        print(f"✅ Saved {len(lines)} entries → {path}")
+        log.info("✅ Saved %d entries → %s", len(lines), path)
     except Exception as e:
-        with open(path, "w", encoding="utf-8") as f: f.write("Error: Unable to retrieve installed software.\n")
-        print(f"❌ PowerShell error: {e}")
+        with open(path, "w", encoding="utf-8") as f: f.write(INVENTORY_ERROR)
+        log.error("❌ PowerShell error: %s", e)
+
+def backoff_delay(attempt: int, base: float = 2, cap: float = 30) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
 
 def gpt_call(prompt: str, tries=3, delay=2):
     for i in range(tries):
         try:
-            r = client.chat.completions.create(
-                model="gpt-4-1106-preview",  # OK; or a newer gpt-4o-mini if you prefer
+            r = get_client().chat.completions.create(
+                model=MODEL,
                 messages=[
-                    {"role":"system","content":"Reply concisely. If asked for a class label, reply with a single word."},
+                    {"role":"system","content":SYSTEM_PROMPT},
                     {"role":"user","content": prompt}
                 ],
                 temperature=0
             )
             return r.choices[0].message.content.strip()
         except Exception as e:
-            if i == tries-1: raise
-            time.sleep(delay*(i+1))
+            if i == tries-1:
+                GPT_FAILURES.inc(); raise
+            GPT_RETRIES.inc()
+            log.warning("GPT call failed (attempt %d/%d): %s", i + 1, tries, e)
+            time.sleep(backoff_delay(i, delay))
 
-def refine_user_software(path: str) -> str:
-    raw = open(path, "r", encoding="utf-8").read()
+def run_steps(steps, call):
+    """Drive a *_steps generator, answering each yielded prompt with call(prompt).
+
+    A failed call is raised inside the generator, which may handle it.
+    """
+    try:
+        prompt = next(steps)
+        while True:
+            try: answer = call(prompt)
+            except Exception as e: prompt = steps.throw(e)
+            else: prompt = steps.send(answer)
+    except StopIteration as done:
+        return done.value
+
+def _kept_titles(titles, refined: str) -> dict:
+    """Map each title to whether GPT kept it in its refined answer"""
+    kept = {normalize_title(ln.lstrip("-•* ")) for ln in refined.splitlines() if ln.strip()}
+    # GPT sometimes drops a version suffix, so a kept prefix counts as a match
+    return {t: normalize_title(t) in kept or any(normalize_title(t).startswith(k + " ") for k in kept)
+            for t in titles}
+
+def refine_steps(raw: str, report: dict = None):
+    """Refinement logic shared by the sync and async clients.
+
+    A generator that yields GPT prompts, receives their answers via send()
+    and returns the refined list; see run_steps() and gpt_async. Versions
+    of the same title are collapsed and known system components / apps are
+    decided by software_filter first; only ambiguous titles GPT has not
+    judged before are sent. Prefilter counts and prompt-token savings are
+    written to report, if given.
+    """
     if "Unable to retrieve" in raw:
-        print("⚠️ Skipping refinement"); return ""
-    prompt = "From the following list, return ONLY end-user applications (one per line). Do not include system components:\n\n" + raw
-    refined = gpt_call(prompt)
-    print("✅ Refined list ready"); return refined
+        log.warning("⚠️ Skipping refinement"); return ""
+    titles = list(dict.fromkeys(ln.strip() for ln in raw.splitlines() if ln.strip()))
+    cache = get_cache()
+    fingerprint = list_fingerprint(titles)
+    refined = cache.get_list("refine", fingerprint) if cache else None
+    if refined is not None:
+        if report is not None: report["cached"] = True
+        log.info("✅ Refined list ready (cached)"); return refined
 
-def classify_risk(refined: str) -> str:
-    if not refined: return "UNKNOWN"
-    prompt = f"Classify system risk as one word (Low, Medium, or High) based ONLY on this end-user software list:\n\n{refined}\n\nReturn exactly one of: Low | Medium | High."
-    label = gpt_call(prompt)
+    pre = get_software_rules().prefilter(titles)
+    decided = {normalize_title(t): v for t, v in pre.decided.items()}
+    unseen = pre.ambiguous
+    if cache:
+        decided.update(cache.get_titles(unseen))
+        unseen = [t for t in unseen if normalize_title(t) not in decided]
+    if unseen:
+        prompt = REFINE_PROMPT + "\n".join(unseen)
+        decisions = _kept_titles(unseen, (yield prompt))
+        if cache: cache.put_titles(decisions)
+        decided.update((normalize_title(t), v) for t, v in decisions.items())
+    refined = "\n".join(t for t in pre.titles if decided.get(normalize_title(t)))
+    if cache: cache.put_list("refine", fingerprint, refined)
+
+    stats = pre.report(REFINE_PROMPT)
+    stats["sent"] = len(unseen)
+    stats["tokens_sent"] = estimate_tokens(prompt) if unseen else 0
+    stats["tokens_saved"] = stats["tokens_full"] - stats["tokens_sent"]
+    PROMPT_TOKENS_SAVED.inc(stats["tokens_saved"])
+    if report is not None: report.update(stats)
+    log.info("✅ Refined list ready (%d of %d titles sent to GPT, ~%d prompt tokens saved)",
+             len(unseen), stats["titles"], stats["tokens_saved"], extra={"prefilter": stats}); return refined
+
+def parse_risk_label(label: str) -> str:
     m = re.search(r"\b(low|medium|high)\b", label, re.I)
-    risk = m.group(1).capitalize() if m else "UNKNOWN"
-    print(f"📊 SYSTEM RISK LEVEL: {risk}")
+    return m.group(1).capitalize() if m else "UNKNOWN"
+
+def classify_steps(refined: str):
+    """Classification logic shared by the sync and async clients (see refine_steps).
+
+    Cache first, then the local classifier if it is confident enough, then
+    GPT. If GPT fails, a low-confidence local answer beats the caller's
+    Medium fallback.
+    """
+    if not refined: return "UNKNOWN"
+    cache = get_cache()
+    fingerprint = list_fingerprint(refined.splitlines())
+    risk = cache.get_list("classify", fingerprint) if cache else None
+    if risk is None:
+        local = local_risk(refined)
+        if local and local[1] >= LOCAL_THRESHOLD:
+            LOCAL_RISK.labels("local").inc()
+            log.info("📊 SYSTEM RISK LEVEL: %s (local, p=%.2f)", *local); return local[0]
+        try:
+            risk = parse_risk_label((yield CLASSIFY_PROMPT.format(refined=refined)))
+        except Exception as e:
+            if local is None: raise
+            LOCAL_RISK.labels("gpt_failed").inc()
+            log.warning("⚠️ GPT classification failed (%s), using local answer %s (p=%.2f)", e, *local)
+            return local[0]
+        LOCAL_RISK.labels("gpt").inc()
+        if cache and risk != "UNKNOWN":
+            cache.put_list("classify", fingerprint, risk)
+            cache.put_label(fingerprint, refined, risk)
+    log.info("📊 SYSTEM RISK LEVEL: %s", risk)
     return risk
 
+
+# === Local risk classifier ===
+def classifier_text(refined: str) -> str:
+    """Order- and case-insensitive document for a refined software list"""
+    return "\n".join(sorted({normalize_title(t) for t in refined.splitlines() if t.strip()}))
+
+def build_classifier(n_features=2 ** 18, C=4.0):
+    """Hashed character n-grams of the titles + multinomial logistic regression"""
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    return make_pipeline(
+        HashingVectorizer(analyzer="char_wb", ngram_range=(3, 5), n_features=n_features, alternate_sign=False),
+        LogisticRegression(C=C, max_iter=1000))
+
+def evaluate_classifier(model, texts, labels, threshold=LOCAL_THRESHOLD) -> dict:
+    """Agreement with GPT overall and on the confident answers used without GPT"""
+    if not len(labels): raise ValueError("no labelled software lists to evaluate on")
+    proba = model.predict_proba(list(texts))
+    agree = model.classes_[proba.argmax(axis=1)] == labels
+    confident = proba.max(axis=1) >= threshold
+    return {
+        "samples": len(labels),
+        "agreement": float(agree.mean()),
+        "coverage": float(confident.mean()),
+        "confident_agreement": float(agree[confident].mean()) if confident.any() else None,
+        "threshold": threshold,
+    }
+
+def train_local_classifier(pairs, holdout=0.2, seed=0, threshold=LOCAL_THRESHOLD):
+    """Fit on (refined list, GPT label) pairs; returns (model, holdout report).
+
+    The report scores a model fitted without the holdout; the returned
+    model is then refitted on every pair.
+    """
+    import numpy as np
+    texts = np.array([classifier_text(r) for r, _ in pairs], dtype=object)
+    labels = np.array([label for _, label in pairs])
+    if len(set(labels)) < 2:
+        raise ValueError(f"need at least two risk labels to train, got {sorted(set(labels))}")
+    order = np.random.default_rng(seed).permutation(len(pairs))
+    n_test = int(len(pairs) * holdout)
+    test, train = order[:n_test], order[n_test:]
+    report = None
+    if n_test and len(set(labels[train])) > 1:
+        report = evaluate_classifier(build_classifier().fit(texts[train], labels[train]), texts[test], labels[test], threshold)
+    model = build_classifier().fit(texts, labels)
+    return model, report
+
+def save_local_classifier(model, path=LOCAL_MODEL_PATH, report=None):
+    import joblib
+    tmp = path + ".tmp"
+    joblib.dump({"model": model, "report": report, "trained": time.time(), "namespace": prompt_namespace()}, tmp)
+    os.replace(tmp, path)
+
+_local = {"mtime": None, "model": None, "namespace": None, "stale": None}
+_local_lock = threading.Lock()
+
+def get_local_classifier():
+    """The saved classifier, reloaded when the file changes; None if there is
+    none or it was trained on labels from other prompts / software rules"""
+    try: mtime = os.path.getmtime(LOCAL_MODEL_PATH)
+    except OSError: return None
+    if mtime != _local["mtime"]:
+        with _local_lock:
+            if mtime != _local["mtime"]:
+                try:
+                    import joblib
+                    saved = joblib.load(LOCAL_MODEL_PATH)
+                    _local["model"], _local["namespace"] = saved["model"], saved.get("namespace")
+                    log.info("✅ Local risk classifier loaded from %s", LOCAL_MODEL_PATH)
+                except Exception as e:
+                    _local["model"] = None
+                    log.warning("⚠️ Could not load local risk classifier: %s", e)
+                _local["mtime"], _local["stale"] = mtime, None
+    namespace = prompt_namespace()
+    if _local["model"] is not None and _local["namespace"] != namespace:
+        if _local["stale"] != namespace:  # warn once per rules / prompt change
+            _local["stale"] = namespace
+            log.warning("⚠️ Local risk classifier was trained under another prompt namespace; ignoring it "
+                        "until it is retrained (python risk_assisment_modified.py train)")
+        return None
+    return _local["model"]
+
+def local_risk(refined: str):
+    """(label, probability) from the local classifier, or None without one"""
+    model = get_local_classifier()
+    if model is None: return None
+    proba = model.predict_proba([classifier_text(refined)])[0]
+    best = int(proba.argmax())
+    return str(model.classes_[best]), float(proba[best])
+
+@stage("gpt_refine")
+def refine_user_software(path: str) -> str:
+    raw = open(path, "r", encoding="utf-8").read()
+    return run_steps(refine_steps(raw), gpt_call)
+
+@stage("gpt_classify")
+def classify_risk(refined: str) -> str:
+    return run_steps(classify_steps(refined), gpt_call)
+
+def classifier_cli(argv):
+    import argparse
+    import numpy as np
+    parser = argparse.ArgumentParser(description="Train or evaluate the local software risk classifier offline")
+    parser.add_argument("command", choices=("train", "eval"))
+    parser.add_argument("--cache", default=CACHE_PATH, help="GPT cache holding the labelled software lists")
+    parser.add_argument("--model", default=LOCAL_MODEL_PATH)
+    parser.add_argument("--holdout", type=float, default=0.2, help="share of pairs kept out to measure agreement")
+    parser.add_argument("--threshold", type=float, default=LOCAL_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    pairs = SoftwareCache(args.cache).training_pairs()
+    print(f"📥 {len(pairs)} labelled software lists in {args.cache}")
+    if args.command == "train":
+        model, report = train_local_classifier(pairs, args.holdout, threshold=args.threshold)
+        save_local_classifier(model, args.model, report)
+        print(f"✅ Saved {args.model}")
+    else:
+        import joblib
+        model = joblib.load(args.model)["model"]
+        report = evaluate_classifier(model, [classifier_text(r) for r, _ in pairs],
+                                     np.array([label for _, label in pairs]), args.threshold)
+    print(json.dumps(report, indent=2))
+
 if __name__ == "__main__":
+    from log_config import setup_logging
+    setup_logging()
+    if sys.argv[1:2] and sys.argv[1] in ("train", "eval"):
+        classifier_cli(sys.argv[1:]); sys.exit(0)
+    if not API_KEY:
+        print("❌ OPENAI_API_KEY not set"); sys.exit(1)
     save_installed_software_to_file(RAW_FILE)
     refined = refine_user_software(RAW_FILE)
     risk = classify_risk(refined)
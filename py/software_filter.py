@@ -0,0 +1,165 @@
+"""Local prefilter for the installed-software list sent to GPT.
+
+The uninstall registry lists every driver, runtime and per-version
+component separately, and refinement only exists to throw those away.
+Before anything goes to GPT, each title is normalized (lower case, no
+versions, architectures, locales or (R)/(TM)) and
+
+* titles that normalize to the same name are collapsed into one, so
+  "Microsoft .NET Runtime - 6.0.20 (x64)" and "... - 8.0.6 (x64)" count once
+* names matching a ``system`` pattern of ``software_rules.json`` are dropped
+* names matching an ``application`` pattern are kept without asking
+
+Only the remaining, ambiguous names are sent to GPT. Each pattern set is
+compiled into one regular expression, so a title costs a single search.
+Extend the rules by editing ``software_rules.json`` (or point
+``IEPIS_SOFTWARE_RULES`` at your own copy) and bump its version; any
+change to the rules starts a fresh GPT cache namespace.
+
+    python software_filter.py software_list.txt
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+from typing import NamedTuple
+
+RULES_FILE = os.getenv(
+    "IEPIS_SOFTWARE_RULES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "software_rules.json")
+)
+
+_TRADEMARKS = re.compile(r"\((r|tm|c)\)|[®™©]", re.I)
+_ARCH = re.compile(r"\(?\b(x64|x86|amd64|arm64|win64|win32|64-?bit|32-?bit|64 bit|32 bit)\b\)?", re.I)
+_LOCALE = re.compile(r"\s-\s[a-z]{2}-[a-z]{2}$", re.I)
+_VERSION = re.compile(r"\bv?\d+(\.\d+)+[a-z\d]*\b|\b\d{4,}\b|\bversion\b", re.I)
+_SEPARATORS = re.compile(r"[\s\-:,()]+$|^[\s\-:,()]+|\(\s*\)")
+_SPACES = re.compile(r"\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough prompt size (~4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def normalize_name(title: str) -> str:
+    """Version-, architecture- and locale-free lower case name used for dedupe and rules"""
+    name = _TRADEMARKS.sub("", title)
+    name = _LOCALE.sub("", name)
+    name = _ARCH.sub(" ", name)
+    name = _VERSION.sub(" ", name)
+    name = _SPACES.sub(" ", name).strip()
+    previous = None
+    while previous != name:
+        previous, name = name, _SEPARATORS.sub("", name).strip()
+    return name.casefold()
+
+
+class Prefiltered(NamedTuple):
+    titles: list      # one representative title per normalized name, input order
+    decided: dict     # representative -> True (application) / False (system), by rule
+    ambiguous: list   # representatives the rules could not decide
+    groups: dict      # representative -> every input title it stands for
+    rules: dict       # representative -> pattern that decided it
+
+    def report(self, prompt=""):
+        """Title counts and estimated refine-prompt tokens with and without the prefilter"""
+        full = estimate_tokens(prompt + "\n".join(t for group in self.groups.values() for t in group))
+        sent = estimate_tokens(prompt + "\n".join(self.ambiguous)) if self.ambiguous else 0
+        return {
+            "titles": sum(len(g) for g in self.groups.values()),
+            "unique": len(self.titles),
+            "system": sum(1 for v in self.decided.values() if not v),
+            "application": sum(1 for v in self.decided.values() if v),
+            "ambiguous": len(self.ambiguous),
+            "tokens_full": full,
+            "tokens_sent": sent,
+            "tokens_saved": full - sent,
+        }
+
+
+class SoftwareRules:
+    def __init__(self, system=(), application=(), version=None):
+        self.version = version
+        self.system_patterns = list(system)
+        self.application_patterns = list(application)
+        self._system = self._compile(self.system_patterns)
+        self._application = self._compile(self.application_patterns)
+        # Part of the GPT cache namespace: refined lists depend on the rules
+        doc = json.dumps([version, self.system_patterns, self.application_patterns])
+        self.fingerprint = hashlib.sha256(doc.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def _compile(patterns):
+        if not patterns:
+            return None
+        return re.compile("|".join(f"(?P<p{i}>{p})" for i, p in enumerate(patterns)), re.I)
+
+    @classmethod
+    def from_file(cls, path=RULES_FILE):
+        with open(path, "r") as f:
+            doc = json.load(f)
+        return cls(doc.get("system", ()), doc.get("application", ()), doc.get("version"))
+
+    def classify(self, name):
+        """(is_app, pattern) for a normalized name, or (None, None) if no rule matches"""
+        for regex, patterns, verdict in ((self._system, self.system_patterns, False),
+                                         (self._application, self.application_patterns, True)):
+            match = regex.search(name) if regex else None
+            if match:
+                return verdict, patterns[int(match.lastgroup[1:])]
+        return None, None
+
+    def prefilter(self, titles):
+        groups, names = {}, {}
+        for title in titles:
+            title = title.strip()
+            if not title:
+                continue
+            name = normalize_name(title) or title.casefold()
+            rep = names.setdefault(name, title)
+            groups.setdefault(rep, []).append(title)
+
+        decided, rules, ambiguous = {}, {}, []
+        for name, rep in names.items():
+            verdict, pattern = self.classify(name)
+            if verdict is None:
+                ambiguous.append(rep)
+            else:
+                decided[rep], rules[rep] = verdict, pattern
+        return Prefiltered(list(names.values()), decided, ambiguous, groups, rules)
+
+
+_rules = None
+
+
+def get_software_rules():
+    """Process-wide rules compiled from RULES_FILE on first use"""
+    global _rules
+    if _rules is None:
+        _rules = SoftwareRules.from_file()
+    return _rules
+
+
+def reload_software_rules(path=RULES_FILE):
+    global _rules
+    _rules = SoftwareRules.from_file(path)
+    return _rules
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show what the prefilter does with a software list")
+    parser.add_argument("software_list", nargs="?", default="software_list.txt")
+    parser.add_argument("--rules", default=RULES_FILE)
+    args = parser.parse_args()
+
+    with open(args.software_list, "r", encoding="utf-8") as f:
+        titles = f.read().splitlines()
+    rules = SoftwareRules.from_file(args.rules)
+    result = rules.prefilter(titles)
+    for rep in result.titles:
+        verdict = result.decided.get(rep)
+        mark = "❓" if verdict is None else "✅" if verdict else "🗑️"
+        extra = f" (+{len(result.groups[rep]) - 1} similar)" if len(result.groups[rep]) > 1 else ""
+        print(f"{mark} {rep}{extra}" + (f"  [{result.rules[rep]}]" if rep in result.rules else ""))
+    print(json.dumps(result.report(), indent=2))
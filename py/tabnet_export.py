@@ -0,0 +1,236 @@
+"""TorchScript export and a lean CPU runner for the TabNet risk model.
+
+``TabNetClassifier.predict`` goes through pytorch_tabnet's DataLoader loop
+on every call. The export step traces the loaded network once into a
+TorchScript artifact, optionally with dynamic int8 quantization of the
+Linear layers:
+
+    python tabnet_export.py --model TabnetRfHybrid.h5 --out TabnetRfHybrid.pt [--quantize] [--check]
+
+``TorchScriptRunner`` loads the artifact with a fixed thread count, runs it
+under ``torch.inference_mode`` and copies inputs into a preallocated
+buffer. It exposes the same ``predict`` / ``predict_proba`` interface as
+``TabNetClassifier``, so ``ml_model_api`` can use it as the model
+(``IEPIS_INFERENCE_RUNNER=torchscript``).
+
+``--check`` compares the exported model with ``TabNetClassifier.predict``
+on a synthetic dataset and fails if they disagree; the artifact is only
+moved to --out once the check passed.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+TORCH_THREADS = int(os.getenv("IEPIS_TORCH_THREADS", "1"))
+RUNNER_MAX_BATCH = int(os.getenv("IEPIS_RUNNER_MAX_BATCH", "1024"))
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _inference_sparsemax():
+    """Tensor-only sparsemax (last dim) that TorchScript can serialize.
+
+    pytorch_tabnet implements sparsemax as an autograd.Function, which
+    tracing can record but not save; the forward math here is the same.
+    """
+    import torch
+
+    class InferenceSparsemax(torch.nn.Module):
+        def forward(self, x):
+            x = x - x.max(dim=-1, keepdim=True)[0]
+            srt = torch.sort(x, descending=True, dim=-1)[0]
+            cumsum = srt.cumsum(-1) - 1
+            rhos = torch.arange(1, x.size(-1) + 1, dtype=x.dtype, device=x.device)
+            support_size = (rhos * srt > cumsum).sum(dim=-1, keepdim=True)
+            tau = cumsum.gather(-1, support_size - 1) / support_size.to(x.dtype)
+            return torch.clamp(x - tau, min=0)
+
+    return InferenceSparsemax()
+
+
+def export_torchscript(model_path, out_path, quantize=False):
+    """Trace the TabNet network in model_path to a TorchScript file.
+
+    Writes out_path plus out_path + ".json" with the metadata the runner
+    needs (class mapping, input width) and returns that metadata.
+    """
+    import torch
+    from pytorch_tabnet import sparsemax, tab_network
+    from pytorch_tabnet.tab_model import TabNetClassifier
+
+    clf = TabNetClassifier()
+    clf.load_model(model_path)
+    network = clf.network.cpu().eval()
+
+    # Ghost batch norm splits the batch into chunks, and tracing would bake
+    # in the chunk count. In eval mode the chunks all use the running stats,
+    # so a single chunk gives identical results for any batch size.
+    for module in network.modules():
+        if isinstance(module, tab_network.GBN):
+            module.virtual_batch_size = 2 ** 31
+        if isinstance(module, tab_network.AttentiveTransformer):
+            if not isinstance(module.selector, sparsemax.Sparsemax):
+                raise NotImplementedError("only mask_type='sparsemax' models can be exported")
+            module.selector = _inference_sparsemax()
+
+    class Probabilities(torch.nn.Module):
+        def __init__(self, net):
+            super().__init__()
+            self.net = net
+
+        def forward(self, x):
+            logits, _ = self.net(x)
+            return torch.softmax(logits, dim=1)
+
+    wrapper = Probabilities(network).eval()
+    if quantize:
+        wrapper = torch.ao.quantization.quantize_dynamic(wrapper, {torch.nn.Linear}, dtype=torch.qint8)
+
+    input_dim = clf.input_dim
+    with torch.no_grad():
+        traced = torch.jit.trace(wrapper, torch.zeros(8, input_dim))
+    traced = torch.jit.freeze(traced)
+    traced.save(out_path)
+
+    meta = {
+        "format": "torchscript",
+        "input_dim": input_dim,
+        "classes": [clf.preds_mapper[str(i)] for i in range(len(clf.preds_mapper))],
+        "quantized": bool(quantize),
+        "source": os.path.basename(model_path),
+        "source_sha256": _file_sha256(model_path),
+        "torch_version": torch.__version__,
+    }
+    with open(out_path + ".json", "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+class TorchScriptRunner:
+    """Drop-in predict()/predict_proba() for an exported TorchScript model"""
+
+    def __init__(self, path, num_threads=TORCH_THREADS, max_batch=RUNNER_MAX_BATCH):
+        import torch
+        self.torch = torch
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        with open(path + ".json", "r") as f:
+            self.meta = json.load(f)
+        self.module = torch.jit.load(path, map_location="cpu").eval()
+        self.classes = np.array(self.meta["classes"])
+        self.max_batch = max_batch
+        # One input buffer per thread: Flask / gthread call predict concurrently
+        self._local = threading.local()
+
+    def _buffer(self):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            buffer = self._local.buffer = self.torch.empty((self.max_batch, self.meta["input_dim"]),
+                                                           dtype=self.torch.float32)
+        return buffer
+
+    def predict_proba(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        out = np.empty((len(X), len(self.classes)), dtype=np.float32)
+        buffer = self._buffer()
+        with self.torch.inference_mode():
+            for start in range(0, len(X), self.max_batch):
+                n = min(self.max_batch, len(X) - start)
+                batch = buffer[:n]
+                batch.copy_(self.torch.from_numpy(X[start:start + n]))
+                out[start:start + n] = self.module(batch).numpy()
+        return out
+
+    def predict(self, X):
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def install_export(tmp_path, out_path):
+    """Move a checked export (model and its .json) into place"""
+    os.replace(tmp_path + ".json", out_path + ".json")
+    os.replace(tmp_path, out_path)
+
+
+def discard_export(tmp_path):
+    for path in (tmp_path, tmp_path + ".json"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def synthetic_features(n, input_dim, seed=0):
+    """Encoded feature rows shaped like the real inputs: mostly 0/1 flags
+    plus small integers, with some out-of-range values mixed in"""
+    rng = np.random.default_rng(seed)
+    X = rng.integers(0, 2, size=(n, input_dim)).astype(np.float32)
+    X[:, rng.integers(input_dim)] = rng.integers(0, 20, size=n)
+    noisy = rng.random((n, input_dim)) < 0.05
+    X[noisy] = rng.normal(0, 5, size=noisy.sum())
+    return X
+
+
+def check_parity(model_path, runner, n=20_000, seed=0):
+    """Fraction of synthetic rows where runner.predict agrees with TabNetClassifier"""
+    from pytorch_tabnet.tab_model import TabNetClassifier
+
+    clf = TabNetClassifier()
+    clf.load_model(model_path)
+    X = synthetic_features(n, clf.input_dim, seed)
+    expected = clf.predict(X)
+    actual = runner.predict(X)
+    proba_gap = float(np.abs(clf.predict_proba(X) - runner.predict_proba(X)).max())
+    return float(np.mean(expected == actual)), proba_gap
+
+
+if __name__ == "__main__":
+    import warnings
+
+    warnings.filterwarnings("ignore", category=FutureWarning)
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    warnings.filterwarnings("ignore", message="Converting a tensor to a Python integer")
+    parser = argparse.ArgumentParser(description="Export TabNet to TorchScript")
+    parser.add_argument("--model", default="TabnetRfHybrid.h5")
+    parser.add_argument("--out", default="TabnetRfHybrid.pt")
+    parser.add_argument("--quantize", action="store_true", help="dynamic int8 quantization of Linear layers")
+    parser.add_argument("--check", action="store_true", help="parity check against TabNetClassifier.predict")
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--min-agreement", type=float, default=None,
+                        help="required agreement (default 1.0, or 0.99 with --quantize)")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore", message="Device used")
+    # Export next to the target and only move it into place once it passed the check
+    tmp = f"{args.out}.{os.getpid()}.tmp"
+    try:
+        meta = export_torchscript(args.model, tmp, args.quantize)
+        if args.check:
+            runner = TorchScriptRunner(tmp)
+            agreement, gap = check_parity(args.model, runner, args.rows)
+            required = args.min_agreement if args.min_agreement is not None else (0.99 if args.quantize else 1.0)
+            print(f"📊 Agreement with TabNetClassifier.predict on {args.rows} rows: {agreement:.4%} "
+                  f"(max probability gap {gap:.2e})")
+
+            X = synthetic_features(1, meta["input_dim"])
+            calls = 1000
+            start = time.perf_counter()
+            for _ in range(calls):
+                runner.predict(X)
+            print(f"📊 Single-row predict: {(time.perf_counter() - start) / calls * 1000:.3f} ms/call")
+            if agreement < required:
+                print(f"❌ Parity check failed (required {required:.2%}); {args.out} not written")
+                raise SystemExit(1)
+            print("✅ Parity check passed")
+        install_export(tmp, args.out)
+    finally:
+        discard_export(tmp)
+    print(f"✅ Exported {args.model} → {args.out} (quantized={meta['quantized']})")
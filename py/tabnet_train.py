@@ -0,0 +1,607 @@
+"""Out-of-core retraining of the TabNet risk model (iepis-train).
+
+Produces what the service loads, a TabNet model plus the LabelEncoders for
+the categorical TABNET_FEATURE_COLUMNS, from a CSV or Parquet file of
+labelled control snapshots (one row per endpoint, a Low/Medium/High label
+column) that does not need to fit in memory:
+
+1. fit: one streaming pass over the chunks collects the distinct values of
+   every feature column. A column with any non-numeric value gets a
+   LabelEncoder; the others are encoded with ``float()``, as in
+   feature_encoder.py.
+2. encode: a second pass encodes the chunks on a process pool with
+   ``FeatureEncoder`` and writes each one as a shard, ``shard-000000.X.npy``
+   (float32) and ``.y.npy`` (RISK_LABELS index, int8).
+3. train: every epoch visits the shards in random order, memory-mapped, and
+   trains the TabNet network minibatch by minibatch on CPU, so only one
+   shard is resident at a time. Every ``1/--holdout``-th row is held out;
+   the weights of the best validation epoch are kept.
+4. publish: ``model.zip`` (TabNet save_model format), ``encoders.pkl`` and
+   ``report.json`` go to the output directory, and the model is published
+   as a new version of the model registry with the training report in its
+   manifest.
+
+    python tabnet_train.py fleet.parquet --label-column RiskLevel -o training/ --activate
+    python tabnet_train.py --synthetic 1000000 -o /tmp/iepis-train --epochs 3 --no-publish
+
+Shards are cached under ``<output>/cache/<key>/``, keyed by the input file
+(path, size, mtime) and the encoding options. Rerunning with the same input
+skips both passes and goes straight to training; an interrupted encode
+resumes with the shards that are done.
+
+``--synthetic N`` streams N generated rows whose label follows a fixed
+rule, so the pipeline runs offline. The report has the time, rows/s and
+peak memory of each stage. ``--check`` runs a small synthetic job end to
+end and loads the published version back through the registry.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import resource
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from feature_encoder import MISSING_VALUES, FeatureEncoder
+from model_registry import REGISTRY_DIR, ModelRegistry, memory_usage
+
+log = logging.getLogger("iepis.train")
+
+DEFAULT_CHUNK_ROWS = 50_000
+MAX_CATEGORIES = 10_000
+ENCODERS_FILE = "encoders.pkl"
+SUCCESS_FILE = "_SUCCESS"
+# Same as the shipped TabnetRfHybrid.h5, so a retrained model is a drop-in replacement
+TABNET_PARAMS = {
+    "n_d": 8, "n_a": 8, "n_steps": 3, "gamma": 1.3, "n_independent": 2, "n_shared": 2,
+    "lambda_sparse": 1e-3, "momentum": 0.02, "clip_value": 1, "mask_type": "sparsemax",
+    "optimizer_params": {"lr": 0.02}, "scheduler_params": {"step_size": 10, "gamma": 0.9},
+    "seed": 42, "device_name": "cpu", "verbose": 0,
+}
+
+_worker = {}
+
+
+# === Input ===
+def label_indices(values):
+    """Low/Medium/High (any case) -> RISK_LABELS index as int8; -1 for anything else"""
+    from ml_model_api import RISK_LABELS
+    lookup = {label.lower(): i for i, label in enumerate(RISK_LABELS)}
+    return np.fromiter((lookup.get(str(v).strip().lower(), -1) for v in values), dtype=np.int8, count=len(values))
+
+
+def file_chunks(path, columns, label_column, chunk_rows):
+    """Yield (columns, labels, n) from a CSV or Parquet file"""
+    from iepis_score import read_chunks
+    for chunk in read_chunks(path, list(columns) + [label_column], chunk_rows):
+        labels = chunk.pop(label_column, None)
+        if labels is None:
+            raise SystemExit(f"❌ Column '{label_column}' not found in {path}")
+        yield chunk, labels, len(labels)
+
+
+# Values per column, and how much each one adds to the latent risk of a synthetic row
+SYNTHETIC_VALUES = {
+    "SmartScreen": {"Enabled": 0, "Disabled": 1, "Missing": 0.5},
+    "TPM": {"Enabled": 0, "Disabled": 1.5},
+    "BitLocker": {"Enabled": 0, "Disabled": 2, "Unknown": 1},
+    "GuestUser": {"Disabled": 0, "Enabled": 1},
+    "PasswordLength": {"0": 2, "8": 1, "12": 0, "16": 0},
+    "FIPS": {"Enabled": 0, "Disabled": 0.5},
+    "UAC": {"Enabled": 0, "Disabled": 2},
+    "AutoPlay": {"Disabled": 0, "Enabled": 0.5},
+    "AVProductsInstalled": {0: 2, 1: 0, 2: 0},
+    "Census_IsSecureBootEnabled": {0: 1, 1: 0},
+    "Census_IsVirtualDevice": {0: 0, 1: 0.5},
+}
+
+
+def synthetic_chunks(rows, chunk_rows, seed=0):
+    """Yield (columns, labels, n) of generated snapshots; chunk i depends only on (seed, i)"""
+    from ml_model_api import RISK_LABELS
+    labels_table = np.array(RISK_LABELS, dtype=object)
+    for index, start in enumerate(range(0, rows, chunk_rows)):
+        n = min(chunk_rows, rows - start)
+        rng = np.random.default_rng([seed, index])
+        columns, risk = {}, rng.normal(0, 0.75, n)
+        for col, weights in SYNTHETIC_VALUES.items():
+            pick = rng.integers(0, len(weights), n)
+            columns[col] = np.array(list(weights), dtype=object)[pick].tolist()
+            risk += np.array(list(weights.values()))[pick]
+        yield columns, labels_table[np.digitize(risk, [4.5, 7.5])].tolist(), n
+
+
+def source_description(args):
+    if args.synthetic:
+        return {"synthetic": args.synthetic, "seed": args.seed}
+    stat = os.stat(args.input)
+    return {"input": os.path.abspath(args.input), "input_size": stat.st_size, "input_mtime": stat.st_mtime_ns,
+            "label_column": args.label_column}
+
+
+def source_chunks(args, columns):
+    if args.synthetic:
+        return synthetic_chunks(args.synthetic, args.chunk_rows, args.seed)
+    return file_chunks(args.input, columns, args.label_column, args.chunk_rows)
+
+
+# === Stage 1: fit the encoders ===
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+class EncoderFitter:
+    """Distinct values per feature column, collected chunk by chunk"""
+
+    def __init__(self, columns, categorical=(), max_categories=MAX_CATEGORIES):
+        self.columns = list(columns)
+        self.forced = set(categorical)
+        self.max_categories = max_categories
+        self.values = {col: set() for col in self.columns}  # None: too many values, numeric
+        self.text = set()  # columns with a non-numeric value
+        self.rows = 0
+
+    def update(self, columns, n):
+        self.rows += n
+        for col in self.columns:
+            if col not in columns:
+                continue
+            distinct = set(columns[col]).difference(MISSING_VALUES)
+            if col not in self.text and col not in self.forced and not all(_is_number(v) for v in distinct):
+                if self.values[col] is None:
+                    raise ValueError(f"column {col} turned non-numeric after more than {self.max_categories} "
+                                     f"numeric values; pass --categorical {col} to keep its classes")
+                self.text.add(col)
+            seen = self.values[col]
+            if seen is None:
+                continue
+            seen.update(distinct)
+            if len({str(v) for v in seen}) > self.max_categories:
+                if col in self.text or col in self.forced:
+                    raise ValueError(f"column {col} has more than {self.max_categories} categories")
+                self.values[col] = None
+
+    def encoders(self):
+        """{column: fitted LabelEncoder} for the categorical columns"""
+        from sklearn.preprocessing import LabelEncoder
+        return {col: LabelEncoder().fit(sorted({str(v) for v in self.values[col]}))
+                for col in self.columns if col in self.text or col in self.forced}
+
+
+# === Stage 2: encode into shards ===
+def shard_path(shard_dir, index, kind):
+    return os.path.join(shard_dir, f"shard-{index:06d}.{kind}.npy")
+
+
+def _save_atomic(path, array):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def _init_worker(encoders_path, columns):
+    """Compile the encoders once per worker process"""
+    import warnings
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent decides what happens on Ctrl+C
+    warnings.filterwarnings("ignore")
+    _worker["encoder"] = FeatureEncoder.from_file(encoders_path, columns)
+
+
+def _encode_shard(index, columns, labels, n, shard_dir):
+    """Worker task: encode a chunk and write its shard; y is written last and marks it complete"""
+    started = time.perf_counter()
+    X = _worker["encoder"].encode_columns(columns, n)
+    y = label_indices(labels)
+    keep = y >= 0
+    _save_atomic(shard_path(shard_dir, index, "X"), np.ascontiguousarray(X[keep]))
+    _save_atomic(shard_path(shard_dir, index, "y"), y[keep])
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return index, int(keep.sum()), int(n - keep.sum()), time.perf_counter() - started, peak
+
+
+def finished_shards(shard_dir):
+    return {int(name[6:12]) for name in os.listdir(shard_dir)
+            if name.startswith("shard-") and name.endswith(".y.npy")}
+
+
+def encode_shards(chunks, shard_dir, columns, workers, progress):
+    """Encode every chunk not already in shard_dir; returns (encoded rows, dropped rows, worker peak RSS)"""
+    encoders_path = os.path.join(shard_dir, ENCODERS_FILE)
+    done = finished_shards(shard_dir)
+    encoded = dropped = worker_peak = 0
+    started = last_report = time.perf_counter()
+    pending = set()
+
+    def collect():
+        nonlocal encoded, dropped, worker_peak, last_report
+        finished, still_pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in finished:
+            _, kept, bad, _, peak = future.result()
+            encoded, dropped, worker_peak = encoded + kept, dropped + bad, max(worker_peak, peak)
+        now = time.perf_counter()
+        if now - last_report >= progress:
+            last_report = now
+            log.info("⏳ %s rows encoded, %s rows/s", f"{encoded:,}", f"{encoded / (now - started):,.0f}")
+        return still_pending
+
+    pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(encoders_path, columns))
+    try:
+        for index, (chunk, labels, n) in enumerate(chunks):
+            if index in done:
+                continue
+            pending.add(pool.submit(_encode_shard, index, chunk, labels, n, shard_dir))
+            # Keep a bounded number of chunks in flight so memory stays flat
+            while len(pending) >= 2 * workers:
+                pending = collect()
+        while pending:
+            pending = collect()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    if done:
+        log.info("♻️ Reused %d shards from an earlier run", len(done))
+    return encoded, dropped, worker_peak
+
+
+# === Stage 3: train ===
+class Shard:
+    """One memory-mapped shard; rows whose global index is a multiple of holdout_every are held out"""
+
+    def __init__(self, shard_dir, index, start, holdout_every):
+        self.X = np.load(shard_path(shard_dir, index, "X"), mmap_mode="r")
+        self.y = np.load(shard_path(shard_dir, index, "y"), mmap_mode="r")
+        held_out = np.zeros(len(self.y), dtype=bool)
+        if holdout_every:
+            held_out[-start % holdout_every::holdout_every] = True
+        self.train_rows = np.flatnonzero(~held_out)
+        self.val_rows = np.flatnonzero(held_out)
+
+    def rows(self, which):
+        idx = self.train_rows if which == "train" else self.val_rows
+        return self.X[idx], self.y[idx].astype(np.int64)
+
+
+def load_shards(shard_dir, holdout_every):
+    shards, start = [], 0
+    for index in sorted(finished_shards(shard_dir)):
+        shard = Shard(shard_dir, index, start, holdout_every)
+        if len(shard.y):
+            shards.append(shard)
+        start += len(shard.y)
+    return shards
+
+
+def evaluate(network, shards, n_classes, batch_size=8192):
+    """Confusion matrix (true x predicted) over the held-out rows"""
+    import torch
+    confusion = np.zeros((n_classes, n_classes), dtype=np.int64)
+    network.eval()
+    with torch.no_grad():
+        for shard in shards:
+            X, y = shard.rows("val")
+            for start in range(0, len(y), batch_size):
+                output, _ = network(torch.from_numpy(X[start:start + batch_size]))
+                pred = output.argmax(dim=1).numpy()
+                confusion += np.bincount(y[start:start + batch_size] * n_classes + pred,
+                                         minlength=n_classes * n_classes).reshape(n_classes, n_classes)
+    network.train()
+    return confusion
+
+
+def train(shards, input_dim, epochs, batch_size, patience, seed):
+    """Minibatch training over the shards; returns (TabNetClassifier, history)"""
+    import torch
+    from pytorch_tabnet.tab_model import TabNetClassifier
+
+    from ml_model_api import RISK_LABELS
+
+    n_classes = len(RISK_LABELS)
+    clf = TabNetClassifier(**dict(TABNET_PARAMS, seed=seed), input_dim=input_dim, output_dim=n_classes)
+    clf._set_network()
+    clf.load_class_attrs({"preds_mapper": {str(i): i for i in range(n_classes)}})
+    network = clf.network
+    optimizer = torch.optim.Adam(network.parameters(), **clf.optimizer_params)
+    scheduler = torch.optim.lr_scheduler.StepLR(optimizer, **clf.scheduler_params)
+    rng = np.random.default_rng(seed)
+    has_val = any(len(s.val_rows) for s in shards)
+    history, best, best_accuracy, stale = [], None, -1.0, 0
+
+    network.train()
+    for epoch in range(1, epochs + 1):
+        started = time.perf_counter()
+        loss_sum, seen = 0.0, 0
+        for i in rng.permutation(len(shards)):
+            X, y = shards[i].rows("train")  # this shard only
+            order = rng.permutation(len(y))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                if len(batch) < 2:
+                    continue  # batch norm needs two rows
+                for param in network.parameters():
+                    param.grad = None
+                output, m_loss = network(torch.from_numpy(X[batch]))
+                loss = torch.nn.functional.cross_entropy(output, torch.from_numpy(y[batch]))
+                loss = loss - clf.lambda_sparse * m_loss
+                loss.backward()
+                if clf.clip_value:
+                    torch.nn.utils.clip_grad_norm_(network.parameters(), clf.clip_value)
+                optimizer.step()
+                loss_sum += loss.item() * len(batch)
+                seen += len(batch)
+        scheduler.step()
+
+        entry = {"epoch": epoch, "loss": round(loss_sum / max(seen, 1), 5),
+                 "seconds": round(time.perf_counter() - started, 3)}
+        if has_val:
+            confusion = evaluate(network, shards, n_classes)
+            entry["val_accuracy"] = round(float(np.trace(confusion) / confusion.sum()), 5)
+            entry["confusion"] = confusion.tolist()
+        history.append(entry)
+        log.info("🏋️ Epoch %d/%d: loss %.4f%s, %.1fs (%s rows/s)", epoch, epochs, entry["loss"],
+                 f", val accuracy {entry['val_accuracy']:.4f}" if has_val else "", entry["seconds"],
+                 f"{seen / entry['seconds']:,.0f}" if entry["seconds"] else "-")
+
+        if not has_val:
+            continue
+        if entry["val_accuracy"] > best_accuracy:
+            best_accuracy, stale = entry["val_accuracy"], 0
+            best = {k: v.detach().clone() for k, v in network.state_dict().items()}
+        else:
+            stale += 1
+            if patience and stale >= patience:
+                log.info("⏹️ No improvement for %d epochs, stopping", stale)
+                break
+
+    if best is not None:
+        network.load_state_dict(best)
+    network.eval()
+    return clf, history
+
+
+# === Job ===
+def peak_rss():
+    """Peak resident set size in bytes of this process and of its (finished) children"""
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024)
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, name, started, **extra):
+        peak, children = peak_rss()
+        self.stages[name] = {"seconds": round(time.perf_counter() - started, 3), **extra,
+                             "rss_bytes": memory_usage().get("rss"),
+                             "peak_rss_bytes": peak, "peak_worker_rss_bytes": children}
+        return self.stages[name]
+
+
+def cache_key(args, columns):
+    doc = {"source": source_description(args), "columns": list(columns), "chunk_rows": args.chunk_rows,
+           "categorical": sorted(args.categorical), "max_categories": args.max_categories}
+    return hashlib.sha256(json.dumps(doc, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def prepare_shards(args, columns, timer):
+    """Run the fit and encode passes unless the cache already has them; returns the shard directory"""
+    import joblib
+    key = cache_key(args, columns)
+    shard_dir = os.path.join(args.cache_dir or os.path.join(args.output, "cache"), key)
+    os.makedirs(shard_dir, exist_ok=True)
+    if os.path.exists(os.path.join(shard_dir, SUCCESS_FILE)):
+        log.info("♻️ Using cached shards in %s", shard_dir)
+        return shard_dir
+
+    encoders_path = os.path.join(shard_dir, ENCODERS_FILE)
+    if not os.path.exists(encoders_path):
+        started = time.perf_counter()
+        fitter = EncoderFitter(columns, args.categorical, args.max_categories)
+        for chunk, _, n in source_chunks(args, columns):
+            fitter.update(chunk, n)
+        if not fitter.rows:
+            raise SystemExit("❌ No rows in the input")
+        encoders = fitter.encoders()
+        tmp = f"{encoders_path}.{os.getpid()}.tmp"
+        joblib.dump(encoders, tmp)
+        os.replace(tmp, encoders_path)
+        stage = timer.record("fit", started, rows=fitter.rows,
+                             rows_per_s=round(fitter.rows / (time.perf_counter() - started)))
+        log.info("🔤 Fitted encoders on %s rows in %.1fs: %s categorical, %s numeric",
+                 f"{fitter.rows:,}", stage["seconds"], ", ".join(encoders) or "none",
+                 ", ".join(c for c in columns if c not in encoders) or "none")
+
+    started = time.perf_counter()
+    log.info("📦 Encoding shards with %d workers, %d rows per chunk", args.workers, args.chunk_rows)
+    encoded, dropped, worker_peak = encode_shards(source_chunks(args, columns), shard_dir, columns,
+                                                  args.workers, args.progress)
+    elapsed = time.perf_counter() - started
+    stage = timer.record("encode", started, rows=encoded, dropped=dropped, workers=args.workers,
+                         rows_per_s=round(encoded / elapsed) if elapsed else None,
+                         peak_task_rss_bytes=worker_peak)
+    if dropped:
+        log.warning("⚠️ Dropped %s rows without a Low/Medium/High label", f"{dropped:,}")
+    log.info("📦 Encoded %s rows in %.1fs", f"{encoded:,}", stage["seconds"])
+    with open(os.path.join(shard_dir, SUCCESS_FILE), "w") as f:
+        json.dump({"key": key, "source": source_description(args), "encoded": encoded, "dropped": dropped}, f,
+                  indent=2)
+    return shard_dir
+
+
+def run(args):
+    """The whole pipeline; returns the report"""
+    import joblib
+    import torch
+
+    from ml_model_api import RISK_LABELS, TABNET_FEATURE_COLUMNS
+
+    columns = list(TABNET_FEATURE_COLUMNS)
+    os.makedirs(args.output, exist_ok=True)
+    timer = StageTimer()
+    job_started = time.perf_counter()
+    shard_dir = prepare_shards(args, columns, timer)
+
+    started = time.perf_counter()
+    torch.set_num_threads(args.threads)
+    holdout_every = round(1 / args.holdout) if args.holdout > 0 else 0
+    shards = load_shards(shard_dir, holdout_every)
+    if not shards:
+        raise SystemExit("❌ No labelled rows to train on")
+    train_rows = sum(len(s.train_rows) for s in shards)
+    val_rows = sum(len(s.val_rows) for s in shards)
+    label_counts = sum(np.bincount(s.y, minlength=len(RISK_LABELS)) for s in shards)
+    log.info("🏋️ Training on %s rows (%s held out) from %d shards, %d epochs",
+             f"{train_rows:,}", f"{val_rows:,}", len(shards), args.epochs)
+    clf, history = train(shards, len(columns), args.epochs, args.batch_size, args.patience, args.seed)
+    epochs_run = len(history)
+    stage = timer.record("train", started, epochs=epochs_run, train_rows=train_rows, val_rows=val_rows,
+                         rows_per_s=round(train_rows * epochs_run / (time.perf_counter() - started)))
+    log.info("🏋️ Trained in %.1fs", stage["seconds"])
+
+    started = time.perf_counter()
+    model_path = clf.save_model(os.path.join(args.output, "model"))
+    encoders_path = os.path.join(args.output, ENCODERS_FILE)
+    shutil.copyfile(os.path.join(shard_dir, ENCODERS_FILE), encoders_path)
+    encoders = joblib.load(encoders_path)
+    best = max(history, key=lambda e: e.get("val_accuracy", -1))
+    report = {
+        "source": source_description(args),
+        "shards": shard_dir,
+        "rows": train_rows + val_rows,
+        "train_rows": train_rows,
+        "val_rows": val_rows,
+        "label_counts": dict(zip(RISK_LABELS, label_counts.tolist())),
+        "categorical": {col: [str(c) for c in enc.classes_] for col, enc in encoders.items()},
+        "params": {"epochs": args.epochs, "batch_size": args.batch_size, "seed": args.seed,
+                   "holdout": args.holdout, "patience": args.patience, "threads": args.threads},
+        "val_accuracy": best.get("val_accuracy"),
+        "best_epoch": best["epoch"] if "val_accuracy" in best else epochs_run,
+        "history": history,
+    }
+    version = None
+    if not args.no_publish:
+        version = ModelRegistry(args.registry).publish(
+            model_path, encoders_path, args.version, args.activate,
+            training={k: v for k, v in report.items() if k not in ("shards", "history")}
+        )
+        log.info("✅ Published %s to %s%s", version, args.registry, " (active)" if args.activate else "")
+    timer.record("publish", started, version=version)
+
+    report["version"] = version
+    report["stages"] = timer.stages
+    report["seconds"] = round(time.perf_counter() - job_started, 3)
+    report["peak_rss_bytes"], report["peak_worker_rss_bytes"] = peak_rss()
+    with open(os.path.join(args.output, "report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    return report
+
+
+def print_report(report):
+    print(f"{'stage':<9}{'seconds':>9}{'rows/s':>12}{'peak RSS MB':>13}{'worker MB':>11}")
+    for name, stage in report["stages"].items():
+        rate = f"{stage['rows_per_s']:,}" if stage.get("rows_per_s") else "-"
+        print(f"{name:<9}{stage['seconds']:>9.2f}{rate:>12}{stage['peak_rss_bytes'] / 2**20:>13.0f}"
+              f"{stage['peak_worker_rss_bytes'] / 2**20:>11.0f}")
+    accuracy = report["val_accuracy"]
+    print(f"📊 {report['rows']:,} rows, labels {report['label_counts']}, "
+          f"val accuracy {accuracy if accuracy is not None else '-'} (epoch {report['best_epoch']}), "
+          f"{report['seconds']:.1f}s total")
+
+
+# === Self-check ===
+def run_check(rows=60_000, chunk_rows=10_000):
+    """Synthetic job end to end: learns the rule, reuses the cache, loads back from the registry"""
+    from ml_model_api import TABNET_FEATURE_COLUMNS
+
+    workdir = tempfile.mkdtemp(prefix="iepis-train-")
+    argv = ["--synthetic", str(rows), "--chunk-rows", str(chunk_rows), "-o", os.path.join(workdir, "out"),
+            "--registry", os.path.join(workdir, "models"), "--epochs", "4", "--workers", "2", "--activate"]
+    try:
+        report = run(parse_args(argv))
+        chance = max(report["label_counts"].values()) / report["rows"]
+        ok = report["val_accuracy"] > chance + 0.1
+        print(f"{'✅' if ok else '❌'} Validation accuracy {report['val_accuracy']:.3f} vs {chance:.3f} "
+              f"for the majority class")
+
+        clf, encoders, manifest = ModelRegistry(os.path.join(workdir, "models")).load()
+        columns, labels, n = next(synthetic_chunks(2000, 2000, seed=99))
+        X = FeatureEncoder(TABNET_FEATURE_COLUMNS, encoders).encode_columns(columns, n)
+        registry_pred = clf.predict(X)
+        saved = type(clf)()
+        saved.load_model(os.path.join(workdir, "out", "model.zip"))
+        same = np.array_equal(registry_pred, saved.predict(X)) and manifest["training"]["rows"] == report["rows"]
+        print(f"{'✅' if same else '❌'} Registry version {manifest['version']} predicts like model.zip")
+        ok = ok and same
+
+        again = run(parse_args(argv + ["--epochs", "1", "--version", "again"]))
+        cached = "fit" not in again["stages"] and "encode" not in again["stages"]
+        print(f"{'✅' if cached else '❌'} Second run reused the cached shards")
+        return ok and cached
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Retrain the TabNet risk model from labelled control snapshots")
+    parser.add_argument("input", nargs="?", help="CSV or Parquet file")
+    parser.add_argument("--synthetic", type=int, metavar="ROWS", help="train on ROWS generated rows instead")
+    parser.add_argument("-o", "--output", default="training", help="output directory")
+    parser.add_argument("--label-column", default="RiskLevel", help="column with Low/Medium/High")
+    parser.add_argument("--categorical", nargs="*", default=[], help="always give these columns a LabelEncoder")
+    parser.add_argument("--max-categories", type=int, default=MAX_CATEGORIES)
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="rows per chunk and shard")
+    parser.add_argument("--cache-dir", help="shard cache (default: <output>/cache)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="encoding processes")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="torch threads for training")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--holdout", type=float, default=0.1, help="fraction of rows held out for validation")
+    parser.add_argument("--patience", type=int, default=3, help="stop after this many epochs without improvement")
+    parser.add_argument("--seed", type=int, default=TABNET_PARAMS["seed"])
+    parser.add_argument("--registry", default=REGISTRY_DIR)
+    parser.add_argument("--version", help="registry version name (default: next vN)")
+    parser.add_argument("--activate", action="store_true", help="make the new version current")
+    parser.add_argument("--no-publish", action="store_true", help="only write the output directory")
+    parser.add_argument("--progress", type=float, default=5.0, help="seconds between progress lines")
+    parser.add_argument("--check", action="store_true", help="run a small synthetic job end to end")
+    args = parser.parse_args(argv)
+    if not args.check and not args.input and not args.synthetic:
+        parser.error("an input file or --synthetic ROWS is required")
+    return args
+
+
+def main(argv=None):
+    import warnings
+
+    from log_config import setup_logging
+
+    warnings.filterwarnings("ignore")
+    setup_logging()
+    args = parse_args(argv)
+    if args.check:
+        return 0 if run_check() else 1
+    try:
+        run(args)
+    except KeyboardInterrupt:
+        log.warning("⚠️ Interrupted; run the same command again to resume from the finished shards")
+        return 130
+    except ValueError as e:
+        log.error("❌ %s", e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,22 @@
+from collectors import PROBES, FixtureBackend, collect_controls
+
+PS_PROBES = [p for p in PROBES if p.kind == "powershell"]
+
+
+def test_empty_powershell_output_falls_back_to_the_default():
+    outputs = {p.source: "" for p in PS_PROBES}
+    outputs["(Get-Tpm).TpmPresent"] = "  \r\n"
+    result = collect_controls(FixtureBackend(powershell=outputs), PS_PROBES)
+    assert result.values == {p.name: p.default for p in PS_PROBES}
+    assert result.values["TPM"] == "Unknown"
+    assert set(result.errors) == {p.name for p in PS_PROBES}
+
+
+def test_failed_and_answered_powershell_probes():
+    outputs = {"(Get-Tpm).TpmPresent": "False", "Confirm-SecureBootUEFI": "True"}
+    result = collect_controls(FixtureBackend(powershell=outputs), PS_PROBES)
+    assert result.values["TPM"] == "Disabled"
+    assert result.values["Census_IsSecureBootEnabled"] == 1
+    assert result.values["AVProductsInstalled"] == 0
+    assert result.errors["AVProductsInstalled"] == "PowerShell expression failed"
+    assert "TPM" not in result.errors
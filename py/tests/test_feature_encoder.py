@@ -0,0 +1,72 @@
+import os
+import warnings
+
+import numpy as np
+import pytest
+from sklearn.preprocessing import LabelEncoder
+
+from feature_encoder import CHECK_VALUES, FeatureEncoder, random_snapshots, reference_encode
+
+PY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _encoders():
+    classes = {
+        "SmartScreen": ["Enabled", "Disabled", "On"],
+        "BitLocker": ["0", "1", "12", "True", "[1]"],
+        "UAC": ["Enabled", "Disabled", "nan", "None"],
+    }
+    return {col: LabelEncoder().fit(values) for col, values in classes.items()}
+
+
+COLUMNS = ["SmartScreen", "BitLocker", "UAC", "PasswordLength", "LockoutThreshold"]
+
+
+def _reference(snapshots, columns, encoders):
+    return np.array([reference_encode(d, columns, encoders) for d in snapshots], dtype=np.float32)
+
+
+def test_encode_matches_reference_on_mixed_values():
+    encoders = _encoders()
+    snapshots = random_snapshots(COLUMNS, 2000, seed=1)
+    actual = FeatureEncoder(COLUMNS, encoders).encode(snapshots)
+    np.testing.assert_array_equal(actual, _reference(snapshots, COLUMNS, encoders))
+
+
+def test_every_value_in_every_column():
+    encoders = _encoders()
+    snapshots = [{col: value for col in COLUMNS} for value in CHECK_VALUES] + [{}]
+    actual = FeatureEncoder(COLUMNS, encoders).encode(snapshots)
+    np.testing.assert_array_equal(actual, _reference(snapshots, COLUMNS, encoders))
+
+
+def test_encode_matches_reference_with_shipped_encoders():
+    path = os.path.join(PY_DIR, "tabnet_encoders.pkl")
+    if not os.path.exists(path):
+        pytest.skip("tabnet_encoders.pkl not present")
+    import joblib
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        encoders = joblib.load(path)
+    columns = list(encoders) + ["PasswordLength"]
+    snapshots = random_snapshots(columns, 1000, seed=2)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected = _reference(snapshots, columns, encoders)
+    np.testing.assert_array_equal(FeatureEncoder(columns, encoders).encode(snapshots), expected)
+
+
+def test_fallbacks_are_counted_per_occurrence():
+    encoder = FeatureEncoder(COLUMNS, _encoders())
+    encoder.encode([{"SmartScreen": "Off", "PasswordLength": "abc"},
+                    {"SmartScreen": "Off", "PasswordLength": [1]},
+                    {"SmartScreen": "Missing", "PasswordLength": "8"}])
+    assert encoder.fallbacks == {"SmartScreen": 2, "PasswordLength": 2}
+
+
+def test_numeric_array_columns():
+    encoder = FeatureEncoder(COLUMNS, _encoders())
+    values = np.array([8, 0, 14])
+    X = encoder.encode_columns({"PasswordLength": values}, 3)
+    np.testing.assert_array_equal(X[:, COLUMNS.index("PasswordLength")], [8.0, 0.0, 14.0])
+    assert not X[:, :3].any()
@@ -0,0 +1,138 @@
+import pytest
+
+from fleet_rollup import TIERS, FleetRollup, compare, simulate
+
+CONTROLS = ["UAC", "BitLocker", "Firewall", "SmartScreen", "GuestUser"]
+
+
+def _result(host, tier="Low", ml="Low", score=90, mismatches=()):
+    return {"host": host, "system_risk": tier, "ml_risk": ml, "final_score": score,
+            "mismatches": [{"setting": c} for c in mismatches]}
+
+
+def test_rollup_matches_brute_force():
+    rollup, latest, arrivals = simulate(CONTROLS, hosts=300, batches=25, batch_size=200, seed=3)
+    assert compare(rollup, latest, arrivals, skipped=25) == []
+    assert rollup.results == len(arrivals)
+
+
+def test_host_repeated_in_a_batch_counts_its_last_result():
+    rollup = FleetRollup(CONTROLS, bucket_seconds=60, buckets=4)
+    first = _result("PC-1", "High", "High", 40, ["UAC", "BitLocker"])
+    second = _result("PC-1", "Low", "Medium", 95)
+    other = _result("PC-2", "Medium", "Low", 70, ["Firewall"])
+    rollup.add([first, other, second], at=0)
+
+    latest = {"PC-1": second, "PC-2": other}
+    arrivals = [(0, first), (0, other), (0, second)]
+    assert compare(rollup, latest, arrivals, skipped=0) == []
+    assert rollup.host_count() == 2
+    assert rollup.trend()[0]["results"] == 3
+
+
+def test_batches_replace_earlier_results():
+    rollup = FleetRollup(CONTROLS, bucket_seconds=60, buckets=4)
+    rollup.add([_result("PC-1", "High", mismatches=["UAC"]), _result("PC-2")], at=0)
+    newer = _result("PC-1", "Medium", score=80)
+    rollup.add([newer], at=90)
+    summary = rollup.summary(last=None)
+    assert summary["hosts_by_tier"] == {"Low": 1, "Medium": 1, "High": 0}
+    assert summary["mismatch_rates"]["UAC"] == 0.0
+    assert [row["results"] for row in summary["trend"]] == [2, 1]
+
+
+@pytest.mark.parametrize("bad", [
+    {"host": None},
+    {"host": ""},
+    {"host": ["PC-1"]},
+    {"system_risk": "Critical"},
+    {"ml_risk": None},
+])
+def test_bad_results_are_skipped(bad):
+    rollup = FleetRollup(CONTROLS)
+    good = _result("PC-1")
+    batch = [good, dict(_result("PC-2"), **bad), "not a dict", {"error": "Scoring failed"}]
+    assert rollup.add(batch, at=0) == 1
+    assert rollup.host_count() == 1
+    assert compare(rollup, {"PC-1": good}, [(0, good)], skipped=3) == []
+
+
+def test_update_rollup_keeps_named_hosts_and_never_raises():
+    from ml_model_api import update_rollup
+
+    rollup = FleetRollup(CONTROLS)
+    snapshots = [{"host": "PC-1"}, {"UAC": "Enabled"}, None, {"host": "PC-3"}]
+    results = [_result("PC-1"), _result("host-1"), _result("host-2"), {"host": "PC-3", "error": "Scoring failed"}]
+    update_rollup(rollup, snapshots, results)
+    assert list(rollup.slots) == ["PC-1"]
+    assert rollup.skipped == 1
+
+    update_rollup(rollup, [{"host": "PC-4"}], [_result("PC-4", mismatches=["NotAControl"]) | {"final_score": "x"}])
+    assert rollup.host_count() == 1
+
+
+def test_trend_last_keeps_at_least_one_bucket():
+    rollup = FleetRollup(CONTROLS, bucket_seconds=60, buckets=8)
+    for minute in range(5):
+        rollup.add([_result(f"PC-{minute}")], at=minute * 60)
+    assert len(rollup.trend()) == 5
+    assert len(rollup.trend(None)) == 5
+    assert [row["start"] for row in rollup.trend(2)] == [180, 240]
+    assert [row["start"] for row in rollup.trend(0)] == [240]
+    assert [row["start"] for row in rollup.trend(-3)] == [240]
+    assert len(rollup.trend(100)) == 5
+
+
+@pytest.fixture
+def client():
+    from ml_model_api import create_app
+
+    app = create_app({"MODEL_LOAD": "lazy", "BACKGROUND_EVAL": False})
+    app.extensions["iepis_rollup"].add([_result("PC-1", mismatches=["UAC"])])
+    return app.test_client()
+
+
+@pytest.mark.parametrize("last", ["0", "-1"])
+def test_endpoint_rejects_last_below_one(client, last):
+    response = client.get(f"/api/fleet/rollup?last={last}")
+    assert response.status_code == 400
+    assert "last" in response.get_json()["detail"]
+
+
+def test_endpoint_summary(client):
+    body = client.get("/api/fleet/rollup?last=1").get_json()
+    assert body["hosts"] == 1 and len(body["trend"]) == 1
+    assert client.get("/api/fleet/rollup?tier=Low").get_json()["hosts"] == 1
+    assert client.get("/api/fleet/rollup?tier=Critical").status_code == 400
+
+
+@pytest.fixture
+def asgi_client():
+    pytest.importorskip("starlette")
+    pytest.importorskip("httpx")
+    from starlette.testclient import TestClient
+
+    from asgi_app import create_asgi_app
+
+    app = create_asgi_app({"MODEL_LOAD": "lazy"})
+    app.state.service.rollup.add([_result("PC-1", mismatches=["UAC"])])
+    return TestClient(app)  # no lifespan: the rollup route needs no model
+
+
+@pytest.mark.parametrize("last", ["0", "-1"])
+def test_asgi_endpoint_rejects_last_below_one(asgi_client, last):
+    response = asgi_client.get(f"/api/fleet/rollup?last={last}")
+    assert response.status_code == 400
+    assert "last" in response.json()["detail"]
+
+
+def test_asgi_endpoint_matches_flask(client, asgi_client):
+    for query in ("last=1", "last=abc", "tier=Low", "tier=Critical"):
+        flask_response = client.get(f"/api/fleet/rollup?{query}")
+        asgi_response = asgi_client.get(f"/api/fleet/rollup?{query}")
+        assert asgi_response.status_code == flask_response.status_code
+        flask_body, asgi_body = flask_response.get_json(), asgi_response.json()
+        for body in (flask_body, asgi_body):
+            for row in body.get("trend", ()):
+                row.pop("start")  # each app's rollup was filled at its own time
+        assert asgi_body == flask_body
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pyarrow")
+import pandas as pd  # noqa: E402
+
+from iepis_score import read_chunks  # noqa: E402
+
+
+def test_parquet_floats_with_nulls_read_like_json_numbers(tmp_path):
+    path = str(tmp_path / "controls.parquet")
+    pd.DataFrame({
+        "Firewall": [1.0, np.nan, 0.0, 2.5],
+        "UAC": ["Enabled", None, "Disabled", "Enabled"],
+        "Ignored": [1, 2, 3, 4],
+    }).to_parquet(path)
+
+    chunks = list(read_chunks(path, ["Firewall", "UAC", "BitLocker"], chunk_rows=3))
+    assert chunks == [
+        {"Firewall": [1, "Missing", 0], "UAC": ["Enabled", "Missing", "Disabled"]},
+        {"Firewall": [2.5], "UAC": ["Enabled"]},
+    ]
+    assert all(type(v) is int for v in chunks[0]["Firewall"][::2])
+
+
+def test_csv_values_stay_strings(tmp_path):
+    path = str(tmp_path / "controls.csv")
+    with open(path, "w") as f:
+        f.write("Firewall,UAC\n1,Enabled\n,Disabled\n1.0,\n")
+    assert list(read_chunks(path, ["Firewall", "UAC"], chunk_rows=10)) == [
+        {"Firewall": ["1", "Missing", "1.0"], "UAC": ["Enabled", "Disabled", "Missing"]},
+    ]
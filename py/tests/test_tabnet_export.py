@@ -0,0 +1,73 @@
+import warnings
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("pytorch_tabnet")
+
+from pytorch_tabnet.tab_model import TabNetClassifier  # noqa: E402
+
+from tabnet_export import TorchScriptRunner, check_parity, export_torchscript, synthetic_features  # noqa: E402
+
+# fp32 exports must match TabNetClassifier exactly. int8 dynamic quantization
+# is accepted when >= 99% of predictions agree (the CLI's --quantize default)
+# and >= 95% of rows keep their probabilities within 0.05; rows with large
+# out-of-range inputs can move further.
+FP32_MAX_PROBA_GAP = 1e-5
+QUANTIZED_MIN_AGREEMENT = 0.99
+QUANTIZED_PROBA_TOLERANCE = 0.05
+QUANTIZED_MIN_WITHIN_TOLERANCE = 0.95
+
+
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory):
+    X = synthetic_features(4000, 12, seed=1)
+    y = ((X[:, 0] + X[:, 3] - X[:, 7]) > 0.5).astype(int)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        clf = TabNetClassifier(n_d=8, n_a=8, n_steps=3, seed=0, verbose=0)
+        clf.fit(X, y, max_epochs=20, batch_size=256, virtual_batch_size=128)
+        path = clf.save_model(str(tmp_path_factory.mktemp("tabnet") / "model"))
+    assert (clf.predict(X) == y).mean() > 0.95
+    return path
+
+
+def _export(model_path, tmp_path, quantize):
+    out = str(tmp_path / "model.pt")
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        meta = export_torchscript(model_path, out, quantize)
+    return meta, TorchScriptRunner(out)
+
+
+def test_fp32_export_matches_tabnet(model_path, tmp_path):
+    meta, runner = _export(model_path, tmp_path, quantize=False)
+    assert meta["input_dim"] == 12 and not meta["quantized"]
+    agreement, gap = check_parity(model_path, runner, n=5000)
+    assert agreement == 1.0
+    assert gap < FP32_MAX_PROBA_GAP
+
+
+def test_quantized_export_within_tolerance(model_path, tmp_path):
+    meta, runner = _export(model_path, tmp_path, quantize=True)
+    assert meta["quantized"]
+    agreement, _ = check_parity(model_path, runner, n=5000)
+    assert agreement >= QUANTIZED_MIN_AGREEMENT
+
+    clf = TabNetClassifier()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        clf.load_model(model_path)
+    X = synthetic_features(5000, 12, seed=0)
+    gap = np.abs(clf.predict_proba(X) - runner.predict_proba(X)).max(axis=1)
+    assert np.mean(gap <= QUANTIZED_PROBA_TOLERANCE) >= QUANTIZED_MIN_WITHIN_TOLERANCE
+
+
+def test_runner_batches_and_single_rows_agree(model_path, tmp_path):
+    _, runner = _export(model_path, tmp_path, quantize=False)
+    X = synthetic_features(300, 12, seed=3)
+    batch = runner.predict_proba(X)
+    rows = np.vstack([runner.predict_proba(X[i:i + 1]) for i in range(len(X))])
+    np.testing.assert_allclose(batch, rows, atol=1e-4)
+    np.testing.assert_array_equal(runner.predict(X), batch.argmax(axis=1))